@@ -0,0 +1,74 @@
+#!/usr/local/bin/python
+'''
+Renders a generated calendar heavy tree, every task dated and with an
+OmniFocus style xml note, as ics to /dev/null. Once the way the exporter
+used to (a mktime per date, every note decoded, dated projects prepared
+twice) and once as it is now.
+
+Run from the project root:
+    OFEXPORT_HOME=`pwd` PYTHONPATH=src/main/python python build-scripts/benchmark_ics.py
+'''
+import sys
+import time
+from datetime import datetime, timedelta
+from treemodel import Folder, Project, Task
+from omnifocus import OFNote
+from fmt_template import format_document
+from of_to_ics import PrintCalendarVisitor, fix_dates, load_note_attribs, utc
+from output_sink import file_sink
+from benchmark_output import load_template
+
+FOLDERS = 20
+PROJECTS = 25
+TASKS = 40
+NOTE = '<text><p><run><lit>%s</lit></run></p><p><run><lit>call back about item %s</lit></run></p></text>'
+
+class DecodingNote (OFNote):
+    def may_contain (self, text):
+        return True
+
+class OldCalendarVisitor (PrintCalendarVisitor):
+    def __init__ (self, out, template):
+        PrintCalendarVisitor.__init__(self, out, template)
+        self.utc = utc
+    def begin_project (self, project):
+        fix_dates(project)
+        load_note_attribs (project)
+        PrintCalendarVisitor.begin_project(self, project)
+
+def build_tree (note_class):
+    root = Folder (name=u'root')
+    start = datetime (2013, 1, 1, 9, 0)
+    n = 0
+    for f in range (FOLDERS):
+        folder = Folder (name=u'folder ' + str (f), parent=root)
+        for p in range (PROJECTS):
+            project = Project (name=u'project ' + str (p), parent=folder, date_due=start + timedelta (days=p * 7))
+            for t in range (TASKS):
+                n += 1
+                # Spread over two years, one in twenty with a cal directive
+                task = Task (name=u'task ' + str (n), parent=project,
+                             date_to_start=start + timedelta (days=n % 730, minutes=15 * (n % 40)))
+                task.note = note_class (task, NOTE % ('%of cal due=17:30' if n % 20 == 0 else 'notes', n))
+    return root
+
+def render (visitor_class, note_class, template, repeats=3):
+    best = None
+    for i in range (repeats):
+        root = build_tree (note_class)
+        out = file_sink ('/dev/null')
+        start = time.time ()
+        format_document (root, visitor_class (out, template), True)
+        out.close ()
+        elapsed = time.time () - start
+        best = elapsed if best == None else min (best, elapsed)
+    return best
+
+if __name__ == "__main__":
+    template = load_template ('ics')
+    print 'dated tasks:', FOLDERS * PROJECTS * TASKS
+    before = render (OldCalendarVisitor, DecodingNote, template)
+    print '%-10s %.2fs (best of 3)' % ('before', before)
+    sys.stdout.flush ()
+    after = render (PrintCalendarVisitor, OFNote, template)
+    print '%-10s %.2fs x%.1f (best of 3)' % ('after', after, before / after)
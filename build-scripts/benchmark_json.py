@@ -0,0 +1,61 @@
+#!/usr/local/bin/python
+'''
+Writes a generated 100k node tree to a json file and reads it back with
+the recursive reader, the iterative one and the streaming one, then does
+the same with the binary format.
+
+Run from the project root:
+    OFEXPORT_HOME=`pwd` PYTHONPATH=src/main/python python build-scripts/benchmark_json.py
+'''
+import codecs
+import json
+import os
+import sys
+import tempfile
+import time
+from treemodel import Context
+from of_to_json import write_json, read_json, load_from_json
+from of_to_binary import write_binary, read_binary
+from output_sink import file_sink
+from benchmark_output import build_tree
+
+def read_json_recursive (file_name):
+    # The reader as it was, one load_attrib and strptime at a time
+    instream=codecs.open(file_name, 'r', 'utf-8')
+    json_data = json.loads(instream.read())
+    instream.close ()
+    item_db = {}
+    return load_from_json (json_data[0], item_db), load_from_json (json_data[1], item_db)
+
+def best_time (read, file_name, repeats=3):
+    best = None
+    for i in range (repeats):
+        start = time.time ()
+        read (file_name)
+        elapsed = time.time () - start
+        best = elapsed if best == None else min (best, elapsed)
+    return best
+
+if __name__ == "__main__":
+    fd, file_name = tempfile.mkstemp (suffix='.json')
+    os.close (fd)
+    try:
+        out = file_sink (file_name)
+        write_json (out, build_tree (), Context (name=u''))
+        out.close ()
+        print 'file size: %.1fMB' % (os.path.getsize (file_name) / (1024.0 * 1024))
+        recursive = best_time (read_json_recursive, file_name)
+        print '%-10s %.2fs' % ('recursive', recursive)
+        for name, stream in [('iterative', False), ('streaming', True)]:
+            elapsed = best_time (lambda f: read_json (f, stream=stream), file_name)
+            print '%-10s %.2fs x%.1f' % (name, elapsed, recursive / elapsed)
+            sys.stdout.flush ()
+        binary_file_name = file_name + '.ofbin'
+        try:
+            write_binary (binary_file_name, *read_json (file_name))
+            elapsed = best_time (read_binary, binary_file_name)
+            print '%-10s %.2fs x%.1f (%.1fMB)' % ('binary', elapsed, recursive / elapsed, os.path.getsize (binary_file_name) / (1024.0 * 1024))
+        finally:
+            os.remove (binary_file_name)
+    finally:
+        os.remove (file_name)
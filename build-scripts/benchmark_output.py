@@ -0,0 +1,77 @@
+#!/usr/local/bin/python
+'''
+Renders a generated 100k node tree to /dev/null, once through a codecs
+writer (one encode and write per line) and once through an OutputSink.
+
+Run from the project root:
+    OFEXPORT_HOME=`pwd` PYTHONPATH=src/main/python python build-scripts/benchmark_output.py
+'''
+import codecs
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from treemodel import Folder, Project, Task
+from fmt_template import FmtTemplate, format_document
+from of_to_text import PrintTextVisitor
+from of_to_md import PrintMarkdownVisitor
+from of_to_html import PrintHtmlVisitor
+from output_sink import file_sink
+
+FOLDERS = 50
+PROJECTS = 40
+TASKS = 50
+
+def build_tree ():
+    root = Folder (name=u'root')
+    for f in range (FOLDERS):
+        folder = Folder (name=u'folder ' + str (f), parent=root)
+        for p in range (PROJECTS):
+            project = Project (name=u'project ' + str (p), parent=folder)
+            for t in range (TASKS):
+                Task (name=u'task \u2713 ' + str (t), parent=project, flagged=t % 7 == 0,
+                      date_due=datetime (2013, 5, t % 28 + 1))
+    return root
+
+def load_template (name):
+    instream=codecs.open(os.environ['OFEXPORT_HOME'] + '/templates/' + name + '.json', 'r', 'utf-8')
+    template = FmtTemplate (json.loads(instream.read()))
+    instream.close ()
+    return template
+
+def render (root, visitor_class, template, open_out, repeats=3):
+    best = None
+    for i in range (repeats):
+        out = open_out ()
+        start = time.time ()
+        format_document (root, visitor_class (out, template), True)
+        out.close ()
+        elapsed = time.time () - start
+        best = elapsed if best == None else min (best, elapsed)
+    return best
+
+def write_lines (open_out, lines=FOLDERS * PROJECTS * TASKS, repeats=3):
+    # Just the cost of getting lines out, without any formatting
+    line = u'    Task: task \u2713 12 flagged due:2013-05-01'
+    best = None
+    for i in range (repeats):
+        out = open_out ()
+        start = time.time ()
+        for i in xrange (lines):
+            print >>out, line
+        out.close ()
+        elapsed = time.time () - start
+        best = elapsed if best == None else min (best, elapsed)
+    return best
+
+if __name__ == "__main__":
+    print '%-10s codecs: %.2fs sink: %.2fs (best of 3)' % ('lines', write_lines (lambda: codecs.open ('/dev/null', 'w', 'utf-8')), write_lines (lambda: file_sink ('/dev/null')))
+    root = build_tree ()
+    print 'nodes:', FOLDERS * PROJECTS * TASKS + FOLDERS * PROJECTS + FOLDERS
+    for name, visitor_class in [('text', PrintTextVisitor), ('markdown', PrintMarkdownVisitor), ('html', PrintHtmlVisitor)]:
+        template = load_template (name)
+        codecs_time = render (root, visitor_class, template, lambda: codecs.open ('/dev/null', 'w', 'utf-8'))
+        sink_time = render (root, visitor_class, template, lambda: file_sink ('/dev/null'))
+        print '%-10s codecs: %.2fs sink: %.2fs (best of 3)' % (name, codecs_time, sink_time)
+        sys.stdout.flush ()
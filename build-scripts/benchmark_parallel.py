@@ -0,0 +1,45 @@
+#!/usr/local/bin/python
+'''
+Renders a generated 100k node tree to /dev/null with an increasing number
+of worker processes and prints the speedup over a serial render.
+
+Run from the project root:
+    OFEXPORT_HOME=`pwd` PYTHONPATH=src/main/python python build-scripts/benchmark_parallel.py
+'''
+import multiprocessing
+import sys
+import time
+from fmt_template import format_document
+from of_to_text import PrintTextVisitor
+from of_to_md import PrintMarkdownVisitor
+from of_to_html import PrintHtmlVisitor
+from output_sink import file_sink
+from benchmark_output import build_tree, load_template
+
+def render (root, visitor_class, template, jobs, repeats=3):
+    best = None
+    for i in range (repeats):
+        out = file_sink ('/dev/null')
+        start = time.time ()
+        format_document (root, visitor_class (out, template), True, jobs=jobs)
+        out.close ()
+        elapsed = time.time () - start
+        best = elapsed if best == None else min (best, elapsed)
+    return best
+
+if __name__ == "__main__":
+    cores = multiprocessing.cpu_count ()
+    job_counts = [1]
+    while job_counts[-1] < max (cores, 2):
+        job_counts.append (min (job_counts[-1] * 2, max (cores, 2)))
+    root = build_tree ()
+    print 'cores:', cores, 'top level folders:', len (root.children)
+    for name, visitor_class in [('text', PrintTextVisitor), ('markdown', PrintMarkdownVisitor), ('html', PrintHtmlVisitor)]:
+        template = load_template (name)
+        serial = render (root, visitor_class, template, 1)
+        results = ['%s: %.2fs' % (1, serial)]
+        for jobs in job_counts[1:]:
+            elapsed = render (root, visitor_class, template, jobs)
+            results.append ('%s: %.2fs x%.1f' % (jobs, elapsed, serial / elapsed))
+        print '%-10s %s (best of 3)' % (name, '  '.join (results))
+        sys.stdout.flush ()
@@ -39,5 +39,6 @@ for line in instream:
 print
 print "SHORT_OPTS = '" + ''.join(short_opts) + "'" 
 print "LONG_OPTS = ['" + "','".join(long_opts) + "']" 
+print "VERSION = '" + sys.argv[1] + "'"
   
 instream.close ()
\ No newline at end of file
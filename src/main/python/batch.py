@@ -0,0 +1,117 @@
+'''
+Copyright 2013 Paul Sidnell
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import os
+import codecs
+import getopt
+import json
+import shlex
+import traceback
+import logging
+import sys
+from help import SHORT_OPTS, LONG_OPTS
+
+logging.basicConfig(format='%(asctime)-15s %(name)s %(levelname)s %(message)s', stream=sys.stdout)
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.ERROR)
+
+'''
+Several outputs from one load of the database. A batch file is json, a
+list of outputs each with its own filters and output file, written as a
+single command line string or a list of arguments, the same as a saved
+report (and an output can be a saved report):
+
+{
+    "outputs" : [
+        "-t due=today -o today.html",
+        "-a flagged -a prune -o flagged.taskpaper",
+        ["--report", "week"],
+        "-o backup.json"
+    ]
+}
+
+The filters change the marks, and some change the shape of the tree, so
+every output is written by a process forked from the one holding the
+freshly loaded tree. Each gets its own copy-on-write view of the tree for
+nothing and throws it away when it's done, and several can run at once.
+'''
+
+BATCH_OPTS = ['-i', '--index', '--batch', '--reports', '--serve', '--http', '--watch', '--profile', '--memory']
+
+def load_batch (file_name):
+    logger.info ('loading batch: %s', file_name)
+    instream=codecs.open(file_name, 'r', 'utf-8')
+    data = json.loads(instream.read())
+    instream.close ()
+    outputs = []
+    for args in data['outputs']:
+        if isinstance (args, basestring):
+            # shlex can't cope with unicode in python 2
+            args = shlex.split (args.encode ('utf-8'))
+            args = [arg.decode ('utf-8') for arg in args]
+        opts, extra = getopt.getopt(list (args), SHORT_OPTS, LONG_OPTS)
+        assert len (extra) == 0, "unexpected arguments in batch " + file_name + ": " + str (extra)
+        for opt, arg in opts:
+            assert not opt in BATCH_OPTS, opt + ' applies to the whole batch, not an output: ' + str (args)
+        outputs.append (opts)
+    logger.info ('loaded %s outputs', len (outputs))
+    return outputs
+
+def uses_reports (outputs):
+    return len ([opt for output in outputs for opt, arg in output if opt == '--report']) > 0
+
+def describe_output (opts):
+    return ' '.join ([opt if arg == '' else opt + ' ' + arg for opt, arg in opts])
+
+def run_output (export, output):
+    # In the forked process, never returns
+    status = 1
+    try:
+        export (output)
+        status = 0
+    except:
+        traceback.print_exc ()
+    finally:
+        sys.stdout.flush ()
+        sys.stderr.flush ()
+        os._exit (status)
+
+def run_batch (outputs, export, jobs):
+    '''
+    Runs export (output) for each output in a child process, at most jobs
+    at a time. Returns the indexes of the outputs that failed.
+    '''
+    pending = range (len (outputs))
+    running = {}
+    failed = []
+    while len (pending) > 0 or len (running) > 0:
+        while len (pending) > 0 and len (running) < max (jobs, 1):
+            i = pending.pop (0)
+            logger.info ('starting: %s', describe_output (outputs[i]))
+            sys.stdout.flush ()
+            sys.stderr.flush ()
+            pid = os.fork ()
+            if pid == 0:
+                run_output (export, outputs[i])
+            running[pid] = i
+        pid, status = os.wait ()
+        i = running.pop (pid)
+        if status != 0:
+            logger.error ('failed: %s', describe_output (outputs[i]))
+            failed.append (i)
+        else:
+            logger.info ('finished: %s', describe_output (outputs[i]))
+    return sorted (failed)
@@ -20,6 +20,7 @@ from datetime import datetime
 from datematch import process_date_specifier, match_date_against_range, date_range_to_str
 import sys
 from visitors import Filter, Prune, Sort, Flatten
+from directives import directive_text
 import logging
 
 logging.basicConfig(format='%(asctime)-15s %(name)s %(levelname)s %(message)s', stream=sys.stdout)
@@ -46,6 +47,10 @@ NEXT_ALIASES = ['next', 'next']
 TYPE_ALIASES = ['type']
 NOTE_ALIASES = ['note']
 STATUS_ALIASES = ['status']
+CAL_ALIASES = ['cal']
+
+# Fields that are note directives rather than attributes of the node
+DIRECTIVE_FIELDS = [CAL_ALIASES[0]]
 
 FLATTEN_ALIASES = ['flat', 'flatten']
 PRUNE_ALIASES = ['prune']
@@ -63,6 +68,7 @@ def build_alias_lookups ():
     result.update (mk_map (TYPE_ALIASES))
     result.update (mk_map (NOTE_ALIASES))
     result.update (mk_map (STATUS_ALIASES))
+    result.update (mk_map (CAL_ALIASES))
     return result
 
 def build_date_alias_lookups (): 
@@ -80,6 +86,7 @@ def build_string_alias_lookups ():
     result.update (mk_map (TYPE_ALIASES))
     result.update (mk_map (NOTE_ALIASES))
     result.update (mk_map (STATUS_ALIASES))
+    result.update (mk_map (CAL_ALIASES))
     return result
     
 ALIAS_LOOKUPS = build_alias_lookups ()
@@ -289,7 +296,46 @@ def access_field (x, field):
     LOGGER.debug ('accessing field %s.%s=\'%s\'', type(x), field, result)
     return adapt (result)
 
-def parse_expr (tokens, type_required=BOOL_TYPE, now = now (), level = 0):
+# PLANS
+# An expression is parsed into a plan: nested tuples of plain values that
+# can be cached, compared and hashed. Date literals stay as their text and
+# are only resolved against a date when the plan is compiled.
+PLAN_CONST = 'const'
+PLAN_FIELD = 'field'
+PLAN_TEXT = 'text'
+PLAN_DATE = 'date'
+PLAN_NOT = 'not'
+PLAN_AND = 'and'
+PLAN_OR = 'or'
+PLAN_EQ = 'eq'
+PLAN_NE = 'ne'
+
+PLAN_OPS = {AND : PLAN_AND, OR : PLAN_OR, EQUAL : PLAN_EQ, NOT_EQUAL : PLAN_NE}
+
+def field_type (field):
+    if field in DATE_ALIAS_LOOKUPS:
+        return DATE_TYPE
+    elif field in STRING_ALIAS_LOOKUPS:
+        return STRING_TYPE
+    return BOOL_TYPE
+
+def plan_to_string (plan, now):
+    kind = plan[0]
+    if kind == PLAN_CONST:
+        return 'true' if plan[1] else 'false'
+    elif kind == PLAN_FIELD:
+        return 'field:' + plan[1]
+    elif kind == PLAN_TEXT:
+        text, quoted = plan[1], plan[2]
+        return '"' + text + '"' if quoted else text
+    elif kind == PLAN_DATE:
+        return '[' + date_range_to_str(process_date_specifier (now, plan[1])) + ']'
+    elif kind == PLAN_NOT:
+        return 'not(' + plan_to_string (plan[1], now) + ')'
+    op = {PLAN_AND : 'AND', PLAN_OR : 'OR', PLAN_EQ : '=', PLAN_NE : '!='}[kind]
+    return '(' + plan_to_string (plan[1], now) + ')' + op + '(' + plan_to_string (plan[2], now) + ')'
+
+def parse_plan (tokens, type_required=BOOL_TYPE, now = now (), level = 0):
     LOGGER.debug ('parsing %s tokens: %s', level, tokens)
     tok, tokens = next_token (tokens, [TEXT, QUOTED_TEXT, NOT, OPEN_BRACE])
     (t,v) = tok
@@ -297,92 +343,203 @@ def parse_expr (tokens, type_required=BOOL_TYPE, now = now (), level = 0):
     # NOT
     if t == NOT:
         assert type_required == BOOL_TYPE, "expecting a ' + required_type' expression, not " + BOOL_TYPE
-        expr, tokens, expr_type, expr_string = parse_expr (tokens, now=now, level=level+1)
+        expr, tokens, expr_type = parse_plan (tokens, now=now, level=level+1)
         assert expr_type == BOOL_TYPE, "not must have a boolean argument"
-        LOGGER.debug ('built %s:1 %s %s', level, expr_type, expr_string)
-        return (lambda x: not expr (x)), tokens, BOOL_TYPE, 'not(' + expr_string + ')'
+        LOGGER.debug ('built %s:1 %s %s', level, expr_type, expr)
+        return (PLAN_NOT, expr), tokens, BOOL_TYPE
     
     # LHS
     if t == TEXT and v =='true':
-        lhs = lambda x: True
-        lhs_string = 'true'
+        lhs = (PLAN_CONST, True)
         lhs_type = BOOL_TYPE
     elif t == TEXT and v =='false':
-        lhs = lambda x: False
-        lhs_string = 'true'
+        lhs = (PLAN_CONST, False)
         lhs_type = BOOL_TYPE
     elif t == TEXT and v in ALIAS_LOOKUPS:
         field = ALIAS_LOOKUPS[v]
-        lhs = lambda x: access_field(x, field)
-        lhs_string = 'field:' + field
-        if field in DATE_ALIAS_LOOKUPS:
-            lhs_type = DATE_TYPE
-        elif field in STRING_ALIAS_LOOKUPS:
-            lhs_type = STRING_TYPE
-        else:
-            lhs_type = BOOL_TYPE
+        lhs = (PLAN_FIELD, field)
+        lhs_type = field_type (field)
     elif t == OPEN_BRACE:
-        lhs, tokens, lhs_type, lhs_string = parse_expr (tokens, now=now, level=level+1)
+        lhs, tokens, lhs_type = parse_plan (tokens, now=now, level=level+1)
         tokens = next_token (tokens, [CLOSE_BRACE])[1]
-    elif t == QUOTED_TEXT:
-        text = v
-        lhs = lambda x: unicode (text)
-        lhs_string = '"' + v + '"'
-        lhs_type = STRING_TYPE
-        if type_required == DATE_TYPE:
-            rng = process_date_specifier (now, text)
-            lhs = lambda x: rng
-            lhs_string = '[' + date_range_to_str(rng) + ']'
-            lhs_type = DATE_TYPE
-    elif t == TEXT:
-        text = v
-        lhs = lambda x: unicode (text)
-        lhs_string = text
+    elif t == QUOTED_TEXT or t == TEXT:
+        text = unicode (v)
+        lhs = (PLAN_TEXT, text, t == QUOTED_TEXT)
         lhs_type = STRING_TYPE
         if type_required == DATE_TYPE:
-            rng = process_date_specifier (now, text)
-            lhs = lambda x: rng
-            lhs_string = '[' + date_range_to_str(rng) + ']'
+            # Resolve once now so that a bad date is reported while parsing
+            process_date_specifier (now, text)
+            lhs = (PLAN_DATE, text, t == QUOTED_TEXT)
             lhs_type = DATE_TYPE
     else:
         assert False, 'unexpected token: ' + v
     
-    LOGGER.debug ('built %s:2 %s %s', level, lhs_type, lhs_string)
+    LOGGER.debug ('built %s:2 %s %s', level, lhs_type, lhs)
     
     # OPERATOR 
     if len(tokens) == 0:
-        LOGGER.debug ('built %s:3 %s %s', level, lhs_type, lhs_string)
-        assert type_required == lhs_type, "expecting a " + type_required + ' got a ' + lhs_type + ': ' + lhs_string
-        return lhs, tokens, lhs_type, lhs_string
+        LOGGER.debug ('built %s:3 %s %s', level, lhs_type, lhs)
+        assert type_required == lhs_type, "expecting a " + type_required + ' got a ' + lhs_type + ': ' + plan_to_string (lhs, now)
+        return lhs, tokens, lhs_type
     
     tok, tokens = next_token (tokens,[AND, OR, EQUAL, NOT_EQUAL, CLOSE_BRACE])
     op,v = tok
     if op == CLOSE_BRACE:
-        LOGGER.debug ('built %s:4 %s %s', level, lhs_type, lhs_string)
-        assert type_required == lhs_type, "expecting a " + type_required + ' got a ' + lhs_type + ': ' + lhs_string
-        return lhs, [tok] + tokens, lhs_type, lhs_string
+        LOGGER.debug ('built %s:4 %s %s', level, lhs_type, lhs)
+        assert type_required == lhs_type, "expecting a " + type_required + ' got a ' + lhs_type + ': ' + plan_to_string (lhs, now)
+        return lhs, [tok] + tokens, lhs_type
         
-    rhs, tokens, rhs_type, rhs_string = parse_expr (tokens, type_required = lhs_type, now=now, level=level+1)         
+    rhs, tokens, rhs_type = parse_plan (tokens, type_required = lhs_type, now=now, level=level+1)         
     assert lhs_type == rhs_type, "incompatible types, " + lhs_type + ' ' + rhs_type
 
     assert type_required == BOOL_TYPE, "expecting a " + type_required + ' but got ' + BOOL_TYPE
 
-    if op == AND:
-        expr_string = '(' + lhs_string + ')AND(' + rhs_string + ')' 
-        LOGGER.debug ('built %s:5 %s %s', level, BOOL_TYPE, expr_string)
-        return (lambda x: and_fn(lhs, rhs, x)), tokens, BOOL_TYPE, expr_string
-    elif op == OR:
-        expr_string = '(' + lhs_string + ')OR(' + rhs_string + ')' 
-        LOGGER.debug ('built %s:6 %s %s', level, BOOL_TYPE, expr_string)
-        return (lambda x: or_fn(lhs, rhs, x)), tokens, BOOL_TYPE, expr_string
-    elif op == EQUAL:
-        expr_string = '(' + lhs_string + ')=(' + rhs_string + ')' 
-        LOGGER.debug ('built %s:7 %s %s', level, BOOL_TYPE, expr_string)
-        return (lambda x: eq_fn (lhs (x), rhs (x))), tokens, BOOL_TYPE, expr_string 
-    elif op == NOT_EQUAL:
-        expr_string = '(' + lhs_string + ')!=(' + rhs_string + ')' 
-        LOGGER.debug ('built %s:8 %s %s', level, BOOL_TYPE, expr_string)
-        return (lambda x: ne_fn (lhs (x), rhs (x))), tokens, BOOL_TYPE, expr_string 
+    expr = (PLAN_OPS[op], lhs, rhs)
+    LOGGER.debug ('built %s:5 %s %s', level, BOOL_TYPE, expr)
+    return expr, tokens, BOOL_TYPE
+
+def optimize_plan (plan):
+    # Fold away constant sub-expressions, e.g. from "true and ..." 
+    kind = plan[0]
+    if kind == PLAN_NOT:
+        expr = optimize_plan (plan[1])
+        if expr[0] == PLAN_CONST:
+            return (PLAN_CONST, not expr[1])
+        if expr[0] == PLAN_NOT:
+            return expr[1]
+        return (PLAN_NOT, expr)
+    elif kind == PLAN_AND or kind == PLAN_OR:
+        lhs = optimize_plan (plan[1])
+        rhs = optimize_plan (plan[2])
+        absorbing = kind == PLAN_OR
+        if lhs[0] == PLAN_CONST:
+            return lhs if lhs[1] == absorbing else rhs
+        if rhs[0] == PLAN_CONST and rhs[1] != absorbing:
+            return lhs
+        return (kind, lhs, rhs)
+    elif kind == PLAN_EQ or kind == PLAN_NE:
+        lhs = optimize_plan (plan[1])
+        rhs = optimize_plan (plan[2])
+        if lhs[0] == PLAN_CONST and rhs[0] == PLAN_CONST:
+            return (PLAN_CONST, (lhs[1] == rhs[1]) == (kind == PLAN_EQ))
+        return (kind, lhs, rhs)
+    return plan
+
+class SharedExpressions(object):
+    '''
+    Hash-conses the plans of a filter chain so that a sub-expression that
+    appears more than once, in one filter or across several, is evaluated
+    at most once per node. Results are memoised in the node's attribs and
+    must be cleared once the chain has run.
+    '''
+    MEMO = 'expr_memo'
+    def __init__ (self):
+        self.counts = {}
+        self.keys = {}
+        self.nodes = []
+        self.evaluations = 0
+        self.saved = 0
+    def register (self, plan):
+        if plan[0] == 'filter':
+            plan = plan[1]
+        elif plan[0] in ('prune', 'flatten', 'sort'):
+            return
+        kind = plan[0]
+        if kind in (PLAN_CONST, PLAN_TEXT, PLAN_DATE):
+            return
+        self.counts[plan] = self.counts.get (plan, 0) + 1
+        if self.counts[plan] == 1 and kind != PLAN_FIELD:
+            # Only count the children once, however often the parent appears
+            for child in plan[1:]:
+                self.register (child)
+    def is_shared (self, plan):
+        return self.counts.get (plan, 0) > 1
+    def memoize (self, plan, fn):
+        if not plan in self.keys:
+            self.keys[plan] = len (self.keys)
+        key = self.keys[plan]
+        def evaluate (x):
+            memo = x.attribs.get (SharedExpressions.MEMO)
+            if memo == None:
+                memo = {}
+                x.attribs[SharedExpressions.MEMO] = memo
+                self.nodes.append (x)
+            elif key in memo:
+                self.saved += 1
+                return memo[key]
+            value = fn (x)
+            memo[key] = value
+            self.evaluations += 1
+            return value
+        return evaluate
+    def clear (self):
+        for node in self.nodes:
+            if SharedExpressions.MEMO in node.attribs:
+                del node.attribs[SharedExpressions.MEMO]
+        self.nodes = []
+    def __str__ (self):
+        return str(len ([c for c in self.counts.values() if c > 1])) + ' shared sub-expressions, ' + str(self.evaluations) + ' evaluations, ' + str(self.saved) + ' saved'
+
+def index_candidates (plan, index):
+    # The ids of the nodes that could match a name=/note= search, or None
+    lhs, rhs = plan[1], plan[2]
+    if lhs[0] != PLAN_FIELD or rhs[0] != PLAN_TEXT:
+        return None
+    return index.candidates (lhs[1], rhs[1])
+
+def indexed_eq_fn (index, candidates, lhs_fn, rhs_fn, x):
+    if x.id in candidates or not x.id in index.ids:
+        return eq_fn (lhs_fn (x), rhs_fn (x))
+    LOGGER.debug ('eval =: %s not a candidate', x.id)
+    return False
+
+def compile_plan (plan, now, shared=None, index=None):
+    fn = compile_plan_node (plan, now, shared, index)
+    if shared != None and shared.is_shared (plan):
+        fn = shared.memoize (plan, fn)
+    return fn
+
+def compile_plan_node (plan, now, shared, index):
+    kind = plan[0]
+    if kind == PLAN_CONST:
+        value = plan[1]
+        return lambda x: value
+    elif kind == PLAN_FIELD:
+        field = plan[1]
+        if field in DIRECTIVE_FIELDS:
+            return lambda x: directive_text (x, field)
+        return lambda x: access_field(x, field)
+    elif kind == PLAN_TEXT:
+        text = plan[1]
+        return lambda x: text
+    elif kind == PLAN_DATE:
+        rng = process_date_specifier (now, plan[1])
+        return lambda x: rng
+    elif kind == PLAN_NOT:
+        expr = compile_plan (plan[1], now, shared, index)
+        return lambda x: not expr (x)
+    lhs = compile_plan (plan[1], now, shared, index)
+    rhs = compile_plan (plan[2], now, shared, index)
+    if index != None and (kind == PLAN_EQ or kind == PLAN_NE):
+        candidates = index_candidates (plan, index)
+        if candidates != None:
+            eq = lambda x: indexed_eq_fn (index, candidates, lhs, rhs, x)
+            if kind == PLAN_EQ:
+                return eq
+            return lambda x: not eq (x)
+    if kind == PLAN_AND:
+        return lambda x: and_fn(lhs, rhs, x)
+    elif kind == PLAN_OR:
+        return lambda x: or_fn(lhs, rhs, x)
+    elif kind == PLAN_EQ:
+        return lambda x: eq_fn (lhs (x), rhs (x))
+    elif kind == PLAN_NE:
+        return lambda x: ne_fn (lhs (x), rhs (x))
+    assert False, 'unknown plan: ' + str (plan)
+
+def parse_expr (tokens, type_required=BOOL_TYPE, now = now (), level = 0):
+    plan, tokens, expr_type = parse_plan (tokens, type_required=type_required, now=now, level=level)
+    return compile_plan (plan, now), tokens, expr_type, plan_to_string (plan, now)
 
 def get_date_attrib_or_now (item, attrib):
     if not attrib in item.__dict__:
@@ -392,7 +549,7 @@ def get_date_attrib_or_now (item, attrib):
         return FAR_FUTURE
     return result
 
-def make_command_filter (expr_str):    
+def make_command_plan (expr_str):    
     # First look for sort/prune
     bits = re.split(' ', expr_str)
     if len (bits) >= 2:
@@ -401,16 +558,16 @@ def make_command_filter (expr_str):
             assert len (bits) == 2, 'prune takes one node type argument, got: ' + expr_str
             typ = bits[1].strip ()
             if typ == 'any' or typ == 'all':
-                return Prune ([PROJECT, CONTEXT, FOLDER]) # NOT TASKS!!!
+                return ('prune', [PROJECT, CONTEXT, FOLDER]) # NOT TASKS!!!
             assert typ in [PROJECT, CONTEXT, FOLDER], 'no such node type in prune: ' + typ
-            return Prune ([typ])
+            return ('prune', [typ])
         if cmd in FLATTEN_ALIASES:
             assert len (bits) == 2, 'flatten takes one node type argument, got: ' + expr_str
             typ = bits[1].strip ()
             if typ == 'any' or typ == 'all':
-                return Flatten ([TASK, PROJECT, CONTEXT, FOLDER])
+                return ('flatten', [TASK, PROJECT, CONTEXT, FOLDER])
             assert typ in [TASK, PROJECT, CONTEXT, FOLDER], 'no such node type in flatten: ' + typ
-            return Flatten ([typ])
+            return ('flatten', [typ])
         elif cmd in SORT_ALIASES:
             assert len (bits) == 3, 'sort takes two arguments, node type and field, got: ' + expr_str
             typ = bits[1].strip()
@@ -421,27 +578,62 @@ def make_command_filter (expr_str):
                 types = [typ]
             field = bits[2].strip()
             assert field in ALIAS_LOOKUPS, 'no such sortable field:' + field
-            field = ALIAS_LOOKUPS.get(field)
-            if field in DATE_ALIAS_LOOKUPS:
-                get_date = lambda x: get_date_attrib_or_now (x, field)
-                return Sort (types, get_date, field)
-            else:
-                get_field = lambda x: x.__dict__[field]
-                return Sort (types, get_field, field)
+            return ('sort', types, ALIAS_LOOKUPS.get(field))
     return None
 
-def make_expr_filter (expr_str, include):
-    match_fn, tokens_left, expr_type, expr_string = parse_expr (tokenise (expr_str), now=now())
+def compile_command_plan (plan):
+    cmd = plan[0]
+    types = list (plan[1])
+    if cmd == 'prune':
+        return Prune (types)
+    elif cmd == 'flatten':
+        return Flatten (types)
+    field = plan[2]
+    if field in DATE_ALIAS_LOOKUPS:
+        get_date = lambda x: get_date_attrib_or_now (x, field)
+        return Sort (types, get_date, field)
+    elif field in DIRECTIVE_FIELDS:
+        get_field = lambda x: directive_text (x, field)
+        return Sort (types, get_field, field)
+    else:
+        get_field = lambda x: x.__dict__[field]
+        return Sort (types, get_field, field)
+
+def make_command_filter (expr_str):
+    plan = make_command_plan (expr_str)
+    if plan == None:
+        return None
+    return compile_command_plan (plan)
+
+def make_expr_plan (expr_str):
+    plan, tokens_left, expr_type = parse_plan (tokenise (expr_str), now=now())
     if len (tokens_left) > 0:
         assert False, 'don\'t know what to do with: ' + str (tokens_left)
     assert expr_type == BOOL_TYPE, "filter must have a boolean argument"
-    return Filter ([TASK, PROJECT, CONTEXT, FOLDER], match_fn, include, expr_string)
+    return ('filter', optimize_plan (plan))
 
-def make_filter (expr_str, include):
-    
-    filtr = make_command_filter (expr_str)
-    if filtr == None:
-        filtr = make_expr_filter (expr_str, include)
-    return filtr
+def compile_expr_plan (plan, include, shared=None, index=None):
+    expr = plan[1]
+    the_now = now()
+    return Filter ([TASK, PROJECT, CONTEXT, FOLDER], compile_plan (expr, the_now, shared, index), include, plan_to_string (expr, the_now))
 
-            
+def make_expr_filter (expr_str, include):
+    return compile_expr_plan (make_expr_plan (expr_str), include)
+
+def make_plan (expr_str):
+    plan = make_command_plan (expr_str)
+    if plan == None:
+        plan = make_expr_plan (expr_str)
+    return plan
+
+def compile_filter_plan (plan, include, shared=None, index=None):
+    if plan[0] == 'filter':
+        return compile_expr_plan (plan, include, shared, index)
+    return compile_command_plan (plan)
+
+def make_filter (expr_str, include, plan_cache=None, shared=None):
+    if plan_cache != None:
+        plan = plan_cache.get_plan (expr_str)
+    else:
+        plan = make_plan (expr_str)
+    return compile_filter_plan (plan, include, shared)
@@ -0,0 +1,251 @@
+'''
+Copyright 2013 Paul Sidnell
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import re
+import logging
+import sys
+from treemodel import TASK, PROJECT, CONTEXT, FOLDER
+from datematch import process_date_specifier
+from cmd_parser import PLAN_CONST, PLAN_FIELD, PLAN_TEXT, PLAN_DATE, PLAN_NOT, PLAN_AND, PLAN_OR, PLAN_EQ, PLAN_NE, plan_to_string
+from visitors import includes
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logging.basicConfig(format='%(asctime)-15s %(name)s %(levelname)s %(message)s', stream=sys.stdout)
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.ERROR)
+
+'''
+A columnar copy of the tree for evaluating simple filter expressions
+with numpy rather than a python closure per node.
+
+Rows are in the order traverse() would visit the nodes, each with the
+row index of its parent in that traversal, so the same table answers
+project mode (from the root folder) and context mode (from the root
+context). Only the static fields are copied, the marks are read back
+from the tree each time a filter runs.
+
+Values are held as int8 with -1 standing for None, since that's what
+access_field returns for a field the node doesn't have, and the
+and/or/not/= operators are defined so None behaves exactly as it does
+in cmd_parser. The one exception is None on the left of an "or", which
+fails an assertion in the per node path and is simply false here.
+
+Anything else, e.g. regular expressions on names or notes, isn't
+vectorizable and those filters run node by node as before.
+'''
+
+AVAILABLE = numpy != None
+
+BOOL_FIELDS = ['flagged', 'next']
+DATE_FIELDS = ['date_due', 'date_to_start', 'date_completed']
+TYPE_FIELD = 'type'
+TYPES = [TASK, PROJECT, CONTEXT, FOLDER]
+NO_DATE = 0
+
+def bool_value (value):
+    if value == None:
+        return -1
+    return int (bool (value))
+
+def date_value (value):
+    if value == None:
+        return NO_DATE
+    return value.date().toordinal()
+
+class TaskTable(object):
+    def __init__ (self, root):
+        self.nodes = []
+        parents = []
+        depths = []
+        shadows = []
+        self.add_rows (root, -1, 0, True, parents, depths, shadows)
+        self.parents = numpy.array (parents, dtype=numpy.int32)
+        self.shadows = numpy.flatnonzero (shadows)
+        depths = numpy.array (depths, dtype=numpy.int32)
+        self.levels = [numpy.flatnonzero (depths == depth) for depth in range (depths.max () + 1)]
+        self.columns = {}
+        for field in BOOL_FIELDS:
+            self.columns[field] = numpy.array ([bool_value (node.__dict__.get (field)) for node in self.nodes], dtype=numpy.int8)
+        for field in DATE_FIELDS:
+            self.columns[field] = numpy.array ([date_value (node.__dict__.get (field)) for node in self.nodes], dtype=numpy.int32)
+        self.columns[TYPE_FIELD] = numpy.array ([TYPES.index (node.type) for node in self.nodes], dtype=numpy.int8)
+        logger.info ('built table of %s rows from %s', len (self.nodes), root.name)
+    def add_rows (self, node, parent, depth, project_mode, parents, depths, shadows):
+        # Mirrors the shape of traverse ()
+        shadow = False
+        if node.type == FOLDER:
+            project_mode = True
+        elif node.type == CONTEXT:
+            project_mode = False
+        elif node.type == PROJECT and not project_mode and len (node.children) > 0:
+            # traverse() skips these but un-marking a context still reaches them
+            shadow = True
+        row = len (self.nodes)
+        self.nodes.append (node)
+        parents.append (parent)
+        depths.append (depth)
+        shadows.append (shadow)
+        if not shadow and (project_mode or node.type == CONTEXT):
+            for child in node.children:
+                self.add_rows (child, row, depth + 1, project_mode, parents, depths, shadows)
+    def __len__ (self):
+        return len (self.nodes)
+    def get_marks (self):
+        return numpy.array ([node.marked for node in self.nodes], dtype=numpy.bool_)
+    def set_marks (self, old_marks, new_marks):
+        changed = numpy.flatnonzero (old_marks != new_marks)
+        for row in changed:
+            self.nodes[row].marked = bool (new_marks[row])
+        return len (changed)
+    def down (self, values, combine):
+        # values[row] = combine (parent's result, values[row]), top down
+        for level in self.levels[1:]:
+            values[level] = combine (values[self.parents[level]], values[level])
+        return values
+    def up (self, values):
+        # values[parent] |= values[row], bottom up
+        for level in reversed (self.levels[1:]):
+            numpy.logical_or.at (values, self.parents[level], values[level])
+        return values
+
+def is_date_field (plan):
+    return plan[0] == PLAN_FIELD and plan[1] in DATE_FIELDS
+
+def vectorizable (plan):
+    kind = plan[0]
+    if kind == PLAN_CONST:
+        return type (plan[1]) == bool
+    elif kind == PLAN_FIELD:
+        return plan[1] in BOOL_FIELDS
+    elif kind == PLAN_NOT:
+        return vectorizable (plan[1])
+    elif kind == PLAN_AND or kind == PLAN_OR:
+        return vectorizable (plan[1]) and vectorizable (plan[2])
+    elif kind == PLAN_EQ or kind == PLAN_NE:
+        lhs, rhs = plan[1], plan[2]
+        if is_date_field (lhs) and rhs[0] == PLAN_DATE:
+            return True
+        if is_date_field (rhs) and lhs[0] == PLAN_DATE:
+            return True
+        if lhs == (PLAN_FIELD, TYPE_FIELD) and rhs[0] == PLAN_TEXT:
+            return True
+        return vectorizable (lhs) and vectorizable (rhs)
+    return False
+
+def date_mask (dates, rng):
+    if rng == None:
+        return dates != NO_DATE
+    start, end, spec = rng
+    if spec == 'none':
+        return dates == NO_DATE
+    elif spec == 'any':
+        return dates != NO_DATE
+    mask = dates != NO_DATE
+    if start != None:
+        mask &= dates >= start.date ().toordinal ()
+    if end != None:
+        mask &= dates <= end.date ().toordinal ()
+    return mask
+
+def type_mask (types, pattern):
+    matching = [code for code, typ in enumerate (TYPES) if re.search (pattern, unicode (typ)) != None]
+    return numpy.in1d (types, matching)
+
+def equals (plan, table, now):
+    lhs, rhs = plan[1], plan[2]
+    if is_date_field (rhs):
+        lhs, rhs = rhs, lhs
+    if is_date_field (lhs):
+        return date_mask (table.columns[lhs[1]], process_date_specifier (now, rhs[1]))
+    if lhs == (PLAN_FIELD, TYPE_FIELD):
+        return type_mask (table.columns[TYPE_FIELD], rhs[1])
+    return evaluate (lhs, table, now) == evaluate (rhs, table, now)
+
+def evaluate (plan, table, now):
+    kind = plan[0]
+    if kind == PLAN_CONST:
+        return numpy.full (len (table), int (plan[1]), dtype=numpy.int8)
+    elif kind == PLAN_FIELD:
+        return table.columns[plan[1]]
+    elif kind == PLAN_NOT:
+        return numpy.where (evaluate (plan[1], table, now) == 1, 0, 1).astype (numpy.int8)
+    elif kind == PLAN_AND:
+        lhs = evaluate (plan[1], table, now)
+        return numpy.where (lhs == 1, evaluate (plan[2], table, now), 0).astype (numpy.int8)
+    elif kind == PLAN_OR:
+        lhs = evaluate (plan[1], table, now)
+        return numpy.where (lhs == 1, 1, evaluate (plan[2], table, now)).astype (numpy.int8)
+    elif kind == PLAN_EQ:
+        return equals (plan, table, now).astype (numpy.int8)
+    elif kind == PLAN_NE:
+        return (~equals (plan, table, now)).astype (numpy.int8)
+    assert False, 'can\'t vectorize plan: ' + str (plan)
+
+def filter_marks (table, matched, marks, include):
+    # Visited: marked with every ancestor in the traversal marked
+    visited = table.down (marks.copy (), lambda parent, row: parent & row)
+    visited[table.shadows] = False
+    shadow_parents = table.parents[table.shadows]
+    if include:
+        # A node stays if it or a parent matched, or it's on the path to
+        # a match, just as with Filter's INCLUDED and PATH_TO_INCLUDED
+        included = table.down (visited & matched, lambda parent, row: row | parent)
+        included &= visited
+        keep = table.up (included.copy ())
+        result = marks & (~visited | keep)
+        result[table.shadows] &= ~visited[shadow_parents] | keep[shadow_parents]
+        return result
+    # Exclude mode: a match takes out everything under it that's visited
+    hit = table.down (visited & matched, lambda parent, row: row | parent)
+    hit &= visited
+    result = marks & ~hit
+    result[table.shadows] &= ~hit[shadow_parents]
+    return result
+
+class Columns(object):
+    '''
+    The tables for the subjects of a filter chain. Any visitor other than a
+    filter may restructure the tree, so the tables must be invalidated
+    after one runs.
+    '''
+    def __init__ (self):
+        self.tables = {}
+    def get_table (self, root):
+        key = id (root)
+        if not key in self.tables:
+            self.tables[key] = TaskTable (root)
+        return self.tables[key]
+    def invalidate (self):
+        self.tables = {}
+
+class ColumnarFilter(object):
+    def __init__ (self, columns, plan, include, now):
+        self.columns = columns
+        self.expr = plan[1]
+        self.include = include
+        self.now = now
+    def run (self, subject):
+        table = self.columns.get_table (subject)
+        matched = evaluate (self.expr, table, self.now) == 1
+        marks = table.get_marks ()
+        changed = table.set_marks (marks, filter_marks (table, matched, marks, self.include))
+        logger.info ('%s rows matched, %s marks changed', numpy.count_nonzero (matched), changed)
+    def __str__ (self):
+        return includes (self.include) + ' ' + str (TYPES) + ' where ' + plan_to_string (self.expr, self.now) + ' (columnar)'
@@ -16,6 +16,11 @@ limitations under the License.
 
 import re
 from datetime import datetime, timedelta
+from util import LRUCache
+
+DAY_NAMES = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+MONTH_NAMES = ['january', 'february', 'march', 'april', 'may', 'june', 'july',
+               'august', 'september', 'october', 'november', 'december']
 
 def hunt_for_day (now, dow, forward, match_today = False):
     direction = -1
@@ -24,31 +29,33 @@ def hunt_for_day (now, dow, forward, match_today = False):
         direction = 1
     if match_today:
         start = 0
+    weekday = now.weekday ()
     for days in range (start, 8):
-        next_date = now + timedelta(days=days*direction)
-        next_dow = next_date.strftime ('%A').lower()
+        offset = days*direction
+        next_dow = DAY_NAMES[(weekday + offset) % 7]
         if next_dow.startswith (dow):
-            return next_date
+            return now + timedelta(days=offset)
     return None
 
 DATE_FMT = '%Y-%m-%d'
 
+def first_of_month (year, month):
+    # month may have wandered outside 1..12
+    year = year + (month - 1) // 12
+    month = (month - 1) % 12 + 1
+    return datetime (year, month, 1)
+
 def find_first_of_month (now):
-    year = now.year
-    month = now.month
-    return datetime.strptime(str(year) + '-' + str(month) + '-01', DATE_FMT)
+    return first_of_month (now.year, now.month)
 
 def find_next_month (now):
-    in_next_month = find_first_of_month (now) + timedelta(days=33)
-    return find_first_of_month (in_next_month)
+    return first_of_month (now.year, now.month + 1)
 
 def find_prev_month (now):
-    in_last_month = find_first_of_month (now) + timedelta(days=-1)
-    return find_first_of_month (in_last_month)
+    return first_of_month (now.year, now.month - 1)
 
 def find_end_of_month (now):
-    first_of_this_month = find_first_of_month (now)
-    first_of_next_month = find_next_month (first_of_this_month)
+    first_of_next_month = find_next_month (now)
     return first_of_next_month - timedelta (days=1)
     
 def hunt_for_month (now, month_to_find, forward, match_this_month = False):
@@ -63,7 +70,7 @@ def hunt_for_month (now, month_to_find, forward, match_this_month = False):
         
     for i in range (0, 12):
         i = i # stop warning
-        month_name = month.strftime ('%B').lower()
+        month_name = MONTH_NAMES[month.month - 1]
         if month_name.startswith (month_to_find):
             return month
         if forward:
@@ -79,8 +86,19 @@ def find_monday_next_week (now):
     return hunt_for_day (now, 'mo', True, match_today=False)
 
 def find_january_this_year (now):
-    year = now.year
-    return datetime.strptime(str(year) + '-01-01', '%Y-%m-%d')
+    return datetime (now.year, 1, 1)
+
+DAYS = '(mo|tu|we|th|fr|sa|su)'
+MONTHS = '(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)'
+NEXT_DAY_RE = re.compile ('^next ' + DAYS)
+LAST_DAY_RE = re.compile ('^last ' + DAYS)
+DAY_RE = re.compile ('^' + DAYS)
+MONTH_RE = re.compile ('^' + MONTHS)
+NEXT_MONTH_RE = re.compile ('^next ' + MONTHS)
+LAST_MONTH_RE = re.compile ('^last ' + MONTHS)
+ISO_DATE_RE = re.compile ('^[0-9][0-9][0-9][0-9]-[01][0-9]-[0-3][0-9]$')
+MONTH_SPEC_RE = re.compile ('(next |last )?' + MONTHS)
+ENDS_IN_MONTH_RE = re.compile ('.*' + MONTHS)
 
 def date_from_string (now, date_str):
     if date_str == "today":
@@ -89,33 +107,32 @@ def date_from_string (now, date_str):
         return now + timedelta(days=-1)
     elif date_str == 'tomorrow':
         return now + timedelta(days=1)
-    elif re.match ('^next (mo|tu|we|th|fr|sa|su)', date_str) != None:
+    elif NEXT_DAY_RE.match (date_str) != None:
         dow = date_str[4:].strip ()
         next_monday = find_monday_next_week (now)
         return hunt_for_day (next_monday, dow, True, match_today=True)
-    elif re.match ('^last (mo|tu|we|th|fr|sa|su)', date_str) != None:
+    elif LAST_DAY_RE.match (date_str) != None:
         dow = date_str[4:].strip ()
         this_monday = find_monday_this_week (now)
         return hunt_for_day (this_monday, dow, False)
-    elif re.match ('^(mo|tu|we|th|fr|sa|su)', date_str) != None:
+    elif DAY_RE.match (date_str) != None:
         dow = date_str.strip ()
         monday = find_monday_this_week (now)
         return hunt_for_day (monday, dow, True, match_today=True)
-    elif re.match ('^(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)', date_str) != None:
+    elif MONTH_RE.match (date_str) != None:
         month = date_str.strip ()
         jan = find_january_this_year (now)
         return hunt_for_month (jan, month, True, match_this_month=True)
-    elif re.match ('^next (jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)', date_str) != None:
+    elif NEXT_MONTH_RE.match (date_str) != None:
         month_str = date_str[4:].strip ()
         jan = find_january_this_year (now)
         month = hunt_for_month (jan, month_str, True, match_this_month=True).month
-        year = now.year
-        return datetime.strptime(str(year + 1) + '-' + str(month) + '-01', '%Y-%m-%d')
-    elif re.match ('^last (jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)', date_str) != None:
+        return datetime (now.year + 1, month, 1)
+    elif LAST_MONTH_RE.match (date_str) != None:
         month_str = date_str[4:].strip ()
         jan = find_january_this_year (now)
         return hunt_for_month (jan, month_str, False, match_this_month=False)
-    elif re.match ('^[0-9][0-9][0-9][0-9]-[01][0-9]-[0-3][0-9]$', date_str) != None:
+    elif ISO_DATE_RE.match (date_str) != None:
         return datetime.strptime(date_str, '%Y-%m-%d')
     else:
         return None
@@ -125,9 +142,17 @@ def tidy_space_separated_fields (string):
     elements = string.split ()
     return ' '.join(elements)
 
+# Resolved ranges keyed by (normalised spec, day). Ranges only have day
+# granularity so they are resolved against midnight, which makes the
+# result the same for any time on that day.
+DATE_SPEC_CACHE = LRUCache (max_size=512)
+
 def process_date_specifier (now, date_spec):
     date_spec = tidy_space_separated_fields (date_spec).lower()
-    
+    day = now.date ()
+    return DATE_SPEC_CACHE.lookup ((date_spec, day), lambda: resolve_date_specifier (datetime (day.year, day.month, day.day), date_spec))
+
+def resolve_date_specifier (now, date_spec):
     if date_spec == 'none':
         return (None, None, date_spec)
     if date_spec == 'any':
@@ -138,7 +163,7 @@ def process_date_specifier (now, date_spec):
         # We've found a single stand alone date, not a range.
         # But if it's a month we want to convert it into a range
         
-        if re.match ('(next |last )?(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)', date_spec) != None:
+        if MONTH_SPEC_RE.match (date_spec) != None:
             return (match_date, find_end_of_month (match_date), date_spec)
         else:    
             return (match_date, match_date, date_spec)
@@ -162,7 +187,7 @@ def process_date_specifier (now, date_spec):
     elif date_spec.startswith ('to '):
         date_str = date_spec[2:].strip()
         end =  date_from_string (now, date_str)
-        if re.match ('.*(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)', date_str) != None:
+        if ENDS_IN_MONTH_RE.match (date_str) != None:
             end = find_end_of_month (end)
         return (None, end, date_spec)
     elif re.search (' to ', date_spec) != None:
@@ -170,7 +195,7 @@ def process_date_specifier (now, date_spec):
         elements = [x.strip() for x in elements if len (x) > 0]
         start = date_from_string(now, elements[0])
         end = date_from_string(now, elements[1])
-        if re.match ('.*(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)', elements[1]) != None:
+        if ENDS_IN_MONTH_RE.match (elements[1]) != None:
             end = find_end_of_month (end)
         return (start, end, date_spec)
     else:
@@ -0,0 +1,79 @@
+'''
+Copyright 2013 Paul Sidnell
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+'''
+The "%of <command> ..." lines in notes, e.g. "%of cal allday noalarm" or
+"%of cal start=18:30". Each argument is a flag or a key=value pair.
+
+A node's directives are worked out the first time they're asked for and
+kept on the node as {command : [(key, value), ...]}, a flag having the
+value True. Notes that can say they have no "%of" without being
+decoded (see Note.may_contain) aren't decoded, and with --index the
+directives are kept in the index file along with the words so unchanged
+notes aren't looked at at all. Filters can test a command's arguments as
+text, e.g. cal=allday.
+'''
+
+DIRECTIVE = '%of'
+ATTRIB = 'directives'
+COMMANDS = ['cal']
+
+def parse_directives (lines):
+    directives = {}
+    for line in lines:
+        if line.strip ().startswith (DIRECTIVE):
+            bits = line.split ()
+            if len (bits) >= 3:
+                args = directives.setdefault (bits[1], [])
+                for flag in bits[2:]:
+                    bits2 = flag.split ('=')
+                    if len (bits2) == 2:
+                        args.append ((bits2[0], bits2[1]))
+                    else:
+                        args.append ((flag, True))
+    return directives
+
+def text_directives (text):
+    # From the whole text of a note, when it's already been decoded
+    if text == None or not DIRECTIVE in text:
+        return {}
+    return parse_directives (text.split ('\n'))
+
+def note_directives (node):
+    note = node.__dict__.get ('note')
+    if note == None or not note.may_contain (DIRECTIVE):
+        return {}
+    return parse_directives (note.get_note_lines ())
+
+def get_directives (node):
+    directives = node.__dict__.get (ATTRIB)
+    if directives == None:
+        directives = note_directives (node)
+        node.__dict__[ATTRIB] = directives
+    return directives
+
+def set_directives (node, directives):
+    node.__dict__[ATTRIB] = directives
+
+def directive_attribs (node, command):
+    return dict (get_directives (node).get (command, []))
+
+def directive_text (node, command):
+    # What a filter on the command is matched against, e.g. u'allday start=18:30'
+    args = get_directives (node).get (command)
+    if args == None:
+        return None
+    return u' '.join ([key if value == True else key + u'=' + value for key, value in args])
@@ -0,0 +1,120 @@
+'''
+Copyright 2013 Paul Sidnell
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import os
+import sys
+import json
+import socket
+import struct
+
+'''
+The client for an ofexport server (see export_server.py), and the
+protocol they share. It's kept to the standard library so that it starts
+quickly, the whole point being not to pay for loading ofexport on every
+run:
+
+    ofexport-client [--socket file] -t due=today -o today.html
+
+The request is a line of json, the arguments and the directory to run
+them in. The reply is a series of frames, each a channel byte and a
+length then the data: 'o' for what would have gone to stdout, 'e' for
+stderr and finally 'x' with the exit status.
+'''
+
+DEFAULT_SOCKET = os.path.join (os.environ.get ('HOME', ''), '.ofexport', 'server.sock')
+FRAME = '>cI'
+FRAME_SIZE = struct.calcsize (FRAME)
+STDOUT = 'o'
+STDERR = 'e'
+EXIT = 'x'
+
+def send_frame (conn, channel, data):
+    conn.sendall (struct.pack (FRAME, channel, len (data)) + data)
+
+def read_exactly (conn, size):
+    chunks = []
+    while size > 0:
+        chunk = conn.recv (min (size, 64 * 1024))
+        if len (chunk) == 0:
+            return None
+        chunks.append (chunk)
+        size -= len (chunk)
+    return ''.join (chunks)
+
+def read_frames (conn):
+    # (channel, data) until the exit frame or the server goes away
+    while True:
+        header = read_exactly (conn, FRAME_SIZE)
+        if header == None:
+            return
+        channel, size = struct.unpack (FRAME, header)
+        data = read_exactly (conn, size)
+        if data == None:
+            return
+        yield channel, data
+        if channel == EXIT:
+            return
+
+class FrameWriter(object):
+    # A file for the server's side, everything written goes to the client
+    def __init__ (self, conn, channel):
+        self.conn = conn
+        self.channel = channel
+        self.softspace = 0
+    def write (self, data):
+        if isinstance (data, unicode):
+            data = data.encode ('utf-8')
+        if len (data) > 0:
+            send_frame (self.conn, self.channel, data)
+    def writelines (self, lines):
+        for line in lines:
+            self.write (line)
+    def flush (self):
+        pass
+
+def request (args, socket_file=DEFAULT_SOCKET, cwd=None, out=None, err=None):
+    # Runs one export on the server, returns its exit status
+    out = out if out != None else sys.stdout
+    err = err if err != None else sys.stderr
+    conn = socket.socket (socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect (socket_file)
+        conn.sendall (json.dumps ({'args' : args, 'cwd' : cwd if cwd != None else os.getcwd ()}) + '\n')
+        status = 1
+        for channel, data in read_frames (conn):
+            if channel == STDOUT:
+                out.write (data)
+            elif channel == STDERR:
+                err.write (data)
+            elif channel == EXIT:
+                status = int (data)
+        return status
+    finally:
+        conn.close ()
+
+if __name__ == "__main__":
+    args = [arg.decode ('utf-8') for arg in sys.argv[1:]]
+    socket_file = DEFAULT_SOCKET
+    if len (args) >= 2 and args[0] == '--socket':
+        socket_file = args[1]
+        args = args[2:]
+    try:
+        status = request (args, socket_file)
+    except socket.error as e:
+        print >>sys.stderr, 'cannot reach the ofexport server at', socket_file + ':', e
+        status = 1
+    sys.stdout.flush ()
+    sys.exit (status)
@@ -0,0 +1,172 @@
+'''
+Copyright 2013 Paul Sidnell
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import os
+import codecs
+import json
+import select
+import signal
+import socket
+import traceback
+import logging
+import sys
+from export_client import FrameWriter, send_frame, STDOUT, STDERR, EXIT
+
+logging.basicConfig(format='%(asctime)-15s %(name)s %(levelname)s %(message)s', stream=sys.stdout)
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.ERROR)
+
+'''
+Keeps the database loaded, along with anything else that's worth doing
+once (the compiled templates, the saved reports and their plans, the word
+index), and runs
+exports sent to it over a unix socket by ofexport-client:
+
+    ofexport --serve ~/.ofexport/server.sock
+
+Before each request the files the model came from are checked and if
+any has changed since it was loaded everything is loaded again. Every
+request is run in a process forked from the server, the same as an
+output of a batch, so it gets the tree as loaded for nothing and its
+filters can do what they like to it without the server or any other
+request seeing. Several requests can run at once.
+'''
+
+MAX_REQUEST = 1024 * 1024
+
+def file_stamps (file_names):
+    # What changes when any of the files does
+    stamps = []
+    for file_name in file_names:
+        if os.path.exists (file_name):
+            stat = os.stat (file_name)
+            stamps.append ((file_name, stat.st_mtime, stat.st_size))
+        else:
+            stamps.append ((file_name, None, None))
+    return stamps
+
+def read_request (conn):
+    data = ''
+    while not '\n' in data:
+        chunk = conn.recv (4096)
+        assert len (chunk) > 0, 'incomplete request'
+        data += chunk
+        assert len (data) <= MAX_REQUEST, 'request too large'
+    request = json.loads (data[:data.index ('\n')])
+    return list (request['args']), request.get ('cwd')
+
+def run_request (conn, run, state):
+    # In the forked process, never returns
+    status = 1
+    try:
+        out = FrameWriter (conn, STDOUT)
+        sys.stdout = codecs.getwriter('utf8')(out)
+        sys.stderr = FrameWriter (conn, STDERR)
+        args, cwd = read_request (conn)
+        logger.info ('request: %s', args)
+        if cwd != None:
+            os.chdir (cwd)
+        run (args, state)
+        status = 0
+    except SystemExit as e:
+        status = e.code if isinstance (e.code, int) else 0
+    except:
+        traceback.print_exc (file=sys.stderr)
+    finally:
+        try:
+            send_frame (conn, EXIT, str (status))
+            conn.close ()
+        finally:
+            os._exit (status)
+
+class ExportServer(object):
+    def __init__ (self, socket_file, model_files, load, run):
+        '''
+        model_files () gives the files the state is loaded from, load ()
+        loads it and run (args, state) runs a request against it.
+        '''
+        self.socket_file = socket_file
+        self.model_files = model_files
+        self.load = load
+        self.run = run
+        self.state = None
+        self.stamps = None
+        self.running = set ()
+        self.requests = 0
+        self.loads = 0
+    def refresh (self):
+        stamps = file_stamps (self.model_files ())
+        if stamps != self.stamps:
+            logger.info ('loading: %s', ', '.join ([file_name for file_name, mtime, size in stamps]))
+            self.state = self.load ()
+            self.stamps = stamps
+            self.loads += 1
+    def reap (self):
+        while len (self.running) > 0:
+            pid, status = os.waitpid (-1, os.WNOHANG)
+            if pid == 0:
+                return
+            self.running.discard (pid)
+            if status != 0:
+                logger.info ('request %s failed', pid)
+    def listen (self):
+        if os.path.exists (self.socket_file):
+            # Left behind by a server that didn't get to tidy up
+            os.remove (self.socket_file)
+        listener = socket.socket (socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind (self.socket_file)
+        os.chmod (self.socket_file, 0600)
+        listener.listen (16)
+        return listener
+    def handle (self, listener):
+        conn, address = listener.accept ()
+        self.requests += 1
+        try:
+            self.refresh ()
+        except:
+            logger.error ('cannot load the model: %s', traceback.format_exc ())
+            send_frame (conn, STDERR, traceback.format_exc ())
+            send_frame (conn, EXIT, '1')
+            conn.close ()
+            return
+        sys.stdout.flush ()
+        sys.stderr.flush ()
+        pid = os.fork ()
+        if pid == 0:
+            listener.close ()
+            run_request (conn, self.run, self.state)
+        conn.close ()
+        self.running.add (pid)
+    def serve (self, max_requests=None):
+        self.refresh ()
+        listener = self.listen ()
+        previous = signal.signal (signal.SIGTERM, lambda signum, frame: sys.exit (0))
+        logger.info ('serving on %s', self.socket_file)
+        try:
+            while max_requests == None or self.requests < max_requests:
+                self.reap ()
+                readable, writable, errors = select.select ([listener], [], [], 1.0)
+                if len (readable) > 0:
+                    self.handle (listener)
+            while len (self.running) > 0:
+                pid, status = os.wait ()
+                self.running.discard (pid)
+        finally:
+            signal.signal (signal.SIGTERM, previous)
+            listener.close ()
+            if os.path.exists (self.socket_file):
+                os.remove (self.socket_file)
+            logger.info ('served %s requests, loaded %s times', self.requests, self.loads)
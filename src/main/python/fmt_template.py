@@ -14,9 +14,14 @@ See the License for the specific language governing permissions and
 limitations under the License.
 '''
 import os
+import json
+import hashlib
 from string import Template
-from treemodel import Visitor, traverse_list
+from treemodel import Visitor, traverse
+from typeof import instance_values
 import codecs
+from util import Memo
+from parallel_render import format_children
 import logging
 import sys
 
@@ -30,8 +35,38 @@ def load_resource (template_dir, name):
     instream.close ()
     return resource
 
+class CompiledTemplate(object):
+    '''
+    A string.Template turned into a % format string and the list of
+    placeholders it uses, so rendering is a single format operation.
+    Gives exactly what safe_substitute would, including leaving unknown
+    placeholders as they are.
+    '''
+    def __init__ (self, template):
+        fmt = []
+        self.fields = []
+        text = template.template
+        pos = 0
+        for match in template.pattern.finditer (text):
+            fmt.append (text[pos:match.start ()].replace ('%', '%%'))
+            pos = match.end ()
+            name = match.group ('named') or match.group ('braced')
+            if name != None:
+                fmt.append ('%s')
+                self.fields.append ((name, match.group ()))
+            elif match.group ('escaped') != None:
+                fmt.append (template.delimiter.replace ('%', '%%'))
+            else:
+                fmt.append (match.group ().replace ('%', '%%'))
+        fmt.append (text[pos:].replace ('%', '%%'))
+        self.fmt = type (text) ().join (fmt)
+        self.names = set ([name for name, original in self.fields])
+    def render (self, mapping):
+        return self.fmt % tuple ([mapping[name] if name in mapping else original for name, original in self.fields])
+
 class FmtTemplate:
     def __init__(self, data):
+        self.identity = hashlib.sha1 (json.dumps (data, sort_keys=True)).hexdigest ()
         self.preamble = None
         self.postamble = None
         self.indent_start = data['indent']
@@ -40,6 +75,12 @@ class FmtTemplate:
         self.nodes = {k:Template(v) for (k,v) in data['Nodes'].items()}
         self.node_attributes = {k:Template(v) for (k,v) in data['NodeAttributes'].items()}
         self.node_attribute_defaults = data['NodeAttributeDefaults']
+        self.compiled_nodes = {k:CompiledTemplate(v) for (k,v) in self.nodes.items()}
+        self.compiled_node_attributes = {k:CompiledTemplate(v) for (k,v) in self.node_attributes.items()}
+        # The only attributes worth building are the ones some line uses
+        self.used_attributes = set ()
+        for compiled in self.compiled_nodes.values ():
+            self.used_attributes |= compiled.names
         self.date_format = data['dateFormat']
         template_dir = os.environ['OFEXPORT_HOME'] + '/templates/'
         if 'preambleFile' in data:
@@ -60,11 +101,11 @@ class Formatter(Visitor):
                       'link'           : lambda x: x,
                       'status'         : lambda x: x,
                       'flagged'        : lambda x: str(x) if x else None,
-                      'context'        : lambda x: x.name,
-                      'project'        : lambda x: x.name,
-                      'date_to_start'  : lambda x: x.strftime(template.date_format),
-                      'date_due'       : lambda x: x.strftime(template.date_format),
-                      'date_completed' : lambda x: x.strftime(template.date_format),
+                      'context'        : Memo (lambda x: x.name),
+                      'project'        : Memo (lambda x: x.name),
+                      'date_to_start'  : memo_strftime (template.date_format),
+                      'date_due'       : memo_strftime (template.date_format),
+                      'date_completed' : memo_strftime (template.date_format),
                       'note'           : lambda x: x.get_note () + '\n'
                       }
         
@@ -153,23 +194,37 @@ class Formatter(Visitor):
                 print >>self.out, format_item (self.template, 'NoteLine', item.attribs['attrib_cache'])
     def update_attribs (self, item, link_type):
         if not 'attrib_cache' in item.attribs:
-            attribs = build_template_substitutions (item, self.attrib_conversions, self.template.node_attribute_defaults, self.template.node_attributes)
+            attribs = build_used_substitutions (item, self.attrib_conversions, self.template)
             item.attribs['attrib_cache'] = attribs
             attribs['depth'] = str (self.traversal_depth)
             attribs['indent'] = self.template.indent * (self.depth)
             self.add_extra_template_attribs(item, attribs)
     def add_extra_template_attribs (self, item, attribs):
         pass
+    def get_state (self):
+        # Everything that carries from one subtree's output to the next
+        return (self.depth, self.traversal_depth)
+    def set_state (self, state):
+        self.depth, self.traversal_depth = state
+    def log_conversion_stats (self):
+        for name, convert in sorted (self.attrib_conversions.items ()):
+            if isinstance (convert, Memo):
+                logger.info ('%s conversions: %s', name, convert.stats ())
         
+def memo_strftime (date_format):
+    # Lots of items share the same dates
+    return Memo (lambda x: x.strftime(date_format))
+
 def build_attrib_values (item, attrib_conversions):
     logger.debug ('building attribs for: %s', item.id)
     attrib_values = {}
-    for name in item.__dict__.keys():
+    values = instance_values (item)
+    for name in values.keys():
         if name in attrib_conversions:
             convert = attrib_conversions[name]
-            value = item.__dict__[name]
+            value = values[name]
             if value != None:
-                str_value = convert (item.__dict__[name])
+                str_value = convert (value)
                 if str_value != None:
                     attrib_values[name] = str_value
     return attrib_values
@@ -185,17 +240,44 @@ def build_template_substitutions (item, attrib_conversions, attrib_defaults, att
                 substitutions[tpl_key] = attrib_template.safe_substitute (value=value)
     return substitutions
 
+def build_used_substitutions (item, attrib_conversions, template):
+    # The same as build_template_substitutions but only for the attributes
+    # the template uses, so an unused note is never decoded
+    substitutions = {}
+    values = instance_values (item)
+    for name in template.used_attributes:
+        if name in template.node_attribute_defaults:
+            substitutions[name] = template.node_attribute_defaults[name]
+        if name in template.compiled_node_attributes and name in attrib_conversions:
+            value = values.get (name)
+            if value != None:
+                str_value = attrib_conversions[name] (value)
+                if str_value != None:
+                    substitutions[name] = template.compiled_node_attributes[name].render ({'value' : str_value})
+    return substitutions
+
 def build_entry (line_template, attributes):
     return line_template.safe_substitute(attributes)
 
 def format_item (template, node_type, attributes):
-    if node_type in template.nodes:
-        return build_entry (template.nodes[node_type], attributes)
+    if node_type in template.compiled_nodes:
+        return template.compiled_nodes[node_type].render (attributes)
     return None
 
-def format_document (root, formatter, project_mode):
+def format_document (root, formatter, project_mode, fragments=None, jobs=1):
     if formatter.template.preamble != None:
         print >>formatter.out, formatter.template.preamble
-    traverse_list (formatter, root.children, project_mode=project_mode)
+    flush_if_full = getattr (formatter.out, 'flush_if_full', None)
+    if fragments != None and project_mode and flush_if_full != None:
+        fragments.format_document (formatter, root)
+    elif jobs > 1:
+        format_children (root, formatter, project_mode, jobs)
+    else:
+        for child in root.children:
+            traverse (formatter, child, project_mode=project_mode)
+            if flush_if_full != None:
+                flush_if_full ()
     if formatter.template.postamble != None:
         print >>formatter.out, formatter.template.postamble
+    formatter.out.flush ()
+    formatter.log_conversion_stats ()
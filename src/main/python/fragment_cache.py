@@ -0,0 +1,172 @@
+'''
+Copyright 2013 Paul Sidnell
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import os
+import codecs
+import hashlib
+import json
+import logging
+import sys
+from treemodel import traverse, FOLDER, PROJECT
+from text_index import raw_note
+from util import hit_rate
+from help import VERSION
+
+logging.basicConfig(format='%(asctime)-15s %(name)s %(levelname)s %(message)s', stream=sys.stdout)
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.ERROR)
+
+'''
+The rendered text of folder and project subtrees, kept between runs so
+the subtrees that haven't changed are written straight from the cache
+rather than traversed and formatted again.
+
+A fragment is keyed by the formatter, the template, the filter plan, the
+formatter's state on entering the subtree (indent, depth and so on) and
+the subtree's latest dateModified. Nodes loaded from json or created by
+hand may have no dateModified, and renaming a context changes the lines
+of its tasks without touching them, so the key also has a digest of
+everything in the subtree that could change its text, including the
+marks left by the filters. Alongside the text goes the formatter's state
+on leaving the subtree, which is restored when the fragment is reused,
+and the keys of the fragments nested inside it so they're kept too.
+
+Only the project mode output of formatters writing to an OutputSink is
+cached, since that's where the text of a subtree can be picked out.
+'''
+
+DIGEST_FIELDS = ['link', 'status', 'flagged', 'next', 'date_to_start', 'date_due', 'date_completed', 'date_modified']
+
+def node_values (node, with_id):
+    values = [node.type, node.marked, node.name]
+    if with_id:
+        values.append (node.id)
+    for field in DIGEST_FIELDS:
+        values.append (node.__dict__.get (field))
+    for field in ['context', 'project']:
+        ref = node.__dict__.get (field)
+        values.append (None if ref == None else ref.name)
+    return repr (values) + raw_note (node)
+
+def latest (a, b):
+    if a == None:
+        return b
+    if b == None:
+        return a
+    return max (a, b)
+
+class FragmentCache(object):
+    def __init__ (self, file_name=None, plan_hash='', version=VERSION):
+        self.file_name = file_name
+        self.plan_hash = plan_hash
+        self.version = version
+        self.fragments = {}
+        self.used = []
+        self.digests = {}
+        self.hits = 0
+        self.misses = 0
+        if file_name != None and os.path.exists (file_name):
+            self.load ()
+    def load (self):
+        instream=codecs.open(self.file_name, 'r', 'utf-8')
+        try:
+            data = json.loads(instream.read())
+        except ValueError:
+            logger.error ('ignoring unreadable fragment cache: %s', self.file_name)
+            return
+        finally:
+            instream.close ()
+        if data.get ('version') != self.version:
+            logger.info ('discarding fragment cache from version %s', data.get ('version'))
+            return
+        self.fragments = {key : (text, tuple (state), nested) for (key, (text, state, nested)) in data['fragments'].items()}
+        logger.info ('loaded %s fragments from %s', len (self.fragments), self.file_name)
+    def save (self):
+        logger.info ('fragments: %s', self.stats ())
+        if self.file_name == None:
+            return
+        # Only keep what this run used, anything else is stale
+        fragments = {key : self.fragments[key] for key in set (self.used)}
+        logger.info ('saving %s fragments to %s', len (fragments), self.file_name)
+        tmp_file_name = self.file_name + '.tmp'
+        out=codecs.open(tmp_file_name, 'w', 'utf-8')
+        print >> out, json.dumps({'version' : self.version, 'fragments' : fragments}, sort_keys=True)
+        out.close ()
+        os.rename (tmp_file_name, self.file_name)
+    def stats (self):
+        return hit_rate (self.hits, self.misses)
+    def digest (self, node, with_id):
+        # (digest, latest dateModified) of a subtree, every node is only hashed
+        # once however deeply the folders nest
+        key = id (node)
+        if not key in self.digests:
+            hasher = hashlib.sha1 (node_values (node, with_id))
+            modified = node.date_modified
+            for child in node.children:
+                child_digest, child_modified = self.digest (child, with_id)
+                hasher.update (child_digest)
+                modified = latest (modified, child_modified)
+            self.digests[key] = (hasher.hexdigest (), modified)
+        return self.digests[key]
+    def fragment_key (self, formatter, node):
+        digest, modified = self.digest (node, 'id' in formatter.template.used_attributes)
+        parts = [formatter.__class__.__name__,
+                 formatter.template.identity,
+                 self.plan_hash,
+                 repr (formatter.get_state ()),
+                 str (modified),
+                 digest]
+        return hashlib.sha1 (u'\0'.join (parts).encode ('utf-8')).hexdigest ()
+    def format_document (self, formatter, root):
+        try:
+            for child in root.children:
+                self.traverse (formatter, child)
+                formatter.out.flush_if_full ()
+        finally:
+            self.digests = {}
+    def traverse (self, formatter, node):
+        if not node.marked or not node.type in (FOLDER, PROJECT):
+            traverse (formatter, node, project_mode=True)
+            return
+        key = self.fragment_key (formatter, node)
+        self.used.append (key)
+        if key in self.fragments:
+            self.hits += 1
+            text, state, nested = self.fragments[key]
+            formatter.out.write (text)
+            formatter.set_state (state)
+            self.used.extend (nested)
+            return
+        self.misses += 1
+        chunks = formatter.out.chunks
+        start = len (chunks)
+        used = len (self.used)
+        if node.type == FOLDER:
+            self.traverse_folder (formatter, node)
+        else:
+            traverse (formatter, node, project_mode=True)
+        self.fragments[key] = (u''.join (chunks[start:]), formatter.get_state (), self.used[used:])
+    def traverse_folder (self, formatter, folder):
+        # As traverse_folder () but with each child coming from the cache if it can
+        formatter.project_mode = True
+        formatter.begin_any (folder)
+        formatter.begin_folder (folder)
+        if folder.marked:
+            for child in folder.children:
+                formatter.project_mode = True
+                self.traverse (formatter, child)
+        formatter.end_folder (folder)
+        formatter.end_any (folder)
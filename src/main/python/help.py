@@ -14,7 +14,7 @@ def print_help ():
     print '  -I                 : include mode (as opposed to exclude mode)'
     print '  -E                 : exclude mode - the default (as opposed to include mode)'
     print '  -o file_name       : the output file name, must end in a recognised suffix - see documentation'
-    print '  -i file_name       : read file_name instead of the OmniFocus database, must be in json format'
+    print '  -i file_name       : read file_name instead of the OmniFocus database, must be json or .ofbin, see documentation'
     print '  -T template_name   : use the specified template instead of one derived from the output file extension'
     print '  --open             : open the output file with the registered application (if one is installed)'
     print '  -v                 : verbose output'
@@ -22,6 +22,21 @@ def print_help ():
     print '  -V level           : set the global log level (ERROR, INFO, DEBUG, TRACE)'
     print '  --log name=level   : set a logger to a particular level'
     print '  --debug arg        : set test options'
+    print '  --reports file     : read saved reports from file (default ~/.ofexport/reports.json)'
+    print '  --report name      : run the filters and options of a saved report'
+    print '  --index file       : keep a word index of names and notes in file to speed up name/note filters'
+    print '  --batch file       : load the database once and write all the outputs listed in file, see documentation'
+    print '  --serve socket     : keep the database loaded and run the exports sent by ofexport-client to socket, see documentation'
+    print '  --http port        : serve the reports over http on port (or host:port) with ETags, see documentation'
+    print '  --watch            : write the output (or the batch) again whenever the database changes, see documentation'
+    print '  --profile file     : write the wall and cpu time of each phase of the run to file, as json or a pstats dump by its suffix'
+    print '  --memory file      : write the memory each phase of the run took and what the model takes to file, see documentation'
+    print '  --split type       : write each top level folder, each project or each top level context (type) to its own file, see documentation'
+    print '  --jobs n           : render the output with n worker processes, for very large documents'
+    print '  --fragments file   : keep the rendered text of folders and projects in file so unchanged ones are not formatted again'
+    print '  --compact          : write json output without indentation or sorted keys'
+    print '  --feed file        : keep the events of ics output in file so unchanged ones are not formatted again, see documentation'
+    print '  --delta            : with --feed only write the events that changed and cancel the ones that have gone'
     print
     print 'filters:'
     print '  -a,--any expr        : filter tasks, projects, contexts and folders against the expression'
@@ -34,4 +49,5 @@ def print_help ():
     print '  See DOCUMENTATION.md for more information'
 
 SHORT_OPTS = 'h?CPIEo:i:T:vzV:a:t:p:f:c:'
-LONG_OPTS = ['help','open','log=','debug=','any=','task=','project=','folder=','context=','tasks']
+LONG_OPTS = ['help','open','log=','debug=','reports=','report=','index=','batch=','serve=','http=','watch','profile=','memory=','split=','jobs=','fragments=','compact','feed=','delta','any=','task=','project=','folder=','context=','tasks']
+VERSION = '2.1.6'
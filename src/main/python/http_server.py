@@ -0,0 +1,263 @@
+'''
+Copyright 2013 Paul Sidnell
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import os
+import gzip
+import hashlib
+import shutil
+import signal
+import tempfile
+import traceback
+import urllib
+import urlparse
+import logging
+import sys
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from StringIO import StringIO
+from collections import OrderedDict
+from datetime import datetime
+from export_server import file_stamps
+from watch import data_fingerprint
+
+logging.basicConfig(format='%(asctime)-15s %(name)s %(levelname)s %(message)s', stream=sys.stdout)
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.ERROR)
+
+'''
+Serves exports over http, for status boards and calendars that poll:
+
+    ofexport --http 8080
+
+The path names a saved report and the format, the query adds options,
+one letter names being the short ones:
+
+    http://localhost:8080/week.html
+    http://localhost:8080/week.ics?t=due%3Dtoday
+    http://localhost:8080/export.md?a=flagged&a=prune
+
+(export being no report at all). The database is loaded once, the same as
+for --serve, and every response carries an ETag made from a fingerprint
+of the data the server loaded, the day and the path and query. A client
+that sends the ETag back gets a 304 without anything being rendered, and
+rendered bodies are kept in memory until the data changes, so a board
+polling every few seconds costs a stat of the database files.
+'''
+
+DEFAULT_HOST = '127.0.0.1'
+EXPORT = 'export'
+MAX_CACHED = 64
+GZIP_MIN = 1024
+CONTENT_TYPES = {
+                 'html'     : 'text/html; charset=utf-8',
+                 'htm'      : 'text/html; charset=utf-8',
+                 'ics'      : 'text/calendar; charset=utf-8',
+                 'json'     : 'application/json; charset=utf-8',
+                 'md'       : 'text/markdown; charset=utf-8',
+                 'markdown' : 'text/markdown; charset=utf-8',
+                 'opml'     : 'text/x-opml; charset=utf-8',
+                 }
+
+def parse_address (arg):
+    # port or host:port, only this machine unless a host is given
+    if ':' in arg:
+        host, port = arg.rsplit (':', 1)
+        return host, int (port)
+    return DEFAULT_HOST, int (arg)
+
+def content_type (fmt):
+    if fmt in CONTENT_TYPES:
+        return CONTENT_TYPES[fmt]
+    if fmt == 'ofbin':
+        return 'application/octet-stream'
+    return 'text/plain; charset=utf-8'
+
+def request_args (path):
+    '''
+    The arguments and format for a request's path, or None if it doesn't
+    name an export.
+    '''
+    url = urlparse.urlparse (path)
+    name = urllib.unquote (url.path).decode ('utf-8').lstrip ('/')
+    if not '.' in name or '/' in name:
+        return None
+    name, fmt = name.rsplit ('.', 1)
+    if name == '' or fmt == '':
+        return None
+    args = [] if name == EXPORT else ['--report', name]
+    for key, value in urlparse.parse_qsl (url.query, keep_blank_values=True):
+        key = key.decode ('utf-8')
+        args.append ('-' + key if len (key) == 1 else '--' + key)
+        if value != '':
+            args.append (value.decode ('utf-8'))
+    return args, fmt
+
+def gzip_body (body):
+    buf = StringIO ()
+    # No time stamp, the same body always compresses the same
+    out = gzip.GzipFile (fileobj=buf, mode='wb', mtime=0)
+    out.write (body)
+    out.close ()
+    return buf.getvalue ()
+
+def render_body (render, args, fmt, state):
+    '''
+    Runs render (args, file_name, state) in a forked process, the filters
+    change the tree, and returns what it wrote or None if it failed.
+    '''
+    directory = tempfile.mkdtemp ()
+    try:
+        file_name = os.path.join (directory, EXPORT + '.' + fmt)
+        sys.stdout.flush ()
+        sys.stderr.flush ()
+        pid = os.fork ()
+        if pid == 0:
+            status = 1
+            try:
+                # The summary and logging aren't part of the response
+                devnull = os.open (os.devnull, os.O_WRONLY)
+                os.dup2 (devnull, 1)
+                render (args, file_name, state)
+                status = 0
+            except:
+                traceback.print_exc ()
+            finally:
+                sys.stdout.flush ()
+                sys.stderr.flush ()
+                os._exit (status)
+        pid, status = os.waitpid (pid, 0)
+        if status != 0 or not os.path.exists (file_name):
+            return None
+        instream = open (file_name, 'rb')
+        try:
+            return instream.read ()
+        finally:
+            instream.close ()
+    finally:
+        shutil.rmtree (directory)
+
+class ExportRequestHandler(BaseHTTPRequestHandler):
+    def do_GET (self):
+        self.respond (True)
+    def do_HEAD (self):
+        self.respond (False)
+    def respond (self, with_body):
+        exports = self.server.exports
+        exports.requests += 1
+        request = request_args (self.path)
+        if request == None:
+            self.send_error (404, 'not an export')
+            return
+        args, fmt = request
+        try:
+            exports.refresh ()
+        except:
+            logger.error ('cannot load the model: %s', traceback.format_exc ())
+            self.send_error (500, 'cannot load the model')
+            return
+        etag = exports.etag (self.path)
+        gzip_etag = etag[:-1] + '-gzip"'
+        if_none_match = [tag.strip () for tag in self.headers.get ('If-None-Match', '').split (',')]
+        if '*' in if_none_match or etag in if_none_match or gzip_etag in if_none_match:
+            self.send_response (304)
+            self.send_header ('ETag', gzip_etag if gzip_etag in if_none_match else etag)
+            self.end_headers ()
+            return
+        entry = exports.entry (etag, args, fmt)
+        if entry == None:
+            self.send_error (500, 'export failed')
+            return
+        body = entry[0]
+        compress = len (body) >= GZIP_MIN and 'gzip' in self.headers.get ('Accept-Encoding', '')
+        if compress:
+            if entry[1] == None:
+                entry[1] = gzip_body (body)
+            body = entry[1]
+            etag = gzip_etag
+        self.send_response (200)
+        self.send_header ('Content-Type', content_type (fmt))
+        self.send_header ('Content-Length', str (len (body)))
+        self.send_header ('ETag', etag)
+        self.send_header ('Cache-Control', 'no-cache')
+        self.send_header ('Vary', 'Accept-Encoding')
+        if compress:
+            self.send_header ('Content-Encoding', 'gzip')
+        self.end_headers ()
+        if with_body:
+            self.wfile.write (body)
+    def log_message (self, fmt, *args):
+        logger.info ('%s %s', self.address_string (), fmt % args)
+
+class HttpExportServer(object):
+    def __init__ (self, address, model_files, load, render, max_cached=MAX_CACHED):
+        '''
+        model_files () gives the files the state is loaded from, load ()
+        loads it and render (args, file_name, state) writes an export.
+        '''
+        self.address = address
+        self.model_files = model_files
+        self.load = load
+        self.render = render
+        self.max_cached = max_cached
+        self.state = None
+        self.stamps = None
+        self.fingerprint = None
+        # [body, gzipped body] by ETag, oldest first
+        self.bodies = OrderedDict ()
+        self.requests = 0
+        self.loads = 0
+        self.renders = 0
+    def refresh (self):
+        stamps = file_stamps (self.model_files ())
+        if stamps == self.stamps:
+            return
+        # Only the content counts, a touched file doesn't throw anything away
+        fingerprint = data_fingerprint ([file_name for file_name, mtime, size in stamps])
+        if fingerprint != self.fingerprint:
+            logger.info ('loading: %s', ', '.join ([file_name for file_name, mtime, size in stamps]))
+            self.state = self.load ()
+            self.fingerprint = fingerprint
+            self.bodies.clear ()
+            self.loads += 1
+        self.stamps = stamps
+    def etag (self, path):
+        # Relative dates in the filters move on at midnight
+        day = datetime.now ().strftime ('%Y-%m-%d')
+        return '"' + hashlib.sha1 ('\0'.join ([self.fingerprint, day, path])).hexdigest () + '"'
+    def entry (self, etag, args, fmt):
+        if etag in self.bodies:
+            return self.bodies[etag]
+        body = render_body (self.render, args, fmt, self.state)
+        if body == None:
+            return None
+        self.renders += 1
+        entry = [body, None]
+        self.bodies[etag] = entry
+        while len (self.bodies) > self.max_cached:
+            self.bodies.popitem (last=False)
+        return entry
+    def serve (self, max_requests=None):
+        self.refresh ()
+        httpd = HTTPServer (self.address, ExportRequestHandler)
+        httpd.exports = self
+        previous = signal.signal (signal.SIGTERM, lambda signum, frame: sys.exit (0))
+        logger.info ('serving on %s:%s', self.address[0], httpd.server_port)
+        try:
+            while max_requests == None or self.requests < max_requests:
+                httpd.handle_request ()
+        finally:
+            signal.signal (signal.SIGTERM, previous)
+            httpd.server_close ()
+            logger.info ('served %s requests, loaded %s times, rendered %s times', self.requests, self.loads, self.renders)
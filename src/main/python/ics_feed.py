@@ -0,0 +1,151 @@
+'''
+Copyright 2013 Paul Sidnell
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import os
+import codecs
+import hashlib
+import json
+import logging
+import sys
+from datetime import datetime
+from treemodel import traverse
+from fragment_cache import node_values
+from util import hit_rate
+from help import VERSION
+
+logging.basicConfig(format='%(asctime)-15s %(name)s %(levelname)s %(message)s', stream=sys.stdout)
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.ERROR)
+
+'''
+An ics file that calendar clients poll, kept up to date from run to run,
+e.g. "-o week.ics --feed ~/.ofexport/week.feed".
+
+The state file has the text of every event written last time, keyed by
+the item's OmniFocus persistentIdentifier (its id for items without one),
+which also becomes the event's UID so it's the same in every run. An
+event whose item hasn't changed is written straight from the state file
+without being prepared or formatted again. One that has changed is
+written afresh with its SEQUENCE one higher. LAST-MODIFIED comes from the
+item's dateModified.
+
+With --delta only the new and changed events are written, along with a
+cancellation for every event that has gone since the last run.
+'''
+
+DATE_FORMAT_UTC = "%Y%m%dT%H%M%SZ"
+OMNIFOCUS_LINK = 'omnifocus:///'
+
+def event_key (item):
+    # The persistentIdentifier outlives the run, the id of an item loaded from the database doesn't
+    if item.link != None and item.link.startswith (OMNIFOCUS_LINK):
+        return str (item.link.rsplit ('/', 1)[1])
+    return item.id
+
+def event_digest (item, as_group):
+    return hashlib.sha1 (repr (as_group) + node_values (item, False)).hexdigest ()
+
+class IcsFeed(object):
+    def __init__ (self, file_name=None, template_identity='', delta=False, version=VERSION):
+        self.file_name = file_name
+        self.template_identity = template_identity
+        self.delta = delta
+        self.version = version
+        self.events = {}
+        self.written = {}
+        self.pending = None
+        self.hits = 0
+        self.misses = 0
+        if file_name != None and os.path.exists (file_name):
+            self.load ()
+    def load (self):
+        instream=codecs.open(self.file_name, 'r', 'utf-8')
+        try:
+            data = json.loads(instream.read())
+        except ValueError:
+            logger.error ('ignoring unreadable feed state: %s', self.file_name)
+            return
+        finally:
+            instream.close ()
+        if data.get ('version') != self.version or data.get ('template') != self.template_identity:
+            logger.info ('discarding feed state from version %s', data.get ('version'))
+            return
+        self.events = {key : (digest, sequence, text) for (key, (digest, sequence, text)) in data['events'].items()}
+        logger.info ('loaded %s events from %s', len (self.events), self.file_name)
+    def save (self):
+        logger.info ('events: %s', self.stats ())
+        if self.file_name == None:
+            return
+        # Events that weren't written this run are gone
+        logger.info ('saving %s events to %s', len (self.written), self.file_name)
+        tmp_file_name = self.file_name + '.tmp'
+        out=codecs.open(tmp_file_name, 'w', 'utf-8')
+        print >> out, json.dumps({'version' : self.version, 'template' : self.template_identity, 'events' : self.written}, sort_keys=True)
+        out.close ()
+        os.rename (tmp_file_name, self.file_name)
+    def stats (self):
+        return hit_rate (self.hits, self.misses)
+    def reuse (self, formatter, item):
+        '''
+        Writes the item's event as it was last time if it hasn't changed
+        and returns True, otherwise returns False and the formatter has to
+        write it, then hand the text to rendered ().
+        '''
+        key = event_key (item)
+        digest = event_digest (item, formatter.project_mode and not formatter.is_empty (item))
+        if key in self.events and self.events[key][0] == digest:
+            self.hits += 1
+            self.written[key] = self.events[key]
+            if not self.delta:
+                formatter.out.write (self.events[key][2])
+            return True
+        self.misses += 1
+        sequence = self.events[key][1] + 1 if key in self.events else 0
+        self.pending = (key, digest, sequence)
+        return False
+    def uid (self, item):
+        return event_key (item)
+    def revision (self, item, utc):
+        lines = 'SEQUENCE:' + str (self.pending[2]) + '\n'
+        if item.date_modified != None:
+            lines += 'LAST-MODIFIED:' + utc (item.date_modified).strftime (DATE_FORMAT_UTC) + '\n'
+        return lines
+    def rendered (self, item, text):
+        key, digest, sequence = self.pending
+        self.pending = None
+        self.written[key] = (digest, sequence, text)
+    def write_cancelled (self, out, now=None):
+        now = now if now != None else datetime.utcnow ()
+        for key in sorted (set (self.events.keys ()) - set (self.written.keys ())):
+            logger.info ('cancelled: %s', key)
+            print >>out, 'BEGIN:VEVENT\nUID:%s\nSEQUENCE:%d\nDTSTAMP:%s\nSTATUS:CANCELLED\nEND:VEVENT' % (key, self.events[key][1] + 1, now.strftime (DATE_FORMAT_UTC))
+
+def format_feed (root, formatter, project_mode):
+    # As format_document () for a calendar formatter with a feed, and for a
+    # delta the cancellations at the end
+    feed = formatter.feed
+    assert getattr (formatter.out, 'chunks', None) != None, 'a feed has to be written through an OutputSink'
+    if formatter.template.preamble != None:
+        print >>formatter.out, formatter.template.preamble
+    for child in root.children:
+        traverse (formatter, child, project_mode=project_mode)
+        formatter.out.flush_if_full ()
+    if feed.delta:
+        feed.write_cancelled (formatter.out)
+    if formatter.template.postamble != None:
+        print >>formatter.out, formatter.template.postamble
+    formatter.out.flush ()
+    formatter.log_conversion_stats ()
@@ -0,0 +1,144 @@
+'''
+Copyright 2013 Paul Sidnell
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import os
+import sys
+import logging
+from treemodel import Node
+
+logging.basicConfig(format='%(asctime)-15s %(name)s %(levelname)s %(message)s', stream=sys.stdout)
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.ERROR)
+
+'''
+What a run's memory goes on, for "ofexport --memory memory.txt ...".
+
+This is python 2, so there's no tracemalloc to ask. Instead each phase
+of the run (see profiler.py) records how the resident size of the
+process changed, how far it pushed the high water mark up, and where
+the mark was when it finished. Python keeps hold of memory it has freed
+to use again, so what a phase retained is what it left the process
+holding, not what its own objects take.
+
+At the end the nodes of the model are sized with sys.getsizeof, each
+object counted once, and broken down by node type, by what the memory
+hangs off (the note, the attribs caches, the row the node was read
+from...) and by attribs key.
+'''
+
+# What the memory of a node is put down to, the first to reach an
+# object gets it, everything else is other. The node itself and its
+# instance dictionary are the node's.
+MEMBERS = ['note', 'attribs', 'directives', 'ofattribs', 'name', 'children']
+NODE = 'node'
+OTHER = 'other'
+
+def rss ():
+    # Bytes resident now, or None where there's no /proc
+    try:
+        instream = open ('/proc/self/statm')
+        try:
+            return int (instream.read ().split ()[1]) * os.sysconf ('SC_PAGE_SIZE')
+        finally:
+            instream.close ()
+    except (IOError, OSError, ValueError):
+        return None
+
+def high_water ():
+    # The most the process has ever had resident, in bytes
+    import resource
+    maxrss = resource.getrusage (resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+def deep_size (value, seen):
+    # Other nodes are counted as nodes, not as part of what refers to them
+    if id (value) in seen or isinstance (value, Node):
+        return 0
+    seen.add (id (value))
+    size = sys.getsizeof (value)
+    if isinstance (value, dict):
+        for key, val in value.iteritems ():
+            size += deep_size (key, seen) + deep_size (val, seen)
+    elif isinstance (value, (list, tuple, set, frozenset)):
+        for val in value:
+            size += deep_size (val, seen)
+    elif hasattr (value, '__dict__') and not isinstance (value, type):
+        size += deep_size (value.__dict__, seen)
+    return size
+
+def model_nodes (roots):
+    # Every node in the trees once, tasks are in both
+    nodes = {}
+    pending = list (roots)
+    while len (pending) > 0:
+        node = pending.pop ()
+        if not id (node) in nodes:
+            nodes[id (node)] = node
+            pending.extend (node.children)
+    return nodes.values ()
+
+def model_breakdown (nodes):
+    seen = set ()
+    types = {}
+    members = {}
+    attribs = {}
+    for node in nodes:
+        values = node.__dict__
+        size = sys.getsizeof (node) + sys.getsizeof (values)
+        seen.add (id (values))
+        members[NODE] = members.get (NODE, 0) + size
+        for member in MEMBERS + sorted ([key for key in values.keys () if not key in MEMBERS]):
+            if not member in values:
+                continue
+            value = values[member]
+            if member == 'attribs':
+                member_size = 0
+                if not id (value) in seen:
+                    seen.add (id (value))
+                    member_size = sys.getsizeof (value)
+                    for key, val in value.iteritems ():
+                        val_size = deep_size (val, seen)
+                        count, total = attribs.get (key, (0, 0))
+                        attribs[key] = (count + 1, total + val_size)
+                        member_size += val_size
+            elif member == 'children':
+                # The list, the children are nodes of their own
+                member_size = 0
+                if not id (value) in seen:
+                    seen.add (id (value))
+                    member_size = sys.getsizeof (value)
+            else:
+                member_size = deep_size (value, seen)
+            name = member if member in MEMBERS else OTHER
+            members[name] = members.get (name, 0) + member_size
+            size += member_size
+        count, total = types.get (node.type, (0, 0))
+        types[node.type] = (count + 1, total + size)
+    return {'types' : types, 'members' : members, 'attribs' : attribs}
+
+def write_breakdown (out, breakdown):
+    print >>out
+    print >>out, 'node type           count         KB'
+    for name, (count, size) in sorted (breakdown['types'].items ()):
+        print >>out, '%-15s %9d %10.1f' % (name, count, size / 1024.0)
+    print >>out
+    print >>out, 'held by'.ljust (34) + 'KB'
+    for name, size in sorted (breakdown['members'].items (), key=lambda item: -item[1]):
+        print >>out, '%-15s           %10.1f' % (name, size / 1024.0)
+    print >>out
+    print >>out, 'attribs key         count         KB'
+    for name, (count, size) in sorted (breakdown['attribs'].items (), key=lambda item: -item[1][1]):
+        print >>out, '%-15s %9d %10.1f' % (name, count, size / 1024.0)
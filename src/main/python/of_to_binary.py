@@ -0,0 +1,349 @@
+'''
+Copyright 2013 Paul Sidnell
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import mmap
+import struct
+import calendar
+import logging
+import sys
+from datetime import datetime, timedelta
+from treemodel import CONTEXT, PROJECT, TASK, FOLDER
+from of_to_json import JSONNote, new_node
+
+logging.basicConfig(format='%(asctime)-15s %(name)s %(levelname)s %(message)s', stream=sys.stdout)
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.ERROR)
+
+'''
+A compact binary form of what write_json writes, for moving a database
+to machines without OmniFocus and reading it back quickly with -i.
+
+    header   : magic, version
+    projects : the root folder's record
+    contexts : the root context's record
+    strings  : count, count+1 offsets into the utf-8 text that follows
+    index    : one entry per folder, project and context record
+    footer   : offsets of the projects, contexts, strings and index, magic
+
+Each record is its size (the node and all of its descendants, so whole
+subtrees can be skipped), kind and a bit mask of the fields present,
+then those fields in FIELDS order, then the number of child records
+that follow. Text is an index into the string table and dates are
+seconds since 1970. A task or project in a context is a REF record with
+just the id of the node it refers to.
+'''
+
+MAGIC = 'OFXB'
+VERSION = 1
+SUFFIX = 'ofbin'
+
+HEADER = struct.Struct ('<4sHH')
+FOOTER = struct.Struct ('<QQQQ4s')
+RECORD = struct.Struct ('<IBH')
+COUNT = struct.Struct ('<I')
+# Record offset, kind, entry index of the enclosing folder or context (or -1), name
+INDEX_ENTRY = struct.Struct ('<QBiI')
+NO_STRING = 0xffffffff
+
+KINDS = [FOLDER, CONTEXT, TASK, PROJECT]
+REF = len (KINDS)
+KIND_CODES = dict ([(kind, code) for code, kind in enumerate (KINDS)])
+INDEXED = [KIND_CODES[FOLDER], KIND_CODES[CONTEXT], KIND_CODES[PROJECT]]
+
+STRING = 'string'
+DATE = 'date'
+BOOL = 'bool'
+INT = 'int'
+NOTE = 'note'
+CODES = {STRING : 'I', DATE : 'q', BOOL : '?', INT : 'q'}
+FIELDS = [('id', STRING), ('link', STRING), ('status', STRING), ('name', STRING),
+          ('date_completed', DATE), ('date_to_start', DATE), ('date_due', DATE), ('date_modified', DATE),
+          ('flagged', BOOL), ('next', BOOL), ('order', INT), ('note', NOTE)]
+NOTE_BIT = 1 << (len (FIELDS) - 1)
+ID_BIT = 1
+
+EPOCH = datetime (1970, 1, 1)
+
+class BinaryWriter(object):
+    def __init__ (self, out):
+        self.out = out
+        self.pos = 0
+        self.strings = {}
+        self.string_list = []
+        self.index = []
+        # Everything written from the project tree, contexts refer to these
+        self.written = set ()
+    def write (self, data):
+        self.out.write (data)
+        self.pos += len (data)
+    def string (self, value):
+        i = self.strings.get (value)
+        if i == None:
+            i = len (self.string_list)
+            self.strings[value] = i
+            self.string_list.append (value)
+        return i
+    def fields (self, item):
+        # As save_attrib picks them for json
+        values = item.__dict__
+        mask = 0
+        fmt = '<'
+        data = []
+        note_lines = None
+        for bit, (attrib, field_type) in enumerate (FIELDS):
+            value = values.get (attrib)
+            if value == None:
+                continue
+            mask |= 1 << bit
+            if field_type == STRING:
+                data.append (self.string (value))
+            elif field_type == DATE:
+                data.append (calendar.timegm (value.timetuple ()))
+            elif field_type == NOTE:
+                note_lines = value.get_note_lines ()
+                continue
+            else:
+                data.append (value)
+            fmt += CODES[field_type]
+        body = struct.pack (fmt, *data)
+        if note_lines != None:
+            body += COUNT.pack (len (note_lines)) + struct.pack ('<%dI' % len (note_lines), *[self.string (line) for line in note_lines])
+        return mask, body
+    def children (self, item, project_mode):
+        for child in item.children:
+            if child.marked:
+                if project_mode or child.type == CONTEXT:
+                    yield child
+                elif child in self.written:
+                    yield None, child
+    def record (self, item, project_mode, offset, parent_entry):
+        # The chunks of item's record and its descendants, and their size
+        kind = KIND_CODES[item.type]
+        entry = parent_entry
+        if kind in INDEXED:
+            entry = len (self.index)
+            self.index.append ([offset, kind, parent_entry, self.string (item.name) if item.name != None else NO_STRING])
+        if project_mode:
+            self.written.add (item)
+        mask, body = self.fields (item)
+        children = list (self.children (item, project_mode))
+        chunks = [None, body, COUNT.pack (len (children))]
+        size = RECORD.size + len (body) + COUNT.size
+        for child in children:
+            if isinstance (child, tuple):
+                chunks.append (self.ref (child[1]))
+                size += len (chunks[-1])
+            else:
+                child_chunks, child_size = self.record (child, project_mode, offset + size, entry)
+                chunks.extend (child_chunks)
+                size += child_size
+        chunks[0] = RECORD.pack (size, kind, mask)
+        return chunks, size
+    def ref (self, item):
+        body = COUNT.pack (self.string (item.id)) + COUNT.pack (0)
+        return RECORD.pack (RECORD.size + len (body), REF, ID_BIT) + body
+    def write_tree (self, root, project_mode):
+        # The root is written a top level subtree at a time, its own size is left as 0
+        offset = self.pos
+        kind = KIND_CODES[root.type]
+        if project_mode:
+            self.written.add (root)
+        mask, body = self.fields (root)
+        children = list (self.children (root, project_mode))
+        self.write (RECORD.pack (0, kind, mask) + body + COUNT.pack (len (children)))
+        for child in children:
+            if isinstance (child, tuple):
+                self.write (self.ref (child[1]))
+            else:
+                chunks, size = self.record (child, project_mode, self.pos, -1)
+                self.write (''.join (chunks))
+        return offset
+    def write_strings (self):
+        offset = self.pos
+        encoded = [value.encode ('utf-8') if isinstance (value, unicode) else value for value in self.string_list]
+        offsets = [0]
+        for value in encoded:
+            offsets.append (offsets[-1] + len (value))
+        self.write (COUNT.pack (len (encoded)))
+        self.write (struct.pack ('<%dI' % len (offsets), *offsets))
+        self.write (''.join (encoded))
+        return offset
+    def write_index (self):
+        offset = self.pos
+        self.write (COUNT.pack (len (self.index)))
+        self.write (''.join ([INDEX_ENTRY.pack (*entry) for entry in self.index]))
+        return offset
+    def write_model (self, root_project, root_context):
+        self.write (HEADER.pack (MAGIC, VERSION, 0))
+        projects = self.write_tree (root_project, True)
+        contexts = self.write_tree (root_context, False)
+        # The index comes before the strings so the last entry's name is in the table
+        index = self.write_index ()
+        strings = self.write_strings ()
+        self.write (FOOTER.pack (projects, contexts, strings, index, MAGIC))
+
+def write_binary (file_name, root_project, root_context):
+    root_project.marked = True
+    root_context.marked = True
+    out = open (file_name, 'wb')
+    try:
+        writer = BinaryWriter (out)
+        writer.write_model (root_project, root_context)
+    finally:
+        out.close ()
+    logger.info ('wrote %s: %s bytes, %s strings', file_name, writer.pos, len (writer.string_list))
+
+# The struct and converters for each combination of fields present
+layouts = {}
+
+def field_layout (mask):
+    layout = layouts.get (mask)
+    if layout == None:
+        fmt = '<'
+        names = []
+        for bit, (attrib, field_type) in enumerate (FIELDS):
+            if mask & (1 << bit) and field_type != NOTE:
+                fmt += CODES[field_type]
+                names.append ((attrib, field_type))
+        layout = (struct.Struct (fmt), names)
+        layouts[mask] = layout
+    return layout
+
+class BinaryModel(object):
+    '''
+    A memory mapped binary file. Strings are decoded the first time a
+    node that uses them is read.
+    '''
+    def __init__ (self, file_name):
+        instream = open (file_name, 'rb')
+        try:
+            self.data = mmap.mmap (instream.fileno (), 0, access=mmap.ACCESS_READ)
+        finally:
+            instream.close ()
+        magic, version, reserved = HEADER.unpack_from (self.data, 0)
+        assert magic == MAGIC, file_name + ' is not an ofexport binary file'
+        assert version == VERSION, file_name + ' is binary version ' + str (version) + ', expected ' + str (VERSION)
+        self.projects, self.contexts, strings, self.index_offset, magic = FOOTER.unpack_from (self.data, len (self.data) - FOOTER.size)
+        assert magic == MAGIC, file_name + ' is truncated'
+        count = COUNT.unpack_from (self.data, strings)[0]
+        self.string_offsets = struct.unpack_from ('<%dI' % (count + 1), self.data, strings + COUNT.size)
+        self.text_offset = strings + COUNT.size + 4 * (count + 1)
+        self.strings = [None] * count
+    def close (self):
+        self.data.close ()
+    def string (self, i):
+        value = self.strings[i]
+        if value == None:
+            value = self.data[self.text_offset + self.string_offsets[i]:self.text_offset + self.string_offsets[i + 1]].decode ('utf-8')
+            self.strings[i] = value
+        return value
+    def name (self, i):
+        return self.string (i) if i != NO_STRING else None
+    def index (self):
+        # (offset, kind, enclosing entry, name) for each folder, project and context
+        count = COUNT.unpack_from (self.data, self.index_offset)[0]
+        offset = self.index_offset + COUNT.size
+        return [INDEX_ENTRY.unpack_from (self.data, offset + i * INDEX_ENTRY.size) for i in xrange (count)]
+    def read_record (self, offset):
+        # The record's kind, converted values, child count and the offset of the first child
+        size, kind, mask = RECORD.unpack_from (self.data, offset)
+        layout, names = field_layout (mask)
+        offset += RECORD.size
+        node_values = {}
+        for (attrib, field_type), value in zip (names, layout.unpack_from (self.data, offset)):
+            if field_type == STRING:
+                value = self.string (value)
+            elif field_type == DATE:
+                value = EPOCH + timedelta (seconds=value)
+            node_values[attrib] = value
+        offset += layout.size
+        if mask & NOTE_BIT:
+            count = COUNT.unpack_from (self.data, offset)[0]
+            lines = struct.unpack_from ('<%dI' % count, self.data, offset + COUNT.size)
+            node_values['note'] = JSONNote ([self.string (line) for line in lines])
+            offset += COUNT.size + 4 * count
+        return kind, node_values, COUNT.unpack_from (self.data, offset)[0], offset + COUNT.size
+    def read_tree (self, offset, item_db, partial=False):
+        # Depth first without recursion, a node is made once all its children
+        # are. Refs to nodes that weren't read are left out of a partial read.
+        kind, node_values, count, offset = self.read_record (offset)
+        stack = [[kind, node_values, count, []]]
+        while True:
+            frame = stack[-1]
+            if frame[2] > 0:
+                frame[2] -= 1
+                kind, node_values, child_count, offset = self.read_record (offset)
+                if kind == REF:
+                    item = item_db.get (node_values['id'])
+                    assert item != None or partial, 'missing node in ' + KINDS[frame[0]] + ': ' + node_values['id']
+                    if item != None:
+                        frame[3].append (item)
+                else:
+                    stack.append ([kind, node_values, child_count, []])
+            else:
+                stack.pop ()
+                item = new_node (KINDS[frame[0]], frame[1], frame[3], item_db)
+                if len (stack) == 0:
+                    return item
+                stack[-1][3].append (item)
+    def find_subtrees (self, wanted_fn):
+        '''
+        The offsets of the folders and projects wanted_fn (type, name) wants
+        and of the folders on the way to them.
+        '''
+        index = self.index ()
+        wanted = set ()
+        path = set ()
+        for offset, kind, parent, name in index:
+            if offset < self.contexts and KINDS[kind] in (FOLDER, PROJECT) and wanted_fn (KINDS[kind], self.name (name)):
+                wanted.add (offset)
+                while parent != -1 and not index[parent][0] in path:
+                    path.add (index[parent][0])
+                    parent = index[parent][2]
+        logger.info ('reading %s of %s folders and projects', len (wanted), len ([entry for entry in index if entry[0] < self.contexts]))
+        return wanted, path
+    def read_partial (self, offset, wanted, path, item_db):
+        # The node at offset with just the children that are wanted or lead to one that is
+        kind, node_values, count, child_offset = self.read_record (offset)
+        children = []
+        for i in xrange (count):
+            if child_offset in wanted:
+                children.append (self.read_tree (child_offset, item_db))
+            elif child_offset in path:
+                children.append (self.read_partial (child_offset, wanted, path, item_db))
+            child_offset += RECORD.unpack_from (self.data, child_offset)[0]
+        return new_node (KINDS[kind], node_values, children, item_db)
+
+def read_binary (file_name, wanted_fn=None):
+    '''
+    With a wanted_fn only the subtrees of the folders and projects for
+    which wanted_fn (type, name) is true are read, along with the folders
+    that contain them and the whole context tree. The rest of the project
+    tree is skipped over without being decoded.
+    '''
+    model = BinaryModel (file_name)
+    try:
+        item_db = {}
+        if wanted_fn == None:
+            root_project = model.read_tree (model.projects, item_db)
+            root_context = model.read_tree (model.contexts, item_db)
+        else:
+            wanted, path = model.find_subtrees (wanted_fn)
+            root_project = model.read_partial (model.projects, wanted, path, item_db)
+            root_context = model.read_tree (model.contexts, item_db, partial=True)
+    finally:
+        model.close ()
+    return root_project, root_context
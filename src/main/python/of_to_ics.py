@@ -15,7 +15,9 @@ limitations under the License.
 '''
 
 from datetime import datetime, timedelta
-from fmt_template import Formatter
+from fmt_template import Formatter, memo_strftime
+from util import Memo
+from directives import directive_attribs
 import time
 import logging
 import sys
@@ -28,19 +30,22 @@ DATE_FORMAT_LONG = "%Y%m%dT%H%M00Z"
 DATE_FORMAT_SHORT = "%Y%m%d"
 
 class PrintCalendarVisitor(Formatter):
-    def __init__ (self, out, template):
+    def __init__ (self, out, template, feed=None):
         self.current_item = None
+        self.utc = UtcConverter ()
+        self.feed = feed
+        self.reused = set ()
         attrib_conversions = {
                       'id'             : lambda x: x,
                       'name'           : lambda x: x,
                       'link'           : lambda x: x,
                       'status'         : lambda x: x,
                       'flagged'        : lambda x: str(x) if x else None,
-                      'context'        : lambda x: x.name,
-                      'project'        : lambda x: x.name,
-                      'date_to_start'  : lambda x: format_date(self.current_item,x, False),
-                      'date_due'       : lambda x: format_date(self.current_item, x, True),
-                      'date_completed' : lambda x: x.strftime(DATE_FORMAT_LONG),
+                      'context'        : Memo (lambda x: x.name),
+                      'project'        : Memo (lambda x: x.name),
+                      'date_to_start'  : lambda x: format_date(self.current_item, x, False, self.utc),
+                      'date_due'       : lambda x: format_date(self.current_item, x, True, self.utc),
+                      'date_completed' : memo_strftime (DATE_FORMAT_LONG),
                       'note'           : lambda x: '\\r'.join(x.get_note_lines ())
                       }
         Formatter.__init__(self, out, template, attrib_conversions = attrib_conversions)
@@ -54,29 +59,47 @@ class PrintCalendarVisitor(Formatter):
     def end_folder (self, folder):
         pass
     def begin_project (self, project):
-        fix_dates(project)
-        load_note_attribs (project)
         if project.date_due != None or project.date_to_start != None:
-            fix_dates(project)
-            load_note_attribs (project)
-            Formatter.begin_project(self, project)
+            self.begin_event (project, Formatter.begin_project)
     def end_project (self, project):
         if project.date_due != None or project.date_to_start != None:
-            Formatter.end_project(self, project)
+            self.end_event (project, Formatter.end_project)
     def begin_task (self, task):
         if task.date_due != None or task.date_to_start != None:
-            fix_dates(task)
-            load_note_attribs (task)
-            Formatter.begin_task(self, task)
+            self.begin_event (task, Formatter.begin_task)
     def end_task (self, task):
         if task.date_due != None or task.date_to_start != None:
-            Formatter.end_task(self, task)
+            self.end_event (task, Formatter.end_task)
+    def begin_event (self, item, begin):
+        if self.feed != None and self.feed.reuse (self, item):
+            # Written from the feed, but the depths still have to add up
+            self.reused.add (id (item))
+            self.set_state ((self.depth + 1, self.traversal_depth + 1))
+            return
+        fix_dates(item)
+        load_note_attribs (item)
+        if self.feed == None:
+            begin (self, item)
+            return
+        start = len (self.out.chunks)
+        begin (self, item)
+        self.feed.rendered (item, u''.join (self.out.chunks[start:]))
+    def end_event (self, item, end):
+        if id (item) in self.reused:
+            self.reused.remove (id (item))
+            self.set_state ((self.depth - 1, self.traversal_depth - 1))
+        else:
+            end (self, item)
     def begin_context (self, context):
         pass
     def end_context (self, context):
         pass
     def add_extra_template_attribs (self, item, attribs):
         item.attribs['attrib_cache']['alarm'] = format_alarm (item)
+        if self.feed != None:
+            attribs['revision'] = self.feed.revision (item, self.utc)
+            if 'id' in attribs and 'id' in self.template.compiled_node_attributes:
+                attribs['id'] = self.template.compiled_node_attributes['id'].render ({'value' : self.feed.uid (item)})
     
 def fix_dates (item):
     if item.date_to_start == None and item.date_due == None:
@@ -88,16 +111,7 @@ def fix_dates (item):
 
 def load_note_attribs (item):
     if item.note != None:
-        for line in item.note.get_note_lines ():
-            if line.strip().startswith('%of'):
-                bits = line.split()
-                if len(bits) >= 3 and bits[1] == 'cal':
-                    for flag in bits[2:]:
-                        bits2 = flag.split('=')
-                        if len(bits2) == 2:
-                            item.attribs[bits2[0]] = bits2[1]
-                        else:
-                            item.attribs[flag] = True
+        item.attribs.update (directive_attribs (item, 'cal'))
         if 'onstart' in item.attribs:
             item.date_due = item.date_to_start
         if 'ondue' in item.attribs:
@@ -124,7 +138,7 @@ def load_note_attribs (item):
             logger.error ("problem parsing cal directives in %s %s", item.id, item.name)
             item.date_to_start = item.date_due
                     
-def format_date (item, the_date, is_due_date):
+def format_date (item, the_date, is_due_date, to_utc=None):
     if 'allday' in item.attribs:
         # Make all day - must have no hms in format
         #DTSTART;VALUE=DATE:20020923
@@ -135,13 +149,40 @@ def format_date (item, the_date, is_due_date):
         # NO UTC CONVERSION - it happens on the day we asked for - no adjustment required
         return the_date.strftime(DATE_FORMAT_SHORT) 
     
-    the_date = utc (the_date)   
+    the_date = utc (the_date) if to_utc == None else to_utc (the_date)
     return the_date.strftime(DATE_FORMAT_LONG)
 
 def utc (the_date):
     epoch_second = time.mktime(the_date.timetuple())
     return datetime.utcfromtimestamp(epoch_second)
 
+class UtcConverter (object):
+    '''
+    utc (the_date) for a run of dates, remembering the local offset from
+    UTC of each day it sees so that most dates cost an addition rather than
+    a mktime. A day where the offset changes (when the clocks go forward or
+    back) isn't remembered, its dates take the long way round. So do dates
+    with a timezone of their own.
+    '''
+    def __init__ (self):
+        self.offsets = {}
+    def day_offset (self, day):
+        start = datetime (day.year, day.month, day.day)
+        offsets = set ([utc (the_date) - the_date for the_date in [start, start + timedelta (hours=12), start + timedelta (hours=23, minutes=59, seconds=59)]])
+        return offsets.pop () if len (offsets) == 1 else None
+    def __call__ (self, the_date):
+        if the_date.tzinfo != None:
+            return utc (the_date)
+        day = the_date.date ()
+        if day in self.offsets:
+            offset = self.offsets[day]
+        else:
+            offset = self.day_offset (day)
+            self.offsets[day] = offset
+        if offset == None:
+            return utc (the_date)
+        return the_date.replace (microsecond=0) + offset
+
 def format_alarm (item):
     if "noalarm" in item.attribs:
         return ""
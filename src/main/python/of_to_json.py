@@ -14,10 +14,16 @@ See the License for the specific language governing permissions and
 limitations under the License.
 '''
 
+import os
+import re
 import json
 import codecs
+import uuid
+from json.decoder import scanstring
 from datetime import datetime
-from treemodel import Visitor, Context, Project, Task, Folder, Note, CONTEXT, PROJECT, TASK, FOLDER
+from treemodel import Context, Project, Task, Folder, Note, CONTEXT, PROJECT, TASK, FOLDER
+from typeof import created
+from util import strip_tabs_newlines
 
 TIME_FMT = "%Y-%m-%d %H:%M:%S"
 
@@ -40,55 +46,96 @@ def get_note_lines (x):
         return None
     return x.get_note_lines()
 
-class ConvertStructureToJsonVisitor(Visitor):
-    def begin_any (self, item):
-        if self.is_in_applicable_mode (item) and not 'json_data' in item.attribs:
-            node_json_data =  {}
-            save_attrib (item, 'id', node_json_data, lambda x : x)
-            save_attrib (item, 'link', node_json_data, lambda x : x)
-            save_attrib (item, 'status', node_json_data, lambda x : x)
-            save_attrib (item, 'name', node_json_data, lambda x : x)
-            save_attrib (item, 'type', node_json_data, lambda x : x)
-            save_attrib (item, 'date_completed', node_json_data, lambda x: x.strftime (TIME_FMT))
-            save_attrib (item, 'date_to_start', node_json_data, lambda x: x.strftime (TIME_FMT))
-            save_attrib (item, 'date_due', node_json_data, lambda x: x.strftime (TIME_FMT))
-            save_attrib (item, 'flagged', node_json_data, lambda x : x)
-            save_attrib (item, 'next', node_json_data, lambda x : x)
-            save_attrib (item, 'note', node_json_data, lambda x : get_note_lines (x))
-            save_attrib (item, 'order', node_json_data, lambda x : x)
-            item.attribs['json_data'] = node_json_data
-    def end_task (self, item):
-        self.add_children(item)
-    def end_project (self, item):
-        self.add_children(item)
-    def end_folder (self, item):
-        self.add_children(item)
-    def end_context (self, item):
-        children_json_data = []
+def node_json_data (item):
+    node_json_data =  {}
+    save_attrib (item, 'id', node_json_data, lambda x : x)
+    save_attrib (item, 'link', node_json_data, lambda x : x)
+    save_attrib (item, 'status', node_json_data, lambda x : x)
+    save_attrib (item, 'name', node_json_data, lambda x : x)
+    save_attrib (item, 'type', node_json_data, lambda x : x)
+    save_attrib (item, 'date_completed', node_json_data, lambda x: x.strftime (TIME_FMT))
+    save_attrib (item, 'date_to_start', node_json_data, lambda x: x.strftime (TIME_FMT))
+    save_attrib (item, 'date_due', node_json_data, lambda x: x.strftime (TIME_FMT))
+    save_attrib (item, 'date_modified', node_json_data, lambda x: x.strftime (TIME_FMT))
+    save_attrib (item, 'flagged', node_json_data, lambda x : x)
+    save_attrib (item, 'next', node_json_data, lambda x : x)
+    save_attrib (item, 'note', node_json_data, lambda x : get_note_lines (x))
+    save_attrib (item, 'order', node_json_data, lambda x : x)
+    return node_json_data
+
+class JsonWriter(object):
+    '''
+    Writes the two trees a node at a time rather than building the whole
+    document as dicts first. By default the output is byte for byte what
+    json.dumps (..., sort_keys=True, indent=2) gives, compact drops the
+    indentation and the key sorting.
+    '''
+    def __init__ (self, out, compact=False):
+        self.out = out
+        self.compact = compact
+        self.item_separator = ',' if compact else ', '
+        self.key_separator = ':' if compact else ': '
+        self.flush_if_full = getattr (out, 'flush_if_full', lambda : None)
+        # Everything written from the project tree, contexts refer to these
+        self.written = set ()
+    def newline (self, level):
+        if self.compact:
+            return ''
+        return '\n' + '  ' * level
+    def write_value (self, value, level):
+        if self.compact:
+            self.out.write (json.dumps (value, separators=(',', ':')))
+        else:
+            self.out.write (json.dumps (value, sort_keys=True, indent=2).replace ('\n', self.newline (level)))
+    def write_list (self, writers, level):
+        if len (writers) == 0:
+            self.out.write ('[]')
+            return
+        self.out.write ('[')
+        separator = ''
+        for writer in writers:
+            self.out.write (separator + self.newline (level + 1))
+            writer (level + 1)
+            separator = self.item_separator
+        self.out.write (self.newline (level) + ']')
+    def write_node (self, item, children, level):
+        attribs = node_json_data (item)
+        keys = attribs.keys ()
+        if self.compact:
+            keys.append ('children')
+        else:
+            keys = sorted (keys + ['children'])
+        self.out.write ('{')
+        separator = ''
+        for key in keys:
+            self.out.write (separator + self.newline (level + 1) + json.dumps (key) + self.key_separator)
+            if key == 'children':
+                self.write_list (children, level + 1)
+            else:
+                self.write_value (attribs[key], level + 1)
+            separator = self.item_separator
+        self.out.write (self.newline (level) + '}')
+        self.flush_if_full ()
+    def write_project_node (self, item, level):
+        self.written.add (item)
+        children = [self.writer (self.write_project_node, child) for child in item.children if child.marked]
+        self.write_node (item, children, level)
+    def write_context_node (self, item, level):
+        children = []
         for child in item.children:
-            if child.marked and 'json_data' in child.attribs:
-                child_json_data = child.attribs['json_data']
+            if child.marked:
                 if child.type == CONTEXT:
-                    children_json_data.append(child_json_data)
-                else:
+                    children.append (self.writer (self.write_context_node, child))
+                elif child in self.written:
                     # The name is just a debugging aid
-                    children_json_data.append({'ref' : child.id, 'name' : child.name })
-        item.attribs['json_data']['children'] = children_json_data
-    def is_in_applicable_mode (self, item):
-        # Project ,ode items are written first,
-        # Contexts second with refs to tasks/projects
-        if self.project_mode:
-            return item.type in (FOLDER, PROJECT, TASK)
-        else:
-            return item.type == CONTEXT
-    def add_children (self, item):
-        if self.is_in_applicable_mode (item):
-            children_json_data = []
-            for child in item.children:
-                if child.marked:
-                    child_json_data = child.attribs['json_data']
-                    children_json_data.append(child_json_data)
-            item.attribs['json_data']['children'] = children_json_data
+                    children.append (self.writer (self.write_value, {'ref' : child.id, 'name' : child.name }))
+        self.write_node (item, children, level)
+    def writer (self, write, item):
+        return lambda level: write (item, level)
+    def write (self, root_project, root_context):
+        self.write_list ([self.writer (self.write_project_node, root_project),
+                          self.writer (self.write_context_node, root_context)], 0)
+        self.out.write ('\n')
 
 class JSONNote (Note):
     def __init__ (self, lines):
@@ -121,6 +168,7 @@ def load_from_json (json_data, item_db):
     load_attrib (item, 'date_completed', json_data, lambda x: datetime.strptime (x, TIME_FMT))
     load_attrib (item, 'date_to_start', json_data, lambda x: datetime.strptime (x, TIME_FMT))
     load_attrib (item, 'date_due', json_data, lambda x: datetime.strptime (x, TIME_FMT))
+    load_attrib (item, 'date_modified', json_data, lambda x: datetime.strptime (x, TIME_FMT))
     load_attrib (item, 'flagged', json_data, lambda x: x)
     load_attrib (item, 'next', json_data, lambda x: x)
     load_attrib (item, 'note', json_data, lambda x: JSONNote (x))
@@ -133,15 +181,225 @@ def load_from_json (json_data, item_db):
     item_db[item_id] = item
     return item
 
-def read_json (file_name):
-    instream=codecs.open(file_name, 'r', 'utf-8')
-    json_data = json.loads(instream.read())
-    instream.close ()
-    
-    item_db = {}
-    root_project = load_from_json (json_data[0], item_db)
-    root_context = load_from_json (json_data[1], item_db)
+def write_json (out, root_project, root_context, compact=False):
+    root_project.marked = True
+    root_context.marked = True
+    JsonWriter (out, compact=compact).write (root_project, root_context)
+    out.flush ()
 
+def parse_time (text):
+    # TIME_FMT is fixed width so slicing it is far quicker than strptime,
+    # anything else goes the long way round
+    if len (text) == 19 and text[4] == '-' and text[7] == '-' and text[10] == ' ' and text[13] == ':' and text[16] == ':':
+        try:
+            return datetime (int (text[0:4]), int (text[5:7]), int (text[8:10]), int (text[11:13]), int (text[14:16]), int (text[17:19]))
+        except ValueError:
+            pass
+    return datetime.strptime (text, TIME_FMT)
+
+NODE_CLASSES = {FOLDER : Folder, CONTEXT : Context, TASK : Task, PROJECT : Project}
+NODE_TYPES = dict ([(node_class, node_type) for node_type, node_class in NODE_CLASSES.items ()])
+
+# What each constructor leaves in a new node, less the children, attribs and id
+NODE_DEFAULTS = {
+    FOLDER : {},
+    CONTEXT : {},
+    TASK : {'flagged' : False, 'next' : False, 'context' : None, 'date_completed' : None, 'date_to_start' : None, 'date_due' : None, 'note' : None},
+    PROJECT : {'flagged' : False, 'context' : None, 'date_completed' : None, 'date_to_start' : None, 'date_due' : None, 'note' : None, 'status' : unicode (None)}
+    }
+for defaults in NODE_DEFAULTS.values ():
+    defaults.update ({'name' : strip_tabs_newlines (None), 'parent' : None, 'marked' : True, 'link' : None, 'order' : 0})
+
+PLAIN_ATTRIBS = frozenset (['id', 'link', 'status', 'name', 'flagged', 'next', 'order'])
+DATE_ATTRIBS = frozenset (['date_completed', 'date_to_start', 'date_due', 'date_modified'])
+
+def new_node (item_type, node_values, children, item_db):
+    '''
+    The node load_from_json would make from values already converted from
+    the file, with its children already made. The values are set straight
+    into the node's __dict__, as load_attrib does, rather than one type
+    checked attribute at a time through the constructor.
+    '''
+    node_class = NODE_CLASSES[item_type]
+    item = node_class.__new__ (node_class)
+    created (item)
+    values = item.__dict__
+    item_type = NODE_TYPES[node_class]
+    values.update (NODE_DEFAULTS[item_type])
+    values['type'] = item_type
+    values['attribs'] = {}
+    values['children'] = children
+    values.update (node_values)
+    if not 'id' in values:
+        values['id'] = str (uuid.uuid1 ())
+    # As add_child would
+    if item_type == CONTEXT:
+        for child in children:
+            child.__dict__['context' if child.type != CONTEXT else 'parent'] = item
+    else:
+        for child in children:
+            child.__dict__['parent'] = item
+    item_db[values['id']] = item
+    return item
+
+def make_node (json_data, children, item_db):
+    if 'ref' in json_data:
+        return item_db[json_data['ref']]
+    node_values = {}
+    for attrib, value in json_data.iteritems ():
+        if attrib in PLAIN_ATTRIBS:
+            node_values[attrib] = value
+        elif attrib in DATE_ATTRIBS:
+            node_values[attrib] = parse_time (value)
+        elif attrib == 'note':
+            node_values[attrib] = JSONNote (value)
+    return new_node (json_data['type'], node_values, children, item_db)
+
+def load_tree (json_data, item_db):
+    # Depth first without recursion, a node is made once all its children are
+    if 'ref' in json_data:
+        return make_node (json_data, None, item_db)
+    stack = [(json_data, iter (json_data['children']), [])]
+    while True:
+        node_data, child_data_iter, children = stack[-1]
+        for child_data in child_data_iter:
+            if 'ref' in child_data:
+                children.append (make_node (child_data, None, item_db))
+            else:
+                stack.append ((child_data, iter (child_data['children']), []))
+                break
+        else:
+            stack.pop ()
+            item = make_node (node_data, children, item_db)
+            if len (stack) == 0:
+                return item
+            stack[-1][2].append (item)
+
+WHITESPACE = re.compile (r'[ \t\n\r]*')
+
+class JsonTokens(object):
+    '''
+    Reads json a block at a time, so only the block being parsed is in
+    memory rather than the whole file and every object in it.
+    '''
+    def __init__ (self, instream, block_size=64 * 1024):
+        self.instream = instream
+        self.block_size = block_size
+        self.scan_once = json.JSONDecoder ().scan_once
+        self.buf = u''
+        self.pos = 0
+    def fill (self):
+        data = self.instream.read (self.block_size)
+        if len (data) == 0:
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+    def peek (self):
+        while True:
+            self.pos = WHITESPACE.match (self.buf, self.pos).end ()
+            if self.pos < len (self.buf):
+                return self.buf[self.pos]
+            if not self.fill ():
+                return ''
+    def expect (self, char):
+        found = self.peek ()
+        assert found == char, 'expected ' + char + ' but found ' + repr (found) + ' in json'
+        self.pos += 1
+    def string (self):
+        assert self.peek () == '"', 'expected a string in json'
+        while True:
+            try:
+                value, self.pos = scanstring (self.buf, self.pos + 1)
+                return value
+            except ValueError:
+                # Probably just cut off at the end of the block
+                if not self.fill ():
+                    raise
+    def value (self):
+        # A value small enough to read whole, reading more of the file
+        # until the block has all of it
+        self.peek ()
+        while True:
+            try:
+                value, end = self.scan_once (self.buf, self.pos)
+                # A number at the very end of the block may have more digits
+                if end < len (self.buf) or not self.fill ():
+                    break
+            except (ValueError, StopIteration):
+                if not self.fill ():
+                    raise ValueError ('unexpected ' + repr (self.buf[self.pos:self.pos + 20]) + ' in json')
+        self.pos = end
+        return value
+    def whole_object (self):
+        # The next object if it's all in the block already, or None
+        self.peek ()
+        try:
+            value, end = self.scan_once (self.buf, self.pos)
+        except (ValueError, StopIteration):
+            return None
+        self.pos = end
+        return value
+
+def stream_trees (tokens, item_db):
+    '''
+    As load_tree for each tree in the list being read, but making nodes
+    as the json is read. A subtree that's all in the block read so far is
+    parsed in one go, the rest a token at a time.
+    '''
+    trees = []
+    tokens.expect ('[')
+    # The node's json, its children and whether they're being read
+    stack = [[None, trees, True]]
+    while True:
+        frame = stack[-1]
+        node_data, children, in_children = frame
+        char = tokens.peek ()
+        if in_children:
+            if char == ',':
+                tokens.expect (',')
+            elif char == ']':
+                tokens.expect (']')
+                if len (stack) == 1:
+                    return trees
+                frame[2] = False
+            else:
+                child_data = tokens.whole_object ()
+                if child_data != None:
+                    children.append (load_tree (child_data, item_db))
+                else:
+                    tokens.expect ('{')
+                    stack.append ([{}, [], False])
+        elif char == ',':
+            tokens.expect (',')
+        elif char == '}':
+            tokens.expect ('}')
+            stack.pop ()
+            stack[-1][1].append (make_node (node_data, children, item_db))
+        else:
+            key = tokens.string ()
+            tokens.expect (':')
+            if key == 'children':
+                tokens.expect ('[')
+                frame[2] = True
+            else:
+                node_data[key] = tokens.value ()
+
+# Bigger than this and the file is parsed as it's read
+STREAM_SIZE = 128 * 1024 * 1024
+
+def read_json (file_name, stream=None):
+    if stream == None:
+        stream = os.path.getsize (file_name) > STREAM_SIZE
+    instream=codecs.open(file_name, 'r', 'utf-8')
+    try:
+        item_db = {}
+        if stream:
+            root_project, root_context = stream_trees (JsonTokens (instream), item_db)
+        else:
+            json_data = json.loads(instream.read())
+            root_project = load_tree (json_data[0], item_db)
+            root_context = load_tree (json_data[1], item_db)
+    finally:
+        instream.close ()
     return root_project, root_context
-    
-    
\ No newline at end of file
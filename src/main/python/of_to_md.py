@@ -73,3 +73,8 @@ class PrintMarkdownVisitor(Formatter):
             Formatter.handle_note (self, item)
     def add_extra_template_attribs (self, item, attribs):
         attribs['hashes'] = '#' * (self.header_depth+1) + ' '
+    def get_state (self):
+        return Formatter.get_state (self) + (self.header_depth, self.last_line_was_text)
+    def set_state (self, state):
+        Formatter.set_state (self, state[:2])
+        self.header_depth, self.last_line_was_text = state[2:]
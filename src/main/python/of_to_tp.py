@@ -14,7 +14,8 @@ See the License for the specific language governing permissions and
 limitations under the License.
 '''
 
-from fmt_template import Formatter
+from fmt_template import Formatter, memo_strftime
+from util import Memo
 from string import replace
 
 def remove_trailing_colon (x):
@@ -32,11 +33,11 @@ class PrintTaskpaperVisitor(Formatter):
                       'link'           : lambda x: x,
                       'status'         : lambda x: x,
                       'flagged'        : lambda x: str(x) if x else None,
-                      'context'        : lambda x: strip_brackets(''.join (x.name.split ())),
-                      'project'        : lambda x: strip_brackets(''.join (x.name.split ())),
-                      'date_to_start'  : lambda x: x.strftime(template.date_format),
-                      'date_due'       : lambda x: x.strftime(template.date_format),
-                      'date_completed' : lambda x: x.strftime(template.date_format),
+                      'context'        : Memo (lambda x: strip_brackets(''.join (x.name.split ()))),
+                      'project'        : Memo (lambda x: strip_brackets(''.join (x.name.split ()))),
+                      'date_to_start'  : memo_strftime (template.date_format),
+                      'date_due'       : memo_strftime (template.date_format),
+                      'date_completed' : memo_strftime (template.date_format),
                       'note'           : lambda x: ''.join([line+'\n' for line in x.get_note_lines ()])
                       }
         Formatter.__init__(self, out, template, attrib_conversions=attrib_conversions)
\ No newline at end of file
@@ -19,6 +19,9 @@ import codecs
 import getopt
 import sys
 import json
+import hashlib
+import multiprocessing
+import time
 from treemodel import traverse, Visitor, FOLDER, CONTEXT, PROJECT, TASK
 from omnifocus import build_model, find_database
 from datetime import date, datetime
@@ -28,13 +31,28 @@ from of_to_md import PrintMarkdownVisitor
 from of_to_opml import PrintOpmlVisitor
 from of_to_html import PrintHtmlVisitor
 from of_to_ics import PrintCalendarVisitor
-from of_to_json import ConvertStructureToJsonVisitor, read_json
+from of_to_json import write_json, read_json
+from of_to_binary import write_binary, read_binary
+import of_to_binary
+from output_sink import open_sink
 from help import print_help, SHORT_OPTS, LONG_OPTS
 from fmt_template import FmtTemplate, format_document
-from cmd_parser import make_filter
+from cmd_parser import compile_filter_plan, SharedExpressions
+from saved_queries import DEFAULT_REPORTS_FILE, PlanCache, load_reports, expand_reports, plan_cache_file
 import logging
 import cmd_parser
-from visitors import Tasks
+from visitors import Tasks, Filter
+from columnar import Columns, ColumnarFilter, vectorizable
+import columnar
+from text_index import build_index
+from fragment_cache import FragmentCache
+from ics_feed import IcsFeed, format_feed
+from split_output import split_subjects, write_shards
+from batch import load_batch, uses_reports, describe_output, run_batch
+from export_server import ExportServer
+from http_server import HttpExportServer, parse_address
+from watch import watch
+from profiler import phase, run_profiled, model_loaded
 
 logging.basicConfig(format='%(asctime)-15s %(name)s %(levelname)s %(message)s', stream=sys.stdout)
 logger = logging.getLogger(__name__)
@@ -48,7 +66,21 @@ LOGGER_NAMES = [
                 'treemodel',
                 'omnifocus',
                 'fmt_template',
-                'of_to_ics']
+                'of_to_ics',
+                'saved_queries',
+                'columnar',
+                'text_index',
+                'fragment_cache',
+                'parallel_render',
+                'split_output',
+                'batch',
+                'of_to_binary',
+                'ics_feed',
+                'export_server',
+                'http_server',
+                'watch',
+                'profiler',
+                'memory_report']
 
 class SummaryVisitor (Visitor):
     def __init__ (self):
@@ -74,11 +106,36 @@ class SummaryVisitor (Visitor):
             logger.info (k + ' ' + str(v))
         logger.info ('----------------')
 
+FORMATS = [
+           (('txt', 'text'), 'text', PrintTextVisitor),
+           (('md', 'markdown', 'ft', 'foldingtext'), 'markdown', PrintMarkdownVisitor),
+           (('tp', 'taskpaper'), 'taskpaper', PrintTaskpaperVisitor),
+           (('opml',), 'opml', PrintOpmlVisitor),
+           (('html', 'htm'), 'html', PrintHtmlVisitor),
+           (('ics',), 'ics', PrintCalendarVisitor)
+           ]
+
+def find_format (fmt):
+    # The default template and formatter for a file suffix
+    for suffixes, template_name, visitor_class in FORMATS:
+        if fmt in suffixes:
+            return template_name, visitor_class
+    return None, None
+
+# Compiled templates by file name, with the modification time of the file
+# they came from, so a server only compiles them again when they change
+TEMPLATES = {}
+
 def load_template (template_dir, name):
+    file_name = template_dir + name + '.json'
+    mtime = os.path.getmtime (file_name)
+    if file_name in TEMPLATES and TEMPLATES[file_name][0] == mtime:
+        return TEMPLATES[file_name][1]
     logger.info ('loading template: %s', name)
-    instream=codecs.open(template_dir + name + '.json', 'r', 'utf-8')
+    instream=codecs.open(file_name, 'r', 'utf-8')
     template = FmtTemplate (json.loads(instream.read()))
     instream.close ()
+    TEMPLATES[file_name] = (mtime, template)
     return template
 
 def fix_abbrieviated_expr (typ, arg):
@@ -104,38 +161,245 @@ def fix_abbrieviated_expr (typ, arg):
     logger.debug ("adapted argument: '%s'", result)
     return result
 
+def filter_expr (opt, arg):
+    if opt in ('--project', '-p'):
+        return fix_abbrieviated_expr(PROJECT, arg)
+    elif opt in ('--task', '-t'):
+        return fix_abbrieviated_expr(TASK, arg)
+    elif opt in ('--context', '-c'):
+        return fix_abbrieviated_expr(CONTEXT, arg)
+    elif opt in ('--folder', '-f'):
+        return fix_abbrieviated_expr(FOLDER, arg)
+    elif opt in ('--any', '-a'):
+        return fix_abbrieviated_expr('any', arg)
+    return None
+
+def filter_plan_hash (opts):
+    # Everything in the options that decides what the filters leave marked
+    filter_opts = [(opt, arg) for opt, arg in opts if filter_expr (opt, arg) != None or opt in ('--tasks', '-C', '-P', '-I', '-E')]
+    return hashlib.sha1 (repr (filter_opts)).hexdigest ()
+
+def apply_filters (opts, root_project, root_context, plan_cache=None, text_index=None):
+    if plan_cache == None:
+        plan_cache = PlanCache ()
+    
+    # Plan the whole chain up front so sub-expressions shared between
+    # filters are only evaluated once per node
+    plans = {}
+    shared = SharedExpressions ()
+    with phase ('plan'):
+        for opt, arg in opts:
+            expr_str = filter_expr (opt, arg)
+            if expr_str != None and not expr_str in plans:
+                plans[expr_str] = plan_cache.get_plan (expr_str)
+            if expr_str != None:
+                shared.register (plans[expr_str])
+    
+    columns = None
+    if columnar.AVAILABLE:
+        columns = Columns ()
+    
+    subject = root_project
+    project_mode = True
+    include = True
+    try:
+        for opt, arg in opts:
+            logger.debug ("executing option %s : %s", opt, arg)
+            visitor = None
+            expr_str = filter_expr (opt, arg)
+            if expr_str != None:
+                plan = plans[expr_str]
+                if columns != None and plan[0] == 'filter' and vectorizable (plan[1]):
+                    visitor = ColumnarFilter (columns, plan, include, cmd_parser.now ())
+                else:
+                    visitor = compile_filter_plan (plan, include, shared=shared, index=text_index)
+            elif opt in ('--tasks'):
+                visitor = Tasks (root_project, root_context)
+            elif '-C' == opt:
+                logger.info ('context mode')
+                subject = root_context
+            elif '-P' == opt:
+                logger.info ('project mode')
+                subject = root_project
+            elif '-I' == opt:
+                logger.info ('include mode')
+                include = True
+            elif '-E' == opt:
+                include = False
+                logger.info ('exclude mode')
+            
+            logger.debug ("created filter %s", visitor)
+            if visitor != None:
+                logger.info ('running filter %s', visitor)
+                with phase ('filter ' + opt + ' ' + arg):
+                    if isinstance (visitor, ColumnarFilter):
+                        visitor.run (subject)
+                    else:
+                        traverse (visitor, subject, project_mode=project_mode)
+                        if columns != None and not isinstance (visitor, Filter):
+                            # It may have changed the shape of the tree
+                            columns.invalidate ()
+    finally:
+        shared.clear ()
+    logger.info ('common sub-expressions: %s', shared)
+    return subject
+
+class NameOnly (object):
+    # Just enough of a node for an expression on its type and name
+    def __init__ (self, node_type, name):
+        self.type = node_type
+        self.name = name
+
+def plan_fields (plan, fields):
+    kind = plan[0]
+    if kind == cmd_parser.PLAN_FIELD:
+        fields.add (plan[1])
+    elif kind == cmd_parser.PLAN_NOT:
+        plan_fields (plan[1], fields)
+    elif kind in (cmd_parser.PLAN_AND, cmd_parser.PLAN_OR, cmd_parser.PLAN_EQ, cmd_parser.PLAN_NE):
+        plan_fields (plan[1], fields)
+        plan_fields (plan[2], fields)
+    return fields
+
+def is_type_test (plan):
+    # type=Folder or type=Project
+    return (plan[0] == cmd_parser.PLAN_EQ and plan[1] == (cmd_parser.PLAN_FIELD, 'type') and
+            plan[2][0] == cmd_parser.PLAN_TEXT and plan[2][1] in (FOLDER, PROJECT))
+
+def first_filter_subtrees (opts, plan_cache=None):
+    '''
+    When the first filter includes folders or projects on their name alone,
+    e.g. -f "=Work", it leaves nothing marked outside the ones it matches
+    and the folders on the way to them, so the rest needn't be loaded.
+    Returns a function of a folder or project's type and name that says
+    if the filter matches it, or None if everything has to be loaded.
+    '''
+    for opt, arg in opts:
+        expr_str = filter_expr (opt, arg)
+        if expr_str == None:
+            if opt in ('-C', '-E', '--tasks'):
+                return None
+            continue
+        plan = (plan_cache if plan_cache != None else PlanCache ()).get_plan (expr_str)
+        if plan[0] != 'filter':
+            return None
+        expr = plan[1]
+        if expr[0] != cmd_parser.PLAN_AND or not (is_type_test (expr[1]) or is_type_test (expr[2])):
+            return None
+        if not plan_fields (expr, set ()) <= set (['type', 'name']):
+            return None
+        logger.info ('loading only what matches %s', expr_str)
+        match = cmd_parser.compile_plan (expr, cmd_parser.now ())
+        return lambda node_type, name: match (NameOnly (node_type, name))
+    return None
+
 def set_debug_opt (name, value):
     if name== 'now' : 
         the_time = datetime.strptime (value, "%Y-%m-%d")
         cmd_parser.the_time = the_time
 
-if __name__ == "__main__":
-    sys.stdout = codecs.getwriter('utf8')(sys.stdout)
-    
-    today = date.today ()
-    time_fmt='%Y-%m-%d'
+def export (opts, root_project, root_context, plan_cache=None, text_index=None):
+    # Filter and write a single output
     opn=False
     project_mode=True
     file_name = None
-    infile = None
     template = None
     template_dir = os.environ['OFEXPORT_HOME'] + '/templates/'
-    include = True
-    
-    opts, args = getopt.optlist, args = getopt.getopt(sys.argv[1:],SHORT_OPTS, LONG_OPTS)
+    fragments_file = None
+    jobs = 1
+    jobs_opt = False
+    split_by = None
+    compact = False
+    feed_file = None
+    delta = False
     
-    assert len (args) == 0, "unexpected arguments: " + str (args)
-        
     for opt, arg in opts:
         if '--open' == opt:
             opn = True
         elif '-o' == opt:
             file_name = arg
-        elif '-i' == opt:
-            infile = arg
+        elif '--fragments' == opt:
+            fragments_file = arg
+        elif '--jobs' == opt:
+            jobs = int (arg)
+            jobs_opt = True
+        elif '--split' == opt:
+            split_by = arg
+        elif '--compact' == opt:
+            compact = True
+        elif '--feed' == opt:
+            feed_file = arg
+        elif '--delta' == opt:
+            delta = True
         elif '-T' == opt:
             template = load_template (template_dir, arg)
-        elif '-v' == opt:
+    
+    if file_name == None:
+        fmt = 'txt'
+    else:
+        assert file_name.find ('.') != -1, "filename has no suffix"
+        dot = file_name.index ('.')
+        fmt = file_name[dot+1:]
+    
+    subject = apply_filters (opts, root_project, root_context, plan_cache=plan_cache, text_index=text_index)
+    if plan_cache != None:
+        plan_cache.save ()
+            
+    logger.info ('Generating: %s', file_name)
+    
+    with phase ('render'):
+        if fmt == 'json':
+            # json has intrinsic formatting - no template required
+            assert split_by == None, 'json output can\'t be split'
+            out = open_sink (file_name)
+            write_json (out, root_project, root_context, compact=compact)
+            out.close ()
+        elif fmt == of_to_binary.SUFFIX:
+            assert split_by == None, 'binary output can\'t be split'
+            assert file_name != None, 'binary output must go to a file'
+            write_binary (file_name, root_project, root_context)
+        else:
+            template_name, visitor_class = find_format (fmt)
+            if template_name == None:
+                raise Exception ('unknown format ' + fmt)
+            template = template if template != None else load_template (template_dir, template_name)
+            if split_by != None:
+                assert file_name != None, 'the output must go to files to split it'
+                subjects = split_subjects (root_project, root_context, split_by)
+                write_shards (subjects, file_name, lambda out: visitor_class (out, template), jobs if jobs_opt else multiprocessing.cpu_count ())
+                opn = False
+            elif feed_file != None:
+                assert visitor_class == PrintCalendarVisitor, 'only ics output can be a feed'
+                feed = IcsFeed (feed_file, template.identity, delta=delta)
+                out = open_sink (file_name)
+                format_feed (subject, visitor_class (out, template, feed=feed), project_mode)
+                out.close()
+                feed.save ()
+            else:
+                assert not delta, '--delta needs a --feed'
+                fragments = None
+                if fragments_file != None and fmt != 'ics':
+                    fragments = FragmentCache (fragments_file, filter_plan_hash (opts))
+                out = open_sink (file_name)
+                visitor = visitor_class (out, template)
+                format_document (subject, visitor, project_mode, fragments=fragments, jobs=jobs)
+                out.close()
+                if fragments != None:
+                    fragments.save ()
+    if file_name != None:
+        if opn:
+            os.system("open '" + file_name + "'")
+        
+    with phase ('summary'):
+        visitor = SummaryVisitor ()
+        traverse (visitor, root_project, project_mode=True)
+        traverse (visitor, root_context, project_mode=False)
+        visitor.print_counts()
+
+def set_run_opts (opts):
+    # Logging, debugging and help, for a run or a request to a server
+    for opt, arg in opts:
+        if '-v' == opt:
             for logname in LOGGER_NAMES:
                 logging.getLogger(logname).setLevel (logging.INFO)
         elif '-V' == opt:
@@ -162,107 +426,197 @@ if __name__ == "__main__":
         elif opt in ('-?', '-h', '--help'):
             print_help ()
             sys.exit()
+
+def model_files (infile):
+    # What the model is loaded from, the database has a write ahead log alongside
+    if infile != None:
+        return [infile]
+    db = find_database ()
+    return [db, db + '-wal']
+
+def load_model (infile, wanted_fn=None):
+    with phase ('load'):
+        if infile != None:
+            if os.path.splitext (infile)[1] == '.' + of_to_binary.SUFFIX:
+                return read_binary (infile, wanted_fn=wanted_fn)
+            return read_json (infile)
+        return build_model (find_database ())
+
+SERVER_OPTS = ['-i', '--index', '--batch', '--reports', '--serve', '--http', '--watch', '--profile', '--memory']
+
+# The server says where an http response goes
+HTTP_OPTS = SERVER_OPTS + ['-o', '--open', '--split', '--feed', '--delta', '--fragments']
+
+def template_files ():
+    template_dir = os.environ['OFEXPORT_HOME'] + '/templates/'
+    return [template_dir + template_name + '.json' for suffixes, template_name, visitor_class in FORMATS]
+
+def load_server_state (infile, index_file, reports_file):
+    root_project, root_context = load_model (infile)
+    for suffixes, template_name, visitor_class in FORMATS:
+        load_template (os.environ['OFEXPORT_HOME'] + '/templates/', template_name)
+    text_index = None
+    if index_file != None:
+        text_index = build_index ([root_project, root_context], index_file)
+    reports = None
+    plan_cache = PlanCache ()
+    if os.path.exists (reports_file):
+        reports = load_reports (reports_file)
+        plan_cache = PlanCache (plan_cache_file (reports_file))
+        # Plan every report here, the requests only read the cache
+        for name in reports.keys ():
+            for opt, arg in expand_reports ([('--report', name)], reports):
+                expr_str = filter_expr (opt, arg)
+                if expr_str != None:
+                    plan_cache.get_plan (expr_str)
+        plan_cache.save ()
+    return root_project, root_context, reports, plan_cache, text_index
+
+def request_opts (args, reports, server_opts):
+    opts, extra = getopt.getopt(args, SHORT_OPTS, LONG_OPTS)
+    assert len (extra) == 0, "unexpected arguments: " + str (extra)
+    for opt, arg in opts:
+        assert not opt in server_opts, opt + ' applies to the whole server, not a request'
+    if '--report' in [opt for opt, arg in opts]:
+        assert reports != None, 'the server has no reports'
+        opts = expand_reports (opts, reports)
+    return opts
+
+def serve_request (args, state):
+    # One export for the server, in a process of its own
+    root_project, root_context, reports, plan_cache, text_index = state
+    opts = request_opts (args, reports, SERVER_OPTS)
+    cmd_parser.NOW = datetime.now ()
+    set_run_opts (opts)
+    export (opts, root_project, root_context, plan_cache=plan_cache, text_index=text_index)
+
+def http_request (args, file_name, state):
+    # One export for the http server, in a process of its own
+    root_project, root_context, reports, plan_cache, text_index = state
+    opts = request_opts (args, reports, HTTP_OPTS)
+    # A report may name its own output file, the response goes here instead
+    opts = [(opt, arg) for opt, arg in opts if not opt in ('-o', '--open')] + [('-o', file_name)]
+    cmd_parser.NOW = datetime.now ()
+    set_run_opts (opts)
+    export (opts, root_project, root_context, plan_cache=plan_cache, text_index=text_index)
+
+def run_outputs (opts, outputs, infile, index_file, plan_cache, jobs):
+    # Load the model and write the output, or all of a batch's outputs.
+    # Returns how long each took.
+    start = time.time ()
+    wanted_fn = None
+    if outputs == None and index_file == None and infile != None:
+        # Only one set of filters and no index to keep up to date
+        wanted_fn = first_filter_subtrees (opts, plan_cache)
+    root_project, root_context = load_model (infile, wanted_fn=wanted_fn)
+    model_loaded ([root_project, root_context])
     
-    if file_name == None:
-        fmt = 'txt'
+    text_index = None
+    if index_file != None:
+        with phase ('index'):
+            text_index = build_index ([root_project, root_context], index_file)
+    loaded = time.time ()
+    
+    if outputs == None:
+        export (opts, root_project, root_context, plan_cache=plan_cache, text_index=text_index)
     else:
-        assert file_name.find ('.') != -1, "filename has no suffix"
-        dot = file_name.index ('.')
-        fmt = file_name[dot+1:]
+        if plan_cache != None:
+            # Plan everything here, the outputs only read the cache
+            for output in outputs:
+                for opt, arg in output:
+                    expr_str = filter_expr (opt, arg)
+                    if expr_str != None:
+                        plan_cache.get_plan (expr_str)
+            plan_cache.save ()
+        with phase ('batch'):
+            failed = run_batch (outputs, lambda output: export (output, root_project, root_context, plan_cache=plan_cache, text_index=text_index),
+                                jobs if jobs != None else multiprocessing.cpu_count ())
+        assert len (failed) == 0, 'failed outputs: ' + ', '.join ([describe_output (outputs[i]) for i in failed])
+    return [('load', loaded - start), ('export', time.time () - loaded)]
+
+if __name__ == "__main__":
+    sys.stdout = codecs.getwriter('utf8')(sys.stdout)
     
-    if infile != None:
-        root_project, root_context = read_json (infile)
-    else:    
-        root_project, root_context = build_model (find_database ())
+    infile = None
+    reports_file = DEFAULT_REPORTS_FILE
+    plan_cache = None
+    index_file = None
+    batch_file = None
+    batch_jobs = None
+    serve_file = None
+    http_address = None
+    watching = False
+    profile_file = None
+    memory_file = None
+    
+    opts, args = getopt.optlist, args = getopt.getopt(sys.argv[1:],SHORT_OPTS, LONG_OPTS)
+    
+    assert len (args) == 0, "unexpected arguments: " + str (args)
     
-    subject = root_project
-        
     for opt, arg in opts:
-        logger.debug ("executing option %s : %s", opt, arg)
-        visitor = None
-        if opt in ('--project', '-p'):
-            fixed_arg = fix_abbrieviated_expr(PROJECT, arg)
-            visitor = make_filter (fixed_arg, include)
-        elif opt in ('--task', '-t'):
-            fixed_arg = fix_abbrieviated_expr(TASK, arg)
-            visitor = make_filter (fixed_arg, include)
-        elif opt in ('--context', '-c'):
-            fixed_arg = fix_abbrieviated_expr(CONTEXT, arg)
-            visitor = make_filter (fixed_arg, include)
-        elif opt in ('--folder', '-f'):
-            fixed_arg = fix_abbrieviated_expr(FOLDER, arg)
-            visitor = make_filter (fixed_arg, include)
-        elif opt in ('--any', '-a'):
-            visitor = make_filter (fix_abbrieviated_expr('any', arg), include)
-        elif opt in ('--tasks'):
-            visitor = Tasks (root_project, root_context)
-        elif '-C' == opt:
-            logger.info ('context mode')
-            subject = root_context
-        elif '-P' == opt:
-            logger.info ('project mode')
-            subject = root_project
-        elif '-I' == opt:
-            logger.info ('include mode')
-            include = True
-        elif '-E' == opt:
-            include = False
-            logger.info ('exclude mode')
+        if '--reports' == opt:
+            reports_file = arg
+    if '--report' in [opt for opt, arg in opts]:
+        opts = expand_reports (opts, load_reports (reports_file))
+        plan_cache = PlanCache (plan_cache_file (reports_file))
         
-        logger.debug ("created filter %s", visitor)
-        if visitor != None:
-            logger.info ('running filter %s', visitor)
-            traverse (visitor, subject, project_mode=project_mode)
-            
-    logger.info ('Generating: %s', file_name)
+    for opt, arg in opts:
+        if '-i' == opt:
+            infile = arg
+        elif '--index' == opt:
+            index_file = arg
+        elif '--batch' == opt:
+            batch_file = arg
+        elif '--jobs' == opt:
+            batch_jobs = int (arg)
+        elif '--serve' == opt:
+            serve_file = arg
+        elif '--http' == opt:
+            http_address = arg
+        elif '--watch' == opt:
+            watching = True
+        elif '--profile' == opt:
+            profile_file = arg
+        elif '--memory' == opt:
+            memory_file = arg
+    set_run_opts (opts)
     
-    if file_name != None:
-        out=codecs.open(file_name, 'w', 'utf-8')
-    else: 
-        out = sys.stdout
-        
-    if fmt in ('txt', 'text'):
-        template = template if template != None else load_template (template_dir, 'text')
-        visitor = PrintTextVisitor (out, template)
-        format_document (subject, visitor, project_mode)
-    elif fmt in ('md', 'markdown', 'ft', 'foldingtext'):
-        template = template if template != None else load_template (template_dir, 'markdown')
-        visitor = PrintMarkdownVisitor (out, template)
-        format_document (subject, visitor, project_mode)
-    elif fmt in ('tp', 'taskpaper'):
-        template = template if template != None else load_template (template_dir, 'taskpaper')
-        visitor = PrintTaskpaperVisitor (out, template)
-        format_document (subject, visitor, project_mode)
-    elif fmt == 'opml':
-        template = template if template != None else load_template (template_dir, 'opml')
-        visitor = PrintOpmlVisitor (out, template)
-        format_document (subject, visitor, project_mode)
-    elif fmt in ('html', 'htm'):
-        template = template if template != None else load_template (template_dir, 'html')
-        visitor = PrintHtmlVisitor (out, template)
-        format_document (subject, visitor, project_mode)
-    elif fmt in ('ics'):
-        template = template if template != None else load_template (template_dir, 'ics')
-        visitor = PrintCalendarVisitor (out, template)
-        format_document (subject, visitor, project_mode)
-    elif fmt == 'json':
-        # json has intrinsic formatting - no template required
-        root_project.marked = True
-        root_context.marked = True
-        visitor = ConvertStructureToJsonVisitor ()
-        traverse (visitor, root_project, project_mode=True)
-        visitor = ConvertStructureToJsonVisitor ()
-        traverse (visitor, root_context, project_mode=False)
-        print >> out, json.dumps([root_project.attribs['json_data'], root_context.attribs['json_data']], sort_keys=True, indent=2)
-    else:
-        raise Exception ('unknown format ' + fmt)
+    if serve_file != None:
+        assert batch_file == None and not watching and http_address == None, 'a server takes its outputs from its clients'
+        server = ExportServer (serve_file, lambda: model_files (infile), lambda: load_server_state (infile, index_file, reports_file), serve_request)
+        server.serve ()
+        sys.exit ()
     
-    if file_name != None:
-        out.close()
-        if opn:
-            os.system("open '" + file_name + "'")
-        
-    visitor = SummaryVisitor ()
-    traverse (visitor, root_project, project_mode=True)
-    traverse (visitor, root_context, project_mode=False)
-    visitor.print_counts()
+    if http_address != None:
+        assert batch_file == None and not watching, 'an http server takes its outputs from its requests'
+        server = HttpExportServer (parse_address (http_address), lambda: model_files (infile) + [reports_file] + template_files (),
+                                   lambda: load_server_state (infile, index_file, reports_file), http_request)
+        server.serve ()
+        sys.exit ()
+    
+    outputs = None
+    if batch_file != None:
+        assert not '-o' in [opt for opt, arg in opts], 'the outputs of a batch are in the batch file: ' + batch_file
+        outputs = load_batch (batch_file)
+        if uses_reports (outputs):
+            reports = load_reports (reports_file)
+            outputs = [expand_reports (output, reports) for output in outputs]
+            if plan_cache == None:
+                plan_cache = PlanCache (plan_cache_file (reports_file))
+    
+    def run ():
+        if watching:
+            def cycle ():
+                cmd_parser.NOW = datetime.now ()
+                return run_outputs (opts, outputs, infile, index_file, plan_cache, batch_jobs)
+            watch (model_files (infile), cycle)
+        else:
+            run_outputs (opts, outputs, infile, index_file, plan_cache, batch_jobs)
+    
+    if memory_file != None:
+        assert profile_file == None, 'the memory report has the times of each phase too'
+        run_profiled (run, memory_file, memory=True)
+    elif profile_file != None:
+        run_profiled (run, profile_file)
+    else:
+        run ()
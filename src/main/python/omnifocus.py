@@ -19,6 +19,7 @@ import sqlite3
 from os import environ, path
 from datetime import datetime
 from typeof import TypeOf
+from profiler import phase
 from xml.dom.minidom import parseString
 import logging
 import sys
@@ -112,6 +113,15 @@ class OFNote (Note):
                 self.lines.append (u''.join(line))
             logger.debug ('%s note: processed', self.item.id)
         return self.lines
+    def may_contain (self, text):
+        if self.lines != None:
+            return Note.may_contain (self, text)
+        # Without parsing: text can be split across runs, but its characters
+        # still appear in the xml, unless they're written as entities
+        data = self.noteXMLData
+        if not isinstance (data, basestring):
+            data = str (data)
+        return '&' in data or all ([c in data for c in text])
     def get_note (self):
         if self.text == None:
             self.text = '\n'.join (self.get_note_lines())
@@ -136,13 +146,14 @@ def datetimeFromAttrib (ofattribs, name):
     
 class OFContext(Context):
     TABLE='context'
-    COLUMNS=['persistentIdentifier', 'name', 'parent', 'childrenCount', 'rank', 'allowsNextAction']
+    COLUMNS=['persistentIdentifier', 'name', 'parent', 'childrenCount', 'rank', 'allowsNextAction', 'dateModified']
     ofattribs = TypeOf ('ofattribs', dict)
     def __init__(self, ofattribs):
         Context.__init__(self,
                          name=ofattribs['name'])
         self.ofattribs = ofattribs
         self.order = ofattribs['rank']
+        self.date_modified = datetimeFromAttrib (ofattribs, 'dateModified')
         if 'persistentIdentifier' in ofattribs:
             self.link = 'omnifocus:///context/' + ofattribs['persistentIdentifier']
         self.status = u'inactive' if 'allowsNextAction' in ofattribs and ofattribs['allowsNextAction'] == 0 else u'active'
@@ -152,7 +163,7 @@ class OFTask(Task):
     TABLE='task'
     COLUMNS=['persistentIdentifier', 'name', 'dateDue', 'dateCompleted','dateToStart', 'dateDue', 
              'projectInfo', 'context', 'containingProjectInfo', 'childrenCount', 'parent', 'rank',
-             'flagged', 'noteXMLData']    
+             'flagged', 'noteXMLData', 'dateModified']    
     ofattribs = TypeOf ('ofattribs', dict)
     def __init__(self, ofattribs):
         Task.__init__(self,
@@ -164,6 +175,7 @@ class OFTask(Task):
                       context=None)
         self.ofattribs = ofattribs
         self.order = ofattribs['rank']
+        self.date_modified = datetimeFromAttrib (ofattribs, 'dateModified')
         if 'persistentIdentifier' in ofattribs:
             self.link = 'omnifocus:///task/' + ofattribs['persistentIdentifier']
         noteXMLData = ofattribs['noteXMLData']
@@ -173,13 +185,14 @@ class OFTask(Task):
     
 class OFFolder(Folder):
     TABLE='folder'
-    COLUMNS=['persistentIdentifier', 'name', 'childrenCount', 'parent', 'rank', 'noteXMLData']
+    COLUMNS=['persistentIdentifier', 'name', 'childrenCount', 'parent', 'rank', 'noteXMLData', 'dateModified']
     ofattribs = TypeOf ('ofattribs', dict)
     def __init__(self, ofattribs):
         Folder.__init__(self,
                         name=ofattribs['name'])
         self.ofattribs = ofattribs
         self.order = ofattribs['rank']
+        self.date_modified = datetimeFromAttrib (ofattribs, 'dateModified')
         if 'persistentIdentifier' in ofattribs:
             self.link = 'omnifocus:///folder/' + ofattribs['persistentIdentifier']
         logger.debug ('loaded folder: %s %s', self.id, self.name)
@@ -306,20 +319,32 @@ def only_roots (items):
     return roots
 
 def build_model (db):
-    conn = sqlite3.connect(db)
-    contexts = query (conn, clazz=OFContext)
+    with phase ('open'):
+        conn = sqlite3.connect(db)
+    with phase ('query Context'):
+        contexts = query (conn, clazz=OFContext)
     no_context = OFContext({'name' : 'No Context', 'rank' : 0})
-    project_infos = query (conn, clazz=ProjectInfo)
-    folders = query (conn, clazz=OFFolder)
-    tasks = query (conn, clazz=OFTask)
+    with phase ('query ProjectInfo'):
+        project_infos = query (conn, clazz=ProjectInfo)
+    with phase ('query Folder'):
+        folders = query (conn, clazz=OFFolder)
+    with phase ('query Task'):
+        tasks = query (conn, clazz=OFTask)
     
-    projects = transmute_projects (project_infos, tasks)
-    wire_projects_and_folders(projects, folders, tasks)
-    wire_task_hierarchy(tasks)
-    wire_tasks_to_enclosing_projects (project_infos, tasks)
-    wire_tasks_and_contexts(contexts, tasks, no_context)
-    wire_folder_hierarchy (folders)
-    wire_context_hierarchy (contexts)
+    with phase ('transmute_projects'):
+        projects = transmute_projects (project_infos, tasks)
+    with phase ('wire_projects_and_folders'):
+        wire_projects_and_folders(projects, folders, tasks)
+    with phase ('wire_task_hierarchy'):
+        wire_task_hierarchy(tasks)
+    with phase ('wire_tasks_to_enclosing_projects'):
+        wire_tasks_to_enclosing_projects (project_infos, tasks)
+    with phase ('wire_tasks_and_contexts'):
+        wire_tasks_and_contexts(contexts, tasks, no_context)
+    with phase ('wire_folder_hierarchy'):
+        wire_folder_hierarchy (folders)
+    with phase ('wire_context_hierarchy'):
+        wire_context_hierarchy (contexts)
     
     conn.close ()
     
@@ -329,8 +354,9 @@ def build_model (db):
     roots_projects_and_folders = project_roots + folder_roots
     root_contexts = only_roots (contexts.values())
     root_contexts.insert(0, no_context)
-    sort(roots_projects_and_folders)
-    sort(root_contexts)
+    with phase ('sort'):
+        sort(roots_projects_and_folders)
+        sort(root_contexts)
     
     root_folder = Folder (name='')
     for child in roots_projects_and_folders:
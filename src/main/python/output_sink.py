@@ -0,0 +1,70 @@
+'''
+Copyright 2013 Paul Sidnell
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import sys
+from StringIO import StringIO
+
+'''
+Where the formatters write to. "print >>sink, line" works as it
+would for a file but write is just the append of a list, so a line
+costs no python call, encode or write of its own. The text is joined,
+encoded and written out in large blocks whenever flush_if_full is
+called between subtrees, and when the sink is flushed or closed.
+'''
+
+MAX_CHUNKS = 64 * 1024
+
+class OutputSink(object):
+    def __init__ (self, target, close_target=False, max_chunks=MAX_CHUNKS):
+        self.target = target
+        self.close_target = close_target
+        self.max_chunks = max_chunks
+        self.chunks = []
+        self.write = self.chunks.append
+        self.softspace = 0
+    def writelines (self, lines):
+        self.chunks.extend (lines)
+    def flush_if_full (self):
+        if len (self.chunks) >= self.max_chunks:
+            self.flush ()
+    def flush (self):
+        if len (self.chunks) > 0:
+            self.target.write (u''.join (self.chunks).encode ('utf-8'))
+            del self.chunks[:]
+        self.target.flush ()
+    def close (self):
+        self.flush ()
+        if self.close_target:
+            self.target.close ()
+
+class MemorySink(OutputSink):
+    def __init__ (self, max_chunks=MAX_CHUNKS):
+        OutputSink.__init__(self, StringIO (), max_chunks=max_chunks)
+    def getvalue (self):
+        self.flush ()
+        return self.target.getvalue ().decode ('utf-8')
+
+def file_sink (file_name):
+    return OutputSink (open (file_name, 'wb'), close_target=True)
+
+def stdout_sink ():
+    # sys.stdout may be wrapped in a codecs writer, we want the bytes underneath
+    return OutputSink (getattr (sys.stdout, 'stream', sys.stdout))
+
+def open_sink (file_name):
+    if file_name == None:
+        return stdout_sink ()
+    return file_sink (file_name)
@@ -0,0 +1,138 @@
+'''
+Copyright 2013 Paul Sidnell
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import multiprocessing
+import logging
+import sys
+from treemodel import traverse
+from output_sink import OutputSink
+
+logging.basicConfig(format='%(asctime)-15s %(name)s %(levelname)s %(message)s', stream=sys.stdout)
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.ERROR)
+
+'''
+Renders the top level folders and projects of a document in worker
+processes and writes the pieces out in order.
+
+The workers are forked once the tree is loaded and filtered, so each one
+already has its own copy of the marked tree and the formatter and all
+that's sent to a worker is a range of the root's children and the state
+the formatter should start in. Only the rendered text and the state the
+formatter ends in come back.
+
+The only state carried from one top level subtree to the next is what
+Formatter.get_state () returns (depth, traversal_depth and, for markdown,
+header_depth and whether a blank line is owed). That isn't known until
+the previous chunk has been rendered, so the first subtree is rendered
+up front and every other chunk assumes it starts in the state that one
+ended in, which is nearly always right. Any chunk whose predecessor turns
+out to end in a different state is rendered again from that state, round
+after round, until they all agree. The first chunk is always right so
+this does end.
+'''
+
+# The document being rendered, left here for the workers to inherit
+job = None
+
+def node_count (node):
+    count = 1
+    stack = list (node.children)
+    while len (stack) > 0:
+        item = stack.pop ()
+        count += 1
+        stack.extend (item.children)
+    return count
+
+def split_chunks (nodes, max_chunks):
+    # Contiguous runs of nodes of about the same size
+    sizes = [node_count (node) for node in nodes]
+    target = float (sum (sizes)) / max_chunks
+    chunks = []
+    start = 0
+    total = 0
+    for i in range (len (nodes)):
+        total += sizes[i]
+        if total >= target * (len (chunks) + 1) and len (chunks) < max_chunks - 1:
+            chunks.append ((start, i + 1))
+            start = i + 1
+    if start < len (nodes):
+        chunks.append ((start, len (nodes)))
+    return chunks
+
+def render_range (root, formatter, project_mode, start, end, state):
+    out = formatter.out
+    formatter.out = OutputSink (None)
+    try:
+        formatter.set_state (state)
+        for child in root.children[start:end]:
+            traverse (formatter, child, project_mode=project_mode)
+        return (u''.join (formatter.out.chunks), formatter.get_state ())
+    finally:
+        formatter.out = out
+
+def render_chunk (args):
+    root, formatter, project_mode = job
+    return render_range (root, formatter, project_mode, *args)
+
+def render_chunks (root, formatter, project_mode, jobs):
+    global job
+    # The first subtree is rendered here, the state it ends in is the
+    # best guess at where every other chunk starts
+    start_state = formatter.get_state ()
+    chunks = [(0, 1)] + [(start + 1, end + 1) for start, end in split_chunks (root.children[1:], jobs * 4)]
+    results = [render_range (root, formatter, project_mode, 0, 1, start_state)]
+    entry_states = [start_state] + [results[0][1]] * (len (chunks) - 1)
+    results.extend ([None] * (len (chunks) - 1))
+    todo = range (1, len (chunks))
+    rounds = 0
+    job = (root, formatter, project_mode)
+    pool = multiprocessing.Pool (processes=jobs)
+    try:
+        while len (todo) > 0:
+            rounds += 1
+            logger.info ('round %s: rendering %s of %s chunks', rounds, len (todo), len (chunks))
+            rendered = pool.map (render_chunk, [chunks[i] + (entry_states[i],) for i in todo], chunksize=1)
+            for i, result in zip (todo, rendered):
+                results[i] = result
+            todo = []
+            for i in range (1, len (chunks)):
+                exit_state = results[i - 1][1]
+                if entry_states[i] != exit_state:
+                    entry_states[i] = exit_state
+                    todo.append (i)
+        pool.close ()
+    except:
+        pool.terminate ()
+        raise
+    finally:
+        pool.join ()
+        job = None
+    logger.info ('rendered %s chunks in %s rounds with %s workers', len (chunks), rounds, jobs)
+    return results
+
+def format_children (root, formatter, project_mode, jobs):
+    if len (root.children) < 2:
+        for child in root.children:
+            traverse (formatter, child, project_mode=project_mode)
+        return
+    results = render_chunks (root, formatter, project_mode, jobs)
+    flush_if_full = getattr (formatter.out, 'flush_if_full', None)
+    for text, state in results:
+        formatter.out.write (text)
+        if flush_if_full != None:
+            flush_if_full ()
+    formatter.set_state (results[-1][1])
@@ -0,0 +1,193 @@
+'''
+Copyright 2013 Paul Sidnell
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import os
+import cProfile
+import json
+import time
+import logging
+import sys
+from memory_report import rss, high_water, model_nodes, model_breakdown, write_breakdown
+
+logging.basicConfig(format='%(asctime)-15s %(name)s %(levelname)s %(message)s', stream=sys.stdout)
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.ERROR)
+
+'''
+Where a run spends its time, e.g. "ofexport --profile profile.txt ...".
+
+The loader, the filters, the rendering and the summary each mark their
+phases with
+
+    with phase ('wire_task_hierarchy'):
+        ...
+
+and when a profile is being taken each phase's wall and CPU time is
+recorded, nested inside whatever phase was running at the time. Phases
+are whole steps of a run, never a node, and with no profile phase ()
+hands back the same do nothing object, so they cost next to nothing
+when profiling is off.
+
+The report is a table, or json if the file name ends in .json. A file
+name ending in .pstats gets a cProfile dump of the run instead, for
+pstats or a viewer, with the table on stderr. With a batch the outputs
+are written by other processes and show as a single phase.
+
+A memory profile ("ofexport --memory memory.txt ...") records how each
+phase changed the memory of the process as well, and adds a breakdown of
+what the model takes, see memory_report.py.
+'''
+
+PSTATS_SUFFIX = '.pstats'
+JSON_SUFFIX = '.json'
+
+def cpu_time ():
+    # Including any processes a batch forked and waited for
+    times = os.times ()
+    return times[0] + times[1] + times[2] + times[3]
+
+class NoPhase(object):
+    def __enter__ (self):
+        return self
+    def __exit__ (self, exc_type, exc_value, traceback):
+        return False
+
+NO_PHASE = NoPhase ()
+
+class Phase(object):
+    def __init__ (self, profile, name):
+        self.profile = profile
+        self.name = name
+    def __enter__ (self):
+        self.record = {'name' : self.name, 'depth' : self.profile.depth}
+        self.profile.phases.append (self.record)
+        self.profile.depth += 1
+        if self.profile.memory:
+            self.rss = rss ()
+            self.high_water = high_water ()
+        self.cpu = cpu_time ()
+        self.start = time.time ()
+        return self
+    def __exit__ (self, exc_type, exc_value, traceback):
+        self.record['wall'] = time.time () - self.start
+        self.record['cpu'] = cpu_time () - self.cpu
+        if self.profile.memory:
+            self.profile.record_memory (self.record, self.rss, self.high_water)
+        self.profile.depth -= 1
+        return False
+
+def kilobytes (size):
+    return '%13s' % '-' if size == None else '%13.1f' % (size / 1024.0)
+
+class Profile(object):
+    def __init__ (self, memory=False):
+        # In the order they started, each with its depth
+        self.phases = []
+        self.depth = 0
+        self.memory = memory
+        # The model, for the memory breakdown
+        self.nodes = None
+        if memory:
+            self.rss = rss ()
+            self.high_water = high_water ()
+        self.cpu = cpu_time ()
+        self.start = time.time ()
+    def phase (self, name):
+        return Phase (self, name)
+    def record_memory (self, record, rss_before, high_water_before):
+        # Retained is what the process holds now that it didn't before, peak
+        # rise how far the high water mark went up
+        rss_after = rss ()
+        record['retained'] = None if rss_after == None or rss_before == None else rss_after - rss_before
+        record['high_water'] = high_water ()
+        record['peak_rise'] = record['high_water'] - high_water_before
+    def total (self):
+        total = {'name' : 'total', 'depth' : 0, 'wall' : time.time () - self.start, 'cpu' : cpu_time () - self.cpu}
+        if self.memory:
+            self.record_memory (total, self.rss, self.high_water)
+        return total
+    def breakdown (self):
+        if self.nodes == None:
+            return None
+        return model_breakdown (self.nodes)
+    def write_table (self, out):
+        phases = [phase for phase in self.phases if 'wall' in phase] + [self.total ()]
+        width = max ([len ('phase')] + [2 * phase['depth'] + len (phase['name']) for phase in phases])
+        heading = 'phase'.ljust (width) + '   wall ms    cpu ms'
+        if self.memory:
+            heading += '  retained KB peak rise KB   highest KB'
+        print >>out, heading
+        for phase in phases:
+            name = '  ' * phase['depth'] + phase['name']
+            line = '%s %9.1f %9.1f' % (name.ljust (width), phase['wall'] * 1000, phase['cpu'] * 1000)
+            if self.memory:
+                line += kilobytes (phase['retained']) + kilobytes (phase['peak_rise']) + kilobytes (phase['high_water'])
+            print >>out, line
+        breakdown = self.breakdown ()
+        if breakdown != None:
+            write_breakdown (out, breakdown)
+    def write_json (self, out):
+        data = {'phases' : [phase for phase in self.phases if 'wall' in phase], 'total' : self.total ()}
+        breakdown = self.breakdown ()
+        if breakdown != None:
+            data['model'] = breakdown
+        json.dump (data, out, indent=1, sort_keys=True)
+        print >>out
+
+# The profile being taken, if any
+ACTIVE = None
+
+def phase (name):
+    if ACTIVE == None:
+        return NO_PHASE
+    return ACTIVE.phase (name)
+
+def model_loaded (roots):
+    # Keeps the nodes of a freshly loaded model for the memory breakdown
+    if ACTIVE != None and ACTIVE.memory:
+        ACTIVE.nodes = model_nodes (roots)
+
+def run_profiled (fn, file_name, memory=False):
+    # Runs fn () with a profile being taken and writes it to file_name
+    global ACTIVE
+    ACTIVE = Profile (memory=memory)
+    stats = None
+    if file_name.endswith (PSTATS_SUFFIX):
+        stats = cProfile.Profile ()
+        stats.enable ()
+    try:
+        return fn ()
+    finally:
+        if stats != None:
+            stats.disable ()
+            stats.dump_stats (file_name)
+        profile = ACTIVE
+        ACTIVE = None
+        write_profile (profile, file_name)
+
+def write_profile (profile, file_name):
+    logger.info ('writing profile: %s', file_name)
+    if file_name.endswith (PSTATS_SUFFIX):
+        profile.write_table (sys.stderr)
+        return
+    out = open (file_name, 'w')
+    try:
+        if file_name.endswith (JSON_SUFFIX):
+            profile.write_json (out)
+        else:
+            profile.write_table (out)
+    finally:
+        out.close ()
@@ -0,0 +1,132 @@
+'''
+Copyright 2013 Paul Sidnell
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import os
+import codecs
+import getopt
+import json
+import shlex
+import logging
+import sys
+from cmd_parser import make_plan
+from help import SHORT_OPTS, LONG_OPTS, VERSION
+
+logging.basicConfig(format='%(asctime)-15s %(name)s %(levelname)s %(message)s', stream=sys.stdout)
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.ERROR)
+
+'''
+Named reports and a persistent cache of their parsed filter plans.
+
+A reports file is json, each report is a list of command line arguments
+or a single command line string:
+
+{
+    "reports" : {
+        "flagged" : "-a flagged -a prune -o flagged.taskpaper",
+        "today"   : ["-t", "due=today", "-o", "today.html"]
+    }
+}
+
+The plans are plain tuples so they're stored as json alongside the reports
+file. Date literals in a plan are kept as text and are resolved against
+now() each time a plan is compiled, so "due=today" stays correct.
+'''
+
+DEFAULT_REPORTS_FILE = os.environ['HOME'] + '/.ofexport/reports.json'
+
+def plan_from_json (data):
+    if isinstance (data, list):
+        return tuple ([plan_from_json (x) for x in data])
+    return data
+
+def plan_cache_file (reports_file):
+    return os.path.splitext (reports_file)[0] + '-plans.json'
+
+class PlanCache(object):
+    def __init__ (self, file_name=None, version=VERSION):
+        self.file_name = file_name
+        self.version = version
+        self.plans = {}
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+        if file_name != None and os.path.exists (file_name):
+            self.load ()
+    def load (self):
+        instream=codecs.open(self.file_name, 'r', 'utf-8')
+        try:
+            data = json.loads(instream.read())
+        except ValueError:
+            logger.error ('ignoring unreadable plan cache: %s', self.file_name)
+            return
+        finally:
+            instream.close ()
+        if data.get ('version') != self.version:
+            logger.info ('discarding plan cache from version %s', data.get ('version'))
+            self.dirty = True
+            return
+        self.plans = {expr_str : plan_from_json (plan) for (expr_str, plan) in data['plans'].items()}
+        logger.info ('loaded %s cached plans from %s', len (self.plans), self.file_name)
+    def get_plan (self, expr_str):
+        if expr_str in self.plans:
+            self.hits += 1
+            return self.plans[expr_str]
+        self.misses += 1
+        logger.debug ('plan cache miss: %s', expr_str)
+        plan = make_plan (expr_str)
+        self.plans[expr_str] = plan_from_json (plan)
+        self.dirty = True
+        return self.plans[expr_str]
+    def save (self):
+        logger.info ('plan cache: %s hits, %s misses', self.hits, self.misses)
+        if self.file_name == None or not self.dirty:
+            return
+        logger.info ('saving %s plans to %s', len (self.plans), self.file_name)
+        tmp_file_name = self.file_name + '.tmp'
+        out=codecs.open(tmp_file_name, 'w', 'utf-8')
+        print >> out, json.dumps({'version' : self.version, 'plans' : self.plans}, sort_keys=True, indent=2)
+        out.close ()
+        os.rename (tmp_file_name, self.file_name)
+        self.dirty = False
+
+def load_reports (file_name):
+    logger.info ('loading reports: %s', file_name)
+    instream=codecs.open(file_name, 'r', 'utf-8')
+    data = json.loads(instream.read())
+    instream.close ()
+    reports = {}
+    for name, args in data['reports'].items():
+        if isinstance (args, basestring):
+            # shlex can't cope with unicode in python 2
+            args = shlex.split (args.encode ('utf-8'))
+            args = [arg.decode ('utf-8') for arg in args]
+        reports[name] = list (args)
+    return reports
+
+def expand_reports (opts, reports):
+    expanded = []
+    for opt, arg in opts:
+        if opt == '--report':
+            assert arg in reports, 'no such report: ' + arg
+            report_opts, args = getopt.getopt(reports[arg], SHORT_OPTS, LONG_OPTS)
+            assert len (args) == 0, "unexpected arguments in report " + arg + ": " + str (args)
+            assert not '--report' in [o for o, a in report_opts], 'reports cannot include other reports: ' + arg
+            logger.info ('expanded report %s: %s', arg, report_opts)
+            expanded.extend (report_opts)
+        else:
+            expanded.append ((opt, arg))
+    return expanded
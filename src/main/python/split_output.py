@@ -0,0 +1,146 @@
+'''
+Copyright 2013 Paul Sidnell
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import os
+import re
+import hashlib
+import multiprocessing
+import logging
+import sys
+from StringIO import StringIO
+from treemodel import Folder, FOLDER, PROJECT, CONTEXT
+from fmt_template import format_document
+from output_sink import OutputSink
+
+logging.basicConfig(format='%(asctime)-15s %(name)s %(levelname)s %(message)s', stream=sys.stdout)
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.ERROR)
+
+'''
+Writes each top level folder, each project or each top level context to
+a file of its own in one run, e.g. "--split folder -o pages/{name}.md".
+
+Every file is a complete document, with the preamble and postamble and
+starting at the template's first depth. The files are rendered and
+written by a pool of worker processes forked after the filters have run,
+so each worker already has the marked tree. A file whose content hasn't
+changed is left alone so its modification time doesn't change either.
+'''
+
+NAME = '{name}'
+SPLITS = [FOLDER, PROJECT, CONTEXT]
+
+# The shards being written, left here for the workers to inherit
+job = None
+
+def find_projects (node, projects):
+    for child in node.children:
+        if child.marked:
+            if child.type == PROJECT:
+                projects.append (child)
+            elif child.type == FOLDER:
+                find_projects (child, projects)
+
+def split_subjects (root_project, root_context, split_by):
+    split_by = split_by.capitalize ()
+    assert split_by in SPLITS, 'can only split by ' + ', '.join ([s.lower () for s in SPLITS]) + ': ' + split_by
+    if split_by == PROJECT:
+        subjects = []
+        find_projects (root_project, subjects)
+        return subjects
+    root = root_project if split_by == FOLDER else root_context
+    return [child for child in root.children if child.marked and child.type == split_by]
+
+def safe_file_name (name):
+    name = re.sub (r'[/\\:\0]', '-', name if name != None else u'').strip ().lstrip ('.')
+    if len (name) == 0:
+        return u'untitled'
+    return name
+
+def shard_file_names (pattern, subjects):
+    # Two subjects with the same name get "name 2", "name 3" and so on
+    assert NAME in pattern, 'the output file name must include ' + NAME + ' to split the output'
+    seen = {}
+    file_names = []
+    for subject in subjects:
+        name = safe_file_name (subject.name)
+        key = name.lower ()
+        seen[key] = seen.get (key, 0) + 1
+        if seen[key] > 1:
+            name = name + u' ' + str (seen[key])
+        file_names.append (pattern.replace (NAME, name))
+    return file_names
+
+def render_shard (subject, make_formatter):
+    out = OutputSink (StringIO ())
+    # A root of its own, without taking the subject from its parent
+    root = Folder (name=u'', children=[subject])
+    format_document (root, make_formatter (out), True)
+    return out.target.getvalue ()
+
+def file_hash (file_name):
+    if not os.path.exists (file_name):
+        return None
+    instream = open (file_name, 'rb')
+    try:
+        return hashlib.sha1 (instream.read ()).hexdigest ()
+    finally:
+        instream.close ()
+
+def write_if_changed (file_name, data):
+    if file_hash (file_name) == hashlib.sha1 (data).hexdigest ():
+        return False
+    directory = os.path.dirname (file_name)
+    if directory != '' and not os.path.isdir (directory):
+        try:
+            os.makedirs (directory)
+        except OSError:
+            # Another worker got there first
+            pass
+    tmp_file_name = file_name + '.tmp'
+    out = open (tmp_file_name, 'wb')
+    out.write (data)
+    out.close ()
+    os.rename (tmp_file_name, file_name)
+    return True
+
+def write_shard (i):
+    subjects, file_names, make_formatter = job
+    return write_if_changed (file_names[i], render_shard (subjects[i], make_formatter))
+
+def write_shards (subjects, pattern, make_formatter, jobs):
+    global job
+    file_names = shard_file_names (pattern, subjects)
+    job = (subjects, file_names, make_formatter)
+    try:
+        if jobs > 1 and len (subjects) > 1:
+            pool = multiprocessing.Pool (processes=min (jobs, len (subjects)))
+            try:
+                changed = pool.map (write_shard, range (len (subjects)), chunksize=1)
+                pool.close ()
+            except:
+                pool.terminate ()
+                raise
+            finally:
+                pool.join ()
+        else:
+            changed = [write_shard (i) for i in range (len (subjects))]
+    finally:
+        job = None
+    for file_name, was_changed in zip (file_names, changed):
+        logger.info ('%s: %s', file_name, 'written' if was_changed else 'unchanged')
+    logger.info ('split into %s files, %s changed', len (file_names), changed.count (True))
+    return zip (file_names, changed)
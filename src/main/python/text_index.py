@@ -0,0 +1,190 @@
+'''
+Copyright 2013 Paul Sidnell
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import re
+import hashlib
+import json
+import sqlite3
+import logging
+import sys
+from directives import text_directives, set_directives
+
+logging.basicConfig(format='%(asctime)-15s %(name)s %(levelname)s %(message)s', stream=sys.stdout)
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.ERROR)
+
+'''
+An inverted index of the words in node names and notes.
+
+A name=/note= filter is a regular expression search, so a literal
+pattern like "worms" matches "bookworms" too. Any word in the pattern
+has to sit inside a single word of the text, so the candidates for a
+pattern are the nodes having, for every word in the pattern, some word
+that contains it. The regular expression then only runs against those
+candidates and everything else is rejected without looking at its note.
+
+The words for each node can be kept in an sqlite file between runs,
+keyed by the node id along with a fingerprint of the raw name and note,
+so notes only need decoding when they've changed. The note's directives
+(see directives.py) are kept with them.
+'''
+
+NAME = 'name'
+NOTE = 'note'
+FIELDS = [NAME, NOTE]
+METACHARS = re.compile (r'[.^$*+?{}\[\]\\|()]')
+WORD = re.compile (r'\w+', re.UNICODE)
+
+def tokenise (text):
+    if text == None:
+        return set ()
+    return set (WORD.findall (text))
+
+def literal_words (pattern):
+    # The words a pattern requires, or None if it's a real regular expression
+    if pattern.startswith ('^'):
+        pattern = pattern[1:]
+    if METACHARS.search (pattern) != None:
+        return None
+    words = WORD.findall (pattern)
+    if len (words) == 0:
+        return None
+    return words
+
+def raw_note (node):
+    note = node.__dict__.get ('note')
+    if note == None:
+        return ''
+    raw = getattr (note, 'noteXMLData', None)
+    if raw == None:
+        raw = note.get_note ()
+    if isinstance (raw, unicode):
+        return raw.encode ('utf-8')
+    return str (raw)
+
+def fingerprint (node):
+    name = node.name if node.name != None else u''
+    return hashlib.md5 (name.encode ('utf-8') + '\0' + raw_note (node)).hexdigest ()
+
+def note_text (node):
+    note = node.__dict__.get ('note')
+    if note == None:
+        return None
+    return note.get_note ()
+
+class IndexStore(object):
+    def __init__ (self, file_name):
+        self.file_name = file_name
+        self.conn = sqlite3.connect (file_name)
+        columns = [row[1] for row in self.conn.execute ('PRAGMA table_info(words)')]
+        if len (columns) > 0 and not 'directives' in columns:
+            logger.info ('discarding an index without directives: %s', file_name)
+            self.conn.execute ('DROP TABLE words')
+        self.conn.execute ('CREATE TABLE IF NOT EXISTS words (id TEXT PRIMARY KEY, fingerprint TEXT, name TEXT, note TEXT, directives TEXT)')
+    def load (self):
+        entries = {}
+        for node_id, fp, name_words, note_words, directives in self.conn.execute ('SELECT id, fingerprint, name, note, directives FROM words'):
+            entries[node_id] = (fp, {NAME : name_words.split (), NOTE : note_words.split ()}, json.loads (directives))
+        logger.info ('loaded words for %s nodes from %s', len (entries), self.file_name)
+        return entries
+    def save (self, changed, removed):
+        logger.info ('saving words for %s nodes to %s, removing %s', len (changed), self.file_name, len (removed))
+        self.conn.executemany ('DELETE FROM words WHERE id=?', [(node_id,) for node_id in removed])
+        self.conn.executemany ('INSERT OR REPLACE INTO words VALUES (?,?,?,?,?)',
+                               [(node_id, fp, u' '.join (words[NAME]), u' '.join (words[NOTE]), json.dumps (directives)) for node_id, (fp, words, directives) in changed.items ()])
+        self.conn.commit ()
+    def close (self):
+        self.conn.close ()
+
+class TextIndex(object):
+    def __init__ (self):
+        self.postings = {NAME : {}, NOTE : {}}
+        self.ids = set ()
+        self.candidate_cache = {}
+    def add (self, node_id, words):
+        self.ids.add (node_id)
+        for field in FIELDS:
+            postings = self.postings[field]
+            for word in words[field]:
+                if word in postings:
+                    postings[word].add (node_id)
+                else:
+                    postings[word] = set ([node_id])
+    def build (self, roots, store=None):
+        stored = {}
+        if store != None:
+            stored = store.load ()
+        changed = {}
+        seen = set ()
+        for node in all_nodes (roots):
+            if node.id in seen:
+                continue
+            seen.add (node.id)
+            fp = fingerprint (node)
+            if node.id in stored and stored[node.id][0] == fp:
+                words, directives = stored[node.id][1:]
+            else:
+                text = note_text (node)
+                words = {NAME : tokenise (node.name), NOTE : tokenise (text)}
+                directives = text_directives (text)
+                changed[node.id] = (fp, words, directives)
+            self.add (node.id, words)
+            set_directives (node, directives)
+        logger.info ('indexed %s nodes, %s words, %s (re)tokenised', len (self.ids), len (self.postings[NAME]) + len (self.postings[NOTE]), len (changed))
+        if store != None:
+            store.save (changed, [node_id for node_id in stored if not node_id in seen])
+        return self
+    def containing (self, field, word):
+        # Nodes with a word that contains this one
+        key = (field, word)
+        if not key in self.candidate_cache:
+            result = set ()
+            for token, node_ids in self.postings[field].iteritems ():
+                if word in token:
+                    result |= node_ids
+            self.candidate_cache[key] = result
+        return self.candidate_cache[key]
+    def candidates (self, field, pattern):
+        if not field in self.postings:
+            return None
+        words = literal_words (pattern)
+        if words == None:
+            return None
+        result = None
+        for word in sorted (words, key=len, reverse=True):
+            node_ids = self.containing (field, word)
+            result = set (node_ids) if result == None else result & node_ids
+            if len (result) == 0:
+                break
+        logger.info ('%s=%s: %s candidates of %s', field, pattern, len (result), len (self.ids))
+        return result
+
+def all_nodes (roots):
+    stack = list (reversed (roots))
+    while len (stack) > 0:
+        node = stack.pop ()
+        yield node
+        stack.extend (reversed (node.children))
+
+def build_index (roots, file_name=None):
+    store = None
+    if file_name != None:
+        store = IndexStore (file_name)
+    try:
+        return TextIndex ().build (roots, store)
+    finally:
+        if store != None:
+            store.close ()
@@ -15,7 +15,7 @@ limitations under the License.
 '''
 
 from datetime import datetime
-from typeof import TypeOf
+from typeof import TypeOf, activate, created
 from util import strip_tabs_newlines
 import uuid
 import logging
@@ -35,6 +35,12 @@ class Note:
         assert False, "not implemented"
     def get_note (self):
         assert False, "not implemented"
+    def may_contain (self, text):
+        # False only if text is certainly not in the note, for notes that can tell without decoding
+        for line in self.get_note_lines ():
+            if text in line:
+                return True
+        return False
 
 class NodeFwdDecl (object):
     # How to do forward class declarations in python?
@@ -50,6 +56,7 @@ class Node (NodeFwdDecl):
     type = TypeOf ('type', str)
     link = TypeOf ('link', unicode)
     order = TypeOf ('order', int)
+    date_modified = TypeOf ('date_modified', datetime)
     
     def __init__ (self, nType,
                   name=None,
@@ -59,6 +66,7 @@ class Node (NodeFwdDecl):
                   order=0,
                   children=[],
                   attribs = {}):
+        created (self)
         self.name = strip_tabs_newlines (name)
         self.parent = parent
         self.children = list(children)
@@ -200,6 +208,48 @@ class Project(Node):
         self.note = note
         self.status = unicode(status)
     
+class TreeView(object):
+    '''
+    Marks, child lists, parents and anything else set on the nodes of a
+    model, kept to one side of the model rather than in it.
+
+    While a view is active (with view: ...) in a thread every node attribute
+    that thread reads comes from the view if the view has it and from the
+    model if not, and every attribute it sets goes into the view, so filters
+    and formatters run as normal and the model is left as it was loaded. A
+    child list or attribs dictionary is copied into the view the first time
+    it's read, so changing one in place only changes the view's copy. Nodes
+    created while the view is active are the view's own and are used as is.
+
+    Any number of views can be made over one model, each starting from the
+    model as it is, not from another view. A view can be used again later
+    and carries on from where it left off. Code that reads a node's
+    __dict__ directly sees the model, so needs instance_values () to see
+    attributes the view may have changed.
+    '''
+    def __init__ (self):
+        self.overlays = {}
+        self.created = set ()
+        self.previous = []
+    def overlay (self, name):
+        overlay = self.overlays.get (name)
+        if overlay is None:
+            overlay = {}
+            self.overlays[name] = overlay
+        return overlay
+    def values (self, instance):
+        values = dict (instance.__dict__)
+        for name, overlay in self.overlays.iteritems ():
+            if instance in overlay:
+                values[name] = overlay[instance]
+        return values
+    def __enter__ (self):
+        self.previous.append (activate (self))
+        return self
+    def __exit__ (self, exc_type, exc_value, tb):
+        activate (self.previous.pop ())
+        return False
+
 class Visitor(object):
     project_mode = TypeOf ('flagged', bool)
     def __init__(self):
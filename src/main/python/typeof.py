@@ -14,15 +14,73 @@ See the License for the specific language governing permissions and
 limitations under the License.
 '''
 
+import threading
+
+class ActiveView(threading.local):
+    # The overlay, if any, that this thread reads and writes through
+    view = None
+
+active = ActiveView ()
+
+# How many threads have an overlay active, while there are none every
+# attribute access takes the quick way through
+views_active = 0
+views_lock = threading.Lock ()
+
+def activate (view):
+    global views_active
+    with views_lock:
+        previous = active.view
+        active.view = view
+        views_active += (view is not None) - (previous is not None)
+    return previous
+
 class TypeOf(object):
     def __init__(self, name, thetype):
         self.thetype = thetype
         self.name = name
+        # Mutable values are copied the first time they're read through
+        # an overlay so changing them in place doesn't touch the base
+        self.copy = list if thetype == list else dict if thetype == dict else None
     def __get__(self, instance, owner):
+        if views_active:
+            view = active.view
+            if view is not None and not instance in view.created:
+                overlay = view.overlay (self.name)
+                if instance in overlay:
+                    return overlay[instance]
+                value = instance.__dict__.get (self.name)
+                if self.copy is not None and value is not None:
+                    value = self.copy (value)
+                    overlay[instance] = value
+                return value
         if self.name in instance.__dict__:
             return instance.__dict__[self.name]
         return None
     def __set__(self, instance, value):
         if value != None:
             assert isinstance (value, self.thetype), self.name + ': expected type ' + str(self.thetype) + ' got ' + str (value.__class__)
-        instance.__dict__[self.name] = value
\ No newline at end of file
+        if views_active:
+            view = active.view
+            if view is not None and not instance in view.created:
+                view.overlay (self.name)[instance] = value
+                return
+        instance.__dict__[self.name] = value
+
+def instance_values (instance):
+    # The instance's attributes as seen through the active overlay, for
+    # code that reads __dict__ directly
+    if not views_active:
+        return instance.__dict__
+    view = active.view
+    if view is None or instance in view.created:
+        return instance.__dict__
+    return view.values (instance)
+
+def created (instance):
+    # New instances belong to the overlay they were made in
+    if not views_active:
+        return
+    view = active.view
+    if view is not None:
+        view.created.add (instance)
@@ -14,8 +14,83 @@ See the License for the specific language governing permissions and
 limitations under the License.
 '''
 
+from collections import OrderedDict
+
 def strip_tabs_newlines (string):
     if string != None:
         words = string.split ()
         string = u' '.join(words)
-    return string
\ No newline at end of file
+    return string
+
+def hit_rate (hits, misses):
+    total = hits + misses
+    rate = 0 if total == 0 else (100 * hits) / total
+    return str(hits) + ' hits, ' + str(misses) + ' misses (' + str(rate) + '%)'
+
+class LRUCache(object):
+    '''
+    A small bounded least-recently-used cache. Python 2 has no functools.lru_cache
+    so this keeps an ordered dictionary and evicts from the front.
+    '''
+    def __init__ (self, max_size=256):
+        self.max_size = max_size
+        self.entries = OrderedDict ()
+        self.hits = 0
+        self.misses = 0
+    def get (self, key, default=None):
+        if key in self.entries:
+            value = self.entries.pop (key)
+            self.entries[key] = value
+            self.hits += 1
+            return value
+        self.misses += 1
+        return default
+    def put (self, key, value):
+        if key in self.entries:
+            del self.entries[key]
+        elif len (self.entries) >= self.max_size:
+            self.entries.popitem (last=False)
+        self.entries[key] = value
+    def lookup (self, key, compute):
+        if key in self.entries:
+            return self.get (key)
+        self.misses += 1
+        value = compute ()
+        self.put (key, value)
+        return value
+    def clear (self):
+        self.entries.clear ()
+        self.hits = 0
+        self.misses = 0
+    def __len__ (self):
+        return len (self.entries)
+    def __contains__ (self, key):
+        return key in self.entries
+    def stats (self):
+        return hit_rate (self.hits, self.misses)
+
+class Memo(object):
+    '''
+    Memoises a function of one hashable argument. Keeping an LRUCache in
+    order costs as much as a strftime, so for cheap conversions this is a
+    plain dictionary that's simply emptied when it fills up.
+    '''
+    def __init__ (self, fn, max_size=4096):
+        self.fn = fn
+        self.max_size = max_size
+        self.values = {}
+        self.hits = 0
+        self.misses = 0
+    def __call__ (self, arg):
+        values = self.values
+        if arg in values:
+            self.hits += 1
+            return values[arg]
+        self.misses += 1
+        if len (values) >= self.max_size:
+            values.clear ()
+        value = self.fn (arg)
+        values[arg] = value
+        return value
+    def stats (self):
+        return hit_rate (self.hits, self.misses)
@@ -0,0 +1,187 @@
+'''
+Copyright 2013 Paul Sidnell
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import os
+import ctypes
+import ctypes.util
+import errno
+import hashlib
+import select
+import struct
+import time
+import logging
+import sys
+from export_server import file_stamps
+from profiler import cpu_time
+
+logging.basicConfig(format='%(asctime)-15s %(name)s %(levelname)s %(message)s', stream=sys.stdout)
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.ERROR)
+
+'''
+Writes the outputs again whenever the database changes, rather than on a
+schedule, e.g. "ofexport --watch --batch board.json".
+
+On Linux the files are watched with inotify, anywhere else (or if that
+fails) they're looked at every few seconds. OmniFocus writes in bursts,
+so a cycle starts once the files have been quiet for a moment. Files can
+be touched without their content changing, so a cycle only runs if a
+hash of their content is different from last time. Each cycle loads the
+database afresh, the caches that make the exports themselves incremental
+(--fragments, --feed, --index) work as they do for any other run.
+'''
+
+DEBOUNCE = 1.0
+MAX_DEBOUNCE = 30.0
+POLL_INTERVAL = 2.0
+
+# From <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_EVENT = 'iIII'
+IN_EVENT_SIZE = struct.calcsize (IN_EVENT)
+
+def data_fingerprint (file_names):
+    hasher = hashlib.sha1 ()
+    for file_name in file_names:
+        hasher.update (file_name + '\0')
+        if os.path.exists (file_name):
+            instream = open (file_name, 'rb')
+            try:
+                while True:
+                    block = instream.read (1024 * 1024)
+                    if len (block) == 0:
+                        break
+                    hasher.update (block)
+            finally:
+                instream.close ()
+    return hasher.hexdigest ()
+
+class PollingWatcher(object):
+    def __init__ (self, file_names, interval=POLL_INTERVAL):
+        self.file_names = file_names
+        self.interval = interval
+        self.stamps = file_stamps (file_names)
+    def wait (self, timeout):
+        # True if a file changed within the timeout
+        deadline = time.time () + timeout
+        while True:
+            stamps = file_stamps (self.file_names)
+            if stamps != self.stamps:
+                self.stamps = stamps
+                return True
+            remaining = deadline - time.time ()
+            if remaining <= 0:
+                return False
+            time.sleep (min (self.interval, remaining))
+    def close (self):
+        pass
+
+class InotifyWatcher(object):
+    def __init__ (self, file_names):
+        # The directories are watched, sqlite creates and removes its -wal
+        self.names = set ([os.path.basename (file_name) for file_name in file_names])
+        self.libc = ctypes.CDLL (ctypes.util.find_library ('c'), use_errno=True)
+        self.fd = self.libc.inotify_init ()
+        if self.fd < 0:
+            raise OSError (ctypes.get_errno (), 'inotify_init failed')
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+        for directory in set ([os.path.dirname (os.path.abspath (file_name)) for file_name in file_names]):
+            if self.libc.inotify_add_watch (self.fd, directory, mask) < 0:
+                error = ctypes.get_errno ()
+                os.close (self.fd)
+                raise OSError (error, 'inotify_add_watch failed: ' + directory)
+    def changed (self, data):
+        pos = 0
+        result = False
+        while pos + IN_EVENT_SIZE <= len (data):
+            wd, mask, cookie, size = struct.unpack_from (IN_EVENT, data, pos)
+            name = data[pos + IN_EVENT_SIZE:pos + IN_EVENT_SIZE + size].rstrip ('\0')
+            pos += IN_EVENT_SIZE + size
+            if name in self.names:
+                result = True
+        return result
+    def wait (self, timeout):
+        deadline = time.time () + timeout
+        while True:
+            remaining = deadline - time.time ()
+            if remaining <= 0:
+                return False
+            try:
+                readable, writable, errors = select.select ([self.fd], [], [], remaining)
+            except select.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            if len (readable) > 0 and self.changed (os.read (self.fd, 64 * 1024)):
+                return True
+    def close (self):
+        os.close (self.fd)
+
+def make_watcher (file_names):
+    if sys.platform.startswith ('linux'):
+        try:
+            return InotifyWatcher (file_names)
+        except (OSError, AttributeError) as e:
+            logger.info ('inotify not available, polling instead: %s', e)
+    return PollingWatcher (file_names)
+
+def wait_for_change (watcher, debounce=DEBOUNCE, max_debounce=MAX_DEBOUNCE):
+    # Blocks until a file changes and then stays quiet for debounce seconds
+    while not watcher.wait (3600):
+        pass
+    started = time.time ()
+    while watcher.wait (debounce) and time.time () - started < max_debounce:
+        pass
+
+def watch (file_names, run_cycle, watcher=None, debounce=DEBOUNCE, max_cycles=None, report=None):
+    '''
+    Runs run_cycle () now and again each time the files change, until
+    max_cycles have been looked at. run_cycle can return a list of
+    (phase, seconds) to go in the report.
+    '''
+    watcher = watcher if watcher != None else make_watcher (file_names)
+    report = report if report != None else sys.stderr
+    fingerprint = None
+    cycle = 0
+    try:
+        while True:
+            cycle += 1
+            start = time.time ()
+            new_fingerprint = data_fingerprint (file_names)
+            if new_fingerprint == fingerprint:
+                print >>report, 'cycle %d: unchanged, skipped (%.2fs)' % (cycle, time.time () - start)
+            else:
+                cpu = cpu_time ()
+                try:
+                    timings = run_cycle ()
+                    fingerprint = new_fingerprint
+                    status = 'done'
+                    if timings != None:
+                        status += ' (' + ', '.join (['%s %.2fs' % (phase, seconds) for phase, seconds in timings]) + ')'
+                except Exception as e:
+                    logger.exception ('cycle %s failed', cycle)
+                    status = 'failed: ' + str (e)
+                print >>report, 'cycle %d: %s in %.2fs, %.2fs cpu' % (cycle, status, time.time () - start, cpu_time () - cpu)
+            report.flush ()
+            if max_cycles != None and cycle >= max_cycles:
+                return
+            wait_for_change (watcher, debounce)
+    finally:
+        watcher.close ()
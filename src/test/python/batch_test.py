@@ -0,0 +1,72 @@
+'''
+Copyright 2013 Paul Sidnell
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import unittest
+import os
+import shutil
+import tempfile
+import codecs
+from treemodel import Folder, Task
+from batch import load_batch, uses_reports, describe_output, run_batch
+
+class Test_batch(unittest.TestCase):
+
+    def setUp (self):
+        self.dir = tempfile.mkdtemp ()
+
+    def tearDown (self):
+        shutil.rmtree (self.dir)
+
+    def write_batch (self, text):
+        file_name = os.path.join (self.dir, 'batch.json')
+        out = codecs.open (file_name, 'w', 'utf-8')
+        out.write (text)
+        out.close ()
+        return file_name
+
+    def test_load_batch (self):
+        outputs = load_batch (self.write_batch (u'{"outputs" : ["-t \'name=caf\u00e9\' -o x.md", ["--report", "week"]]}'))
+        self.assertEquals ([[('-t', u'name=caf\u00e9'), ('-o', u'x.md')], [('--report', u'week')]], outputs)
+        self.assertTrue (uses_reports (outputs))
+        self.assertFalse (uses_reports (outputs[:1]))
+        self.assertEquals (u'-t name=caf\u00e9 -o x.md', describe_output (outputs[0]))
+
+    def test_batch_only_options (self):
+        file_name = self.write_batch (u'{"outputs" : ["-i db.json -o x.md"]}')
+        self.assertRaises (AssertionError, load_batch, file_name)
+
+    def test_run_batch (self):
+        root = Folder (name=u'root')
+        for i in range (4):
+            Task (name=u'task ' + str (i), parent=root)
+
+        def export (output):
+            # Each output sees the tree as loaded, whatever the others did to theirs
+            opts = dict (output)
+            name = opts['-o']
+            assert name != 'bad'
+            del root.children[int (opts['-x'])]
+            out = open (os.path.join (self.dir, name), 'w')
+            out.write (','.join ([child.name for child in root.children]))
+            out.close ()
+
+        outputs = [[('-o', name), ('-x', str (remove))] for name, remove in [('a', 0), ('bad', 0), ('b', 1), ('c', 2)]]
+        self.assertEquals ([1], run_batch (outputs, export, 2))
+        self.assertEquals (4, len (root.children))
+        self.assertEquals ('task 1,task 2,task 3', open (os.path.join (self.dir, 'a')).read ())
+        self.assertEquals ('task 0,task 2,task 3', open (os.path.join (self.dir, 'b')).read ())
+        self.assertEquals ('task 0,task 1,task 3', open (os.path.join (self.dir, 'c')).read ())
+        self.assertFalse (os.path.exists (os.path.join (self.dir, 'bad')))
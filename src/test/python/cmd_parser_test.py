@@ -17,7 +17,7 @@ limitations under the License.
 import unittest
 from datetime import datetime
 from treemodel import Task, Project, Folder
-from cmd_parser import DATE_TYPE, STRING_TYPE, Note, tokenise, read_to_end_quote, parse_string, parse_expr, make_command_filter, make_expr_filter, ALIAS_LOOKUPS
+from cmd_parser import DATE_TYPE, STRING_TYPE, Note, tokenise, read_to_end_quote, parse_string, parse_expr, make_command_filter, make_expr_filter, ALIAS_LOOKUPS, parse_plan, optimize_plan, make_plan, compile_plan, SharedExpressions
 from datematch import date_range_to_str
 from visitors import Sort, Prune, Flatten, Filter
 from test_helper import catch_exception
@@ -360,6 +360,16 @@ class Test_cmd_parser(unittest.TestCase):
         self.assertFalse(expr (Task(note=TestNote("z\y\z"))))
         self.assertFalse(expr (Task()))
         
+    def test_parse_expr_cal_filter(self):
+        expr = parse_expr(tokenise ('cal=allday'))[0]
+        self.assertTrue(expr (Task(note=TestNote("x\n%of cal noalarm allday"))))
+        self.assertFalse(expr (Task(note=TestNote("x\n%of cal noalarm\nallday"))))
+        self.assertFalse(expr (Task()))
+        expr = parse_expr(tokenise ('cal="start=18"'))[0]
+        self.assertTrue(expr (Task(note=TestNote("%of cal start=18:30"))))
+        expr = parse_expr(tokenise ('cal!=none'))[0]
+        self.assertTrue(expr (Task(note=TestNote("%of cal noalarm"))))
+        
     def test_make_command_filter (self):
         self.assertEquals (None, make_command_filter ("nonsense"))
         self.assertEquals (Sort, type(make_command_filter ("sort Task name")))
@@ -381,4 +391,45 @@ class Test_cmd_parser(unittest.TestCase):
         self.assertEquals("expecting a Boolean got a Date: field:date_due", catch_exception(lambda: make_expr_filter ('due', True)))
         self.assertEquals("expecting a Date got a String: field:name", catch_exception(lambda: make_expr_filter ('due = name', True)))
         self.assertEquals('found "name" not: [\'AND\', \'OR\', \'EQ\', \'NE\', \'CB\']', catch_exception(lambda: make_expr_filter ('not name', True)))
-
+        
+    def test_parse_plan (self):
+        plan, tokens, expr_type = parse_plan (tokenise ('(type=Task) and !(due = "last tues")'))
+        self.assertEquals (('and', ('eq', ('field', 'type'), ('text', 'Task', False)), ('not', ('eq', ('field', 'date_due'), ('date', 'last tues', True)))), plan)
+        self.assertEquals ([], tokens)
+        self.assertEquals ('Boolean', expr_type)
+        self.assertEquals ("I don't think \"whenever\" is any kind of date specification I recognise", catch_exception(lambda: parse_plan (tokenise ('due=whenever'))))
+        
+    def test_optimize_plan (self):
+        flagged = ('field', 'flagged')
+        self.assertEquals (flagged, optimize_plan (parse_plan (tokenise ('true and flagged'))[0]))
+        self.assertEquals (flagged, optimize_plan (parse_plan (tokenise ('flagged and true'))[0]))
+        self.assertEquals (('const', True), optimize_plan (parse_plan (tokenise ('true or flagged'))[0]))
+        self.assertEquals (('const', False), optimize_plan (parse_plan (tokenise ('false and flagged'))[0]))
+        self.assertEquals (flagged, optimize_plan (parse_plan (tokenise ('!!flagged'))[0]))
+        self.assertEquals (('const', False), optimize_plan (parse_plan (tokenise ('true = false'))[0]))
+        
+    def test_make_plan (self):
+        self.assertEquals (('prune', ['Project']), make_plan ('prune Project'))
+        self.assertEquals (('sort', ['Task'], 'date_due'), make_plan ('sort Task due'))
+        self.assertEquals (('filter', ('field', 'flagged')), make_plan ('flagged'))
+        
+    def test_shared_expressions (self):
+        plan1 = make_plan ('(type=Task) and flagged')
+        plan2 = make_plan ('(type=Task) and !flagged')
+        shared = SharedExpressions ()
+        shared.register (plan1)
+        shared.register (plan2)
+        self.assertTrue (shared.is_shared (('field', 'flagged')))
+        self.assertTrue (shared.is_shared (('eq', ('field', 'type'), ('text', 'Task', False))))
+        self.assertFalse (shared.is_shared (plan1[1]))
+        the_now = datetime.now ()
+        expr1 = compile_plan (plan1[1], the_now, shared)
+        expr2 = compile_plan (plan2[1], the_now, shared)
+        task = Task (flagged=True)
+        self.assertTrue (expr1 (task))
+        self.assertFalse (expr2 (task))
+        self.assertEquals (2, shared.evaluations)
+        self.assertEquals (2, shared.saved)
+        self.assertTrue (SharedExpressions.MEMO in task.attribs)
+        shared.clear ()
+        self.assertFalse (SharedExpressions.MEMO in task.attribs)
@@ -0,0 +1,114 @@
+'''
+Copyright 2013 Paul Sidnell
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import unittest
+import random
+from datetime import datetime, timedelta
+from treemodel import Folder, Project, Task, Context, traverse
+from cmd_parser import make_plan, compile_filter_plan, now
+from columnar import AVAILABLE, Columns, ColumnarFilter, vectorizable
+
+def random_date (rnd):
+    if rnd.random () < 0.4:
+        return None
+    return now () + timedelta (days=rnd.randint (-10, 10))
+
+def build_tree (seed):
+    rnd = random.Random (seed)
+    root_folder = Folder (name=u'root folder')
+    root_context = Context (name=u'root context')
+    contexts = [root_context]
+    for i in range (4):
+        contexts.append (Context (name=u'context ' + str (i), parent=rnd.choice (contexts)))
+    parents = [root_folder]
+    for i in range (60):
+        parent = rnd.choice (parents)
+        name = u'node ' + str (i)
+        kind = rnd.random ()
+        if parent.type == 'Folder' and kind < 0.3:
+            node = Folder (name=name, parent=parent)
+        elif parent.type == 'Folder':
+            node = Project (name=name, parent=parent, flagged=rnd.random () < 0.3,
+                            date_due=random_date (rnd), date_to_start=random_date (rnd), date_completed=random_date (rnd))
+            if rnd.random () < 0.3:
+                rnd.choice (contexts).add_child (node)
+        else:
+            node = Task (name=name, parent=parent, flagged=rnd.random () < 0.3, nxt=rnd.random () < 0.3,
+                         date_due=random_date (rnd), date_to_start=random_date (rnd), date_completed=random_date (rnd))
+            rnd.choice (contexts).add_child (node)
+        node.marked = rnd.random () < 0.9
+        parents.append (node)
+    return root_folder, root_context
+
+def marks (root, result):
+    result[root.name] = root.marked
+    for child in root.children:
+        marks (child, result)
+    return result
+
+EXPRESSIONS = ['flagged = true',
+               '!flagged',
+               '(type=Task) and (flagged or next)',
+               '(type=Task) and (flagged = next)',
+               'type=Pro',
+               '(type=Task) and (due=today)',
+               'due = "last week"',
+               'start=none',
+               'done=any',
+               '(type=Task) and (next or !(due=none))',
+               '!(type=Context) and (done != any)']
+
+class Test_columnar(unittest.TestCase):
+    
+    def test_vectorizable (self):
+        self.assertTrue (vectorizable (make_plan ('flagged and due=today')[1]))
+        self.assertTrue (vectorizable (make_plan ('type=Task')[1]))
+        self.assertFalse (vectorizable (make_plan ('name=xxx')[1]))
+        self.assertFalse (vectorizable (make_plan ('flagged and note=xxx')[1]))
+        self.assertFalse (vectorizable (make_plan ('due=start')[1]))
+    
+    @unittest.skipUnless (AVAILABLE, 'numpy is not installed')
+    def test_matches_per_node_filter (self):
+        for seed in range (5):
+            for expr in EXPRESSIONS:
+                for include in [True, False]:
+                    for context_mode in [False, True]:
+                        plan = make_plan (expr)
+                        expected_folder, expected_context = build_tree (seed)
+                        actual_folder, actual_context = build_tree (seed)
+                        expected_root = expected_context if context_mode else expected_folder
+                        actual_root = actual_context if context_mode else actual_folder
+                        
+                        traverse (compile_filter_plan (plan, include), expected_root)
+                        ColumnarFilter (Columns (), plan, include, now ()).run (actual_root)
+                        
+                        description = str ((seed, expr, include, context_mode))
+                        self.assertEquals (marks (expected_folder, {}), marks (actual_folder, {}), description)
+                        self.assertEquals (marks (expected_context, {}), marks (actual_context, {}), description)
+    
+    @unittest.skipUnless (AVAILABLE, 'numpy is not installed')
+    def test_chain_reuses_table (self):
+        plan1 = make_plan ('(type=Task) and (flagged or due=today)')
+        plan2 = make_plan ('done=any')
+        expected_folder, expected_context = build_tree (7)
+        actual_folder, actual_context = build_tree (7)
+        traverse (compile_filter_plan (plan1, True), expected_folder)
+        traverse (compile_filter_plan (plan2, False), expected_folder)
+        columns = Columns ()
+        ColumnarFilter (columns, plan1, True, now ()).run (actual_folder)
+        ColumnarFilter (columns, plan2, False, now ()).run (actual_folder)
+        self.assertEquals (1, len (columns.tables))
+        self.assertEquals (marks (expected_folder, {}), marks (actual_folder, {}))
@@ -15,7 +15,7 @@ limitations under the License.
 '''
 
 import unittest
-from datematch import date_range_to_str, tidy_space_separated_fields, process_date_specifier, hunt_for_day, find_first_of_month, find_next_month, find_prev_month, find_end_of_month, find_january_this_year, hunt_for_month, find_monday_this_week, find_monday_next_week
+from datematch import date_range_to_str, tidy_space_separated_fields, process_date_specifier, hunt_for_day, find_first_of_month, find_next_month, find_prev_month, find_end_of_month, find_january_this_year, hunt_for_month, find_monday_this_week, find_monday_next_week, DATE_SPEC_CACHE
 from datetime import datetime
 
 def process_date_specifier_to_datestr (now, spec):
@@ -111,6 +111,39 @@ class Test_datematch(unittest.TestCase):
         self.assertEquals("2013-04-30", find_end_of_month (first).date().strftime ("%Y-%m-%d"))
         self.assertEquals("2013-04-30", find_end_of_month (last).date().strftime ("%Y-%m-%d"))
     
+    def test_month_arithmetic_wraps_year (self):
+        dec = datetime.strptime('Dec 31 2013 11:33PM', '%b %d %Y %I:%M%p')
+        jan = datetime.strptime('Jan 15 2013 11:33PM', '%b %d %Y %I:%M%p')
+        feb = datetime.strptime('Feb 10 2012 11:33PM', '%b %d %Y %I:%M%p')
+        
+        self.assertEquals("2014-01-01", find_next_month (dec).date().strftime ("%Y-%m-%d"))
+        self.assertEquals("2012-12-01", find_prev_month (jan).date().strftime ("%Y-%m-%d"))
+        self.assertEquals("2013-12-31", find_end_of_month (dec).date().strftime ("%Y-%m-%d"))
+        self.assertEquals("2012-02-29", find_end_of_month (feb).date().strftime ("%Y-%m-%d"))
+    
+    def test_process_date_specifier_cache (self):
+        morning = datetime.strptime('Apr 9 2013 08:15AM', '%b %d %Y %I:%M%p')
+        evening = datetime.strptime('Apr 9 2013 11:33PM', '%b %d %Y %I:%M%p')
+        wed = datetime.strptime('Apr 10 2013 11:33PM', '%b %d %Y %I:%M%p')
+        DATE_SPEC_CACHE.clear ()
+        
+        self.assertEquals("2013-04-08..2013-04-14", process_date_specifier_to_datestr (morning,"this week"))
+        self.assertEquals(1, DATE_SPEC_CACHE.misses)
+        self.assertEquals("2013-04-08..2013-04-14", process_date_specifier_to_datestr (evening,"  This   Week "))
+        self.assertEquals(1, DATE_SPEC_CACHE.hits)
+        self.assertEquals("2013-04-10", process_date_specifier_to_datestr (wed,"today"))
+        self.assertEquals("2013-04-09", process_date_specifier_to_datestr (evening,"today"))
+        self.assertEquals(3, DATE_SPEC_CACHE.misses)
+        
+        # Failures are not cached
+        for i in range (0, 2):
+            try:
+                process_date_specifier (evening, "next monkey")
+                self.fail('Exception expected')
+            except Exception as e:
+                self.assertEquals ('I don\'t think "next monkey" is any kind of date specification I recognise', e.message)
+        self.assertEquals(5, DATE_SPEC_CACHE.misses)
+    
     def test_hunt_for_month (self):
         apr = datetime.strptime('Apr 9 2013 11:33PM', '%b %d %Y %I:%M%p')
         
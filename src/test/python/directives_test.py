@@ -0,0 +1,60 @@
+'''
+Copyright 2013 Paul Sidnell
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import unittest
+from treemodel import Task, Note
+from omnifocus import OFNote
+from directives import parse_directives, text_directives, get_directives, directive_attribs, directive_text
+
+class CountingNote (OFNote):
+    def __init__ (self, task, xml):
+        OFNote.__init__(self, task, xml)
+        self.parses = 0
+    def get_note_lines (self):
+        self.parses += 1
+        return OFNote.get_note_lines (self)
+
+def xml_note (task, *lines):
+    return CountingNote (task, '<text>' + ''.join (['<p><run><lit>' + line + '</lit></run></p>' for line in lines]) + '</text>')
+
+class Test_directives(unittest.TestCase):
+
+    def test_parse_directives (self):
+        self.assertEquals ({}, parse_directives ([u'nothing here', u'%of cal']))
+        self.assertEquals ({u'cal' : [(u'allday', True), (u'start', u'18:30'), (u'noalarm', True)]},
+                           parse_directives ([u' %of cal allday start=18:30', u'text', u'%of cal noalarm']))
+        self.assertEquals ({u'cal' : [(u'a=b=c', True)], u'web' : [(u'x', u'1')]}, parse_directives ([u'%of cal a=b=c', u'%of web x=1']))
+        self.assertEquals ({u'cal' : [(u'allday', True)]}, text_directives (u'x\n%of cal allday'))
+        self.assertEquals ({}, text_directives (None))
+
+    def test_get_directives (self):
+        task = Task (name=u'x')
+        self.assertEquals ({}, get_directives (task))
+        self.assertEquals (None, directive_text (task, 'cal'))
+
+        task = Task (name=u'x')
+        task.note = xml_note (task, 'call the office', 'about 100 things')
+        self.assertEquals ({}, get_directives (task))
+        # Nothing that could be a directive, so the note wasn't parsed
+        self.assertEquals (0, task.note.parses)
+
+        task = Task (name=u'x')
+        task.note = xml_note (task, 'call the office', '%of cal start=18:30 noalarm')
+        self.assertEquals ({'start' : u'18:30', 'noalarm' : True}, directive_attribs (task, 'cal'))
+        self.assertEquals (u'start=18:30 noalarm', directive_text (task, 'cal'))
+        self.assertEquals ({}, directive_attribs (task, 'web'))
+        # Parsed once, whatever's asked for
+        self.assertEquals (1, task.note.parses)
@@ -0,0 +1,86 @@
+'''
+Copyright 2013 Paul Sidnell
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import unittest
+import os
+import shutil
+import tempfile
+import time
+from StringIO import StringIO
+from export_server import ExportServer, file_stamps
+from export_client import request
+
+class Test_export_server(unittest.TestCase):
+
+    def setUp (self):
+        self.dir = tempfile.mkdtemp ()
+        self.model_file = os.path.join (self.dir, 'model.txt')
+        self.socket_file = os.path.join (self.dir, 'server.sock')
+        self.write_model ('a,b,c')
+
+    def tearDown (self):
+        shutil.rmtree (self.dir)
+
+    def write_model (self, text):
+        out = open (self.model_file, 'w')
+        out.write (text)
+        out.close ()
+
+    def send (self, args):
+        out = StringIO ()
+        err = StringIO ()
+        status = request (args, self.socket_file, cwd=self.dir, out=out, err=err)
+        return status, out.getvalue (), err.getvalue ()
+
+    def test_file_stamps (self):
+        missing = os.path.join (self.dir, 'missing')
+        stamps = file_stamps ([self.model_file, missing])
+        self.assertEquals ((missing, None, None), stamps[1])
+        self.assertEquals (stamps, file_stamps ([self.model_file, missing]))
+        self.write_model ('a,b,c,d')
+        self.assertNotEquals (stamps, file_stamps ([self.model_file, missing]))
+
+    def test_serve (self):
+        def load ():
+            return open (self.model_file).read ().split (',')
+        def run (args, state):
+            assert args[0] != 'fail', 'failed'
+            # Only this request's copy of the state changes
+            state.append (args[0])
+            print ','.join (state), os.path.basename (os.getcwd ())
+        server = ExportServer (self.socket_file, lambda: [self.model_file], load, run)
+        pid = os.fork ()
+        if pid == 0:
+            status = 1
+            try:
+                server.serve (max_requests=4)
+                status = 0
+            finally:
+                os._exit (status)
+        try:
+            while not os.path.exists (self.socket_file):
+                time.sleep (0.01)
+            name = os.path.basename (self.dir)
+            self.assertEquals ((0, 'a,b,c,d ' + name + '\n', ''), self.send (['d']))
+            self.assertEquals ((0, 'a,b,c,e ' + name + '\n', ''), self.send ([u'e']))
+            status, out, err = self.send (['fail'])
+            self.assertEquals (1, status)
+            self.assertTrue ('AssertionError: failed' in err)
+            self.write_model ('x,y')
+            self.assertEquals ((0, 'x,y,f ' + name + '\n', ''), self.send (['f']))
+        finally:
+            self.assertEquals ((pid, 0), os.waitpid (pid, 0))
+        self.assertFalse (os.path.exists (self.socket_file))
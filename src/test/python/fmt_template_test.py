@@ -17,7 +17,8 @@ limitations under the License.
 import unittest
 from treemodel import Task
 from datetime import datetime
-from fmt_template import FmtTemplate, format_item, build_attrib_values, build_template_substitutions
+from fmt_template import FmtTemplate, CompiledTemplate, format_item, build_attrib_values, build_template_substitutions, build_used_substitutions
+from treemodel import Note
 from string import Template
 
 TAGS_TEMPLATE = Template ('$flagged$date_to_start$date_due$date_completed$context$project')
@@ -130,4 +131,27 @@ class Test_fmt_datematch(unittest.TestCase):
         template = FmtTemplate(DEFAULT_TEMPLATE)
         attribs = build_template_substitutions (task, ATTRIB_CONVERSIONS, ATTRIB_DEFAULTS, ATTRIB_TEMPLATES)
         line = format_item (template, 'TaskStart', attribs)
-        self.assertEquals ('T My Name @flagged @done(2015-02-03)', line)
\ No newline at end of file
+        self.assertEquals ('T My Name @flagged @done(2015-02-03)', line)
+    
+    def test_compiled_template (self):
+        attribs = {'name' : u'My Name', 'flagged' : ' @flagged', 'pct' : '100%'}
+        for text in [u'T $name$flagged', u'${name}s and $$name', u'$unknown ${unknown} $ $1 $', u'50% of $pct %s', u'', u'no placeholders']:
+            self.assertEquals (Template (text).safe_substitute (attribs), CompiledTemplate (Template (text)).render (attribs), text)
+        self.assertEquals (set (['name', 'unknown']), CompiledTemplate (Template (u'$name ${unknown} $$x')).names)
+    
+    def test_build_used_substitutions (self):
+        class CountingNote (Note):
+            reads = 0
+            def get_note (self):
+                CountingNote.reads += 1
+                return 'a note'
+        task = Task (name='My Name', flagged=True, note=CountingNote (), date_completed=datetime.strptime('2015-02-03', '%Y-%m-%d'))
+        data = dict (DEFAULT_TEMPLATE)
+        data['NodeAttributes'] = dict (DEFAULT_TEMPLATE['NodeAttributes'], note='$value')
+        data['NodeAttributeDefaults'] = dict (DEFAULT_TEMPLATE['NodeAttributeDefaults'], note='')
+        template = FmtTemplate(data)
+        conversions = dict (ATTRIB_CONVERSIONS, note=lambda x: x.get_note ())
+        values = build_used_substitutions (task, conversions, template)
+        self.assertEquals (0, CountingNote.reads)
+        self.assertFalse ('note' in values)
+        self.assertEquals ('T My Name @flagged @done(2015-02-03)', format_item (template, 'TaskStart', values))
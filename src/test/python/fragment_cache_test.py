@@ -0,0 +1,125 @@
+'''
+Copyright 2013 Paul Sidnell
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import unittest
+import os
+import tempfile
+from datetime import datetime
+from treemodel import Folder, Project, Task, Context
+from fmt_template import FmtTemplate, format_document
+from of_to_md import PrintMarkdownVisitor
+from output_sink import MemorySink
+from fragment_cache import FragmentCache
+
+TEMPLATE = {
+            'indent'          : 0,
+            'depth'           : 1,
+            'indentString'    : '  ',
+            'dateFormat'      : '%Y-%m-%d',
+            'Nodes'           : {
+                                 'FolderStart'    : '${hashes}${name}',
+                                 'ProjectStart'   : '${hashes}${name}$context',
+                                 'TaskStart'      : '$indent- ${name}$context$date_due ($depth)',
+                                 'TaskGroupStart' : '$indent- ${name}$context$date_due ($depth)'
+                                 },
+            'NodeAttributes'  : {
+                                 'name'           : '$value',
+                                 'context'        : ' @$value',
+                                 'date_due'       : ' due:$value'
+                                 },
+            'NodeAttributeDefaults' : {
+                                 'context'        : '',
+                                 'date_due'       : ''
+                                 }
+            }
+
+def build_tree ():
+    home = Context (name=u'home')
+    root = Folder (name=u'root')
+    for f in range (2):
+        folder = Folder (name=u'folder ' + str (f), parent=root)
+        for p in range (3):
+            project = Project (name=u'project ' + str (f) + '.' + str (p), parent=folder)
+            for t in range (3):
+                task = Task (name=u'task \u2713 ' + str (t), parent=project, context=home, date_due=datetime (2013, 5, t + 1))
+                Task (name=u'sub task', parent=task)
+    Project (name=u'loose project', parent=root)
+    return root, home
+
+def render (root, fragments=None):
+    out = MemorySink ()
+    format_document (root, PrintMarkdownVisitor (out, FmtTemplate (TEMPLATE)), True, fragments=fragments)
+    return out.getvalue ()
+
+class Test_fragment_cache(unittest.TestCase):
+
+    def test_warm_render (self):
+        root, home = build_tree ()
+        cold = render (root)
+        fragments = FragmentCache ()
+        self.assertEquals (cold, render (root, fragments))
+        self.assertEquals (0, fragments.hits)
+        self.assertEquals (cold, render (root, fragments))
+        self.assertEquals (3, fragments.hits)
+
+    def test_changes (self):
+        root, home = build_tree ()
+        fragments = FragmentCache ()
+        render (root, fragments)
+
+        # Only the folder and project holding the task are formatted again
+        root.children[0].children[1].children[2].name = u'renamed'
+        fragments.hits = fragments.misses = 0
+        self.assertEquals (render (root), render (root, fragments))
+        self.assertEquals ((4, 2), (fragments.hits, fragments.misses))
+
+        # As are the ones with a task the filters have taken out
+        root.children[1].children[0].children[0].marked = False
+        self.assertEquals (render (root), render (root, fragments))
+
+        # Or with a task in a renamed context
+        home.name = u'away'
+        self.assertEquals (render (root), render (root, fragments))
+
+        root.children[0].children[0].children[0].date_modified = datetime (2013, 5, 1)
+        fragments.hits = fragments.misses = 0
+        self.assertEquals (render (root), render (root, fragments))
+        self.assertEquals ((4, 2), (fragments.hits, fragments.misses))
+
+    def test_save_load (self):
+        fd, file_name = tempfile.mkstemp (suffix='.json')
+        os.close (fd)
+        os.remove (file_name)
+        try:
+            root, home = build_tree ()
+            cold = render (root)
+            fragments = FragmentCache (file_name)
+            render (root, fragments)
+            fragments.save ()
+
+            fragments = FragmentCache (file_name)
+            self.assertEquals (cold, render (root, fragments))
+            self.assertEquals (3, fragments.hits)
+            fragments.save ()
+
+            # Fragments nested in ones that were reused are kept
+            fragments = FragmentCache (file_name)
+            root.children[0].children[0].name = u'renamed'
+            self.assertEquals (render (root), render (root, fragments))
+            self.assertEquals ((4, 2), (fragments.hits, fragments.misses))
+        finally:
+            if os.path.exists (file_name):
+                os.remove (file_name)
@@ -0,0 +1,147 @@
+'''
+Copyright 2013 Paul Sidnell
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import unittest
+import os
+import shutil
+import socket
+import tempfile
+import time
+import signal
+import httplib
+from http_server import HttpExportServer, request_args, parse_address, gzip_body, render_body
+from StringIO import StringIO
+import gzip
+
+def free_port ():
+    probe = socket.socket ()
+    probe.bind (('127.0.0.1', 0))
+    port = probe.getsockname ()[1]
+    probe.close ()
+    return port
+
+class Test_http_server(unittest.TestCase):
+
+    def setUp (self):
+        self.dir = tempfile.mkdtemp ()
+        self.model_file = os.path.join (self.dir, 'model.txt')
+        self.renders_file = os.path.join (self.dir, 'renders.txt')
+        self.write_model ('a,b,c')
+
+    def tearDown (self):
+        shutil.rmtree (self.dir)
+
+    def write_model (self, text):
+        out = open (self.model_file, 'w')
+        out.write (text)
+        out.close ()
+
+    def test_request_args (self):
+        self.assertEquals ((['--report', u'week'], 'html'), request_args ('/week.html'))
+        self.assertEquals (([u'-t', u'due=today', u'-a', u'prune', u'--compact'], 'json'), request_args ('/export.json?t=due%3Dtoday&a=prune&compact'))
+        self.assertEquals ((['--report', u'caf\u00e9'], 'md'), request_args ('/caf%C3%A9.md'))
+        self.assertEquals (None, request_args ('/'))
+        self.assertEquals (None, request_args ('/week'))
+        self.assertEquals (None, request_args ('/a/week.html'))
+
+    def test_parse_address (self):
+        self.assertEquals (('127.0.0.1', 8080), parse_address ('8080'))
+        self.assertEquals (('0.0.0.0', 80), parse_address ('0.0.0.0:80'))
+
+    def test_gzip_body (self):
+        body = 'abc' * 1000
+        self.assertEquals (gzip_body (body), gzip_body (body))
+        self.assertEquals (body, gzip.GzipFile (fileobj=StringIO (gzip_body (body))).read ())
+
+    def test_render_body (self):
+        def render (args, file_name, state):
+            assert args[0] != 'fail', 'failed'
+            state.append (args[0])
+            print 'not in the body'
+            out = open (file_name, 'w')
+            out.write (','.join (state))
+            out.close ()
+        state = ['a']
+        self.assertEquals ('a,b', render_body (render, ['b'], 'txt', state))
+        self.assertEquals (['a'], state)
+        self.assertEquals (None, render_body (render, ['fail'], 'txt', state))
+
+    def test_serve (self):
+        def load ():
+            return open (self.model_file).read ().split (',')
+        def render (args, file_name, state):
+            assert not '--fail' in args, 'failed'
+            out = open (self.renders_file, 'a')
+            out.write ('x')
+            out.close ()
+            out = open (file_name, 'w')
+            out.write (','.join (state + args) * (500 if 'big' in args else 1))
+            out.close ()
+        port = free_port ()
+        server = HttpExportServer (('127.0.0.1', port), lambda: [self.model_file], load, render)
+        pid = os.fork ()
+        if pid == 0:
+            status = 1
+            try:
+                server.serve (max_requests=9)
+                status = 0
+            finally:
+                os._exit (status)
+
+        def get (path, headers={}):
+            for attempt in range (100):
+                try:
+                    conn = httplib.HTTPConnection ('127.0.0.1', port)
+                    conn.request ('GET', path, headers=headers)
+                    break
+                except socket.error:
+                    time.sleep (0.02)
+            response = conn.getresponse ()
+            body = response.read ()
+            conn.close ()
+            return response.status, response.getheader ('ETag'), response.getheader ('Content-Encoding'), body
+
+        def renders ():
+            return len (open (self.renders_file).read ()) if os.path.exists (self.renders_file) else 0
+
+        reaped = None
+        try:
+            status, etag, encoding, body = get ('/export.txt?x=1')
+            self.assertEquals ((200, None, 'a,b,c,-x,1'), (status, encoding, body))
+            self.assertEquals ((200, etag, None, 'a,b,c,-x,1'), get ('/export.txt?x=1'))
+            self.assertEquals ((304, etag, None, ''), get ('/export.txt?x=1', {'If-None-Match' : etag}))
+            self.assertEquals (1, renders ())
+            self.assertEquals (500, get ('/export.txt?fail')[0])
+            self.assertEquals (404, get ('/nothing')[0])
+            # Touched, but the same data
+            os.utime (self.model_file, (0, 0))
+            self.assertEquals ((304, etag, None, ''), get ('/export.txt?x=1', {'If-None-Match' : etag}))
+            self.write_model ('x,y')
+            status, new_etag, encoding, body = get ('/export.txt?x=1', {'If-None-Match' : etag})
+            self.assertEquals ((200, 'x,y,-x,1'), (status, body))
+            self.assertNotEquals (etag, new_etag)
+            status, etag, encoding, body = get ('/big.txt', {'Accept-Encoding' : 'gzip'})
+            self.assertEquals ((200, 'gzip'), (status, encoding))
+            self.assertTrue (etag.endswith ('-gzip"'))
+            self.assertEquals ('x,y,--report,big' * 500, gzip.GzipFile (fileobj=StringIO (body)).read ())
+            self.assertEquals ((304, etag, None, ''), get ('/big.txt', {'Accept-Encoding' : 'gzip', 'If-None-Match' : etag}))
+            self.assertEquals (3, renders ())
+            reaped = os.waitpid (pid, 0)
+            self.assertEquals ((pid, 0), reaped)
+        finally:
+            if reaped == None:
+                os.kill (pid, signal.SIGKILL)
+                os.waitpid (pid, 0)
@@ -0,0 +1,132 @@
+'''
+Copyright 2013 Paul Sidnell
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import unittest
+import os
+import re
+import shutil
+import tempfile
+import codecs
+import json
+from datetime import datetime
+from treemodel import Folder, Project, Task
+from fmt_template import FmtTemplate, format_document
+from of_to_ics import PrintCalendarVisitor
+from output_sink import MemorySink
+from ics_feed import IcsFeed, event_key, format_feed
+
+def load_ics_template ():
+    instream=codecs.open(os.environ['OFEXPORT_HOME'] + '/templates/ics.json', 'r', 'utf-8')
+    template = FmtTemplate (json.loads(instream.read()))
+    instream.close ()
+    return template
+
+def build_tree ():
+    root = Folder (name=u'')
+    project = Project (name=u'project', parent=root, date_due=datetime (2013, 5, 1, 9, 0))
+    project.link = u'omnifocus:///task/p1'
+    project.date_modified = datetime (2013, 4, 1, 12, 30, 15)
+    for i in range (3):
+        task = Task (name=u'task ' + str (i), parent=project, date_to_start=datetime (2013, 5, 2 + i, 10, 0))
+        task.link = u'omnifocus:///task/t' + str (i)
+    Task (name=u'undated', parent=project)
+    return root
+
+def events (text):
+    return re.findall ('BEGIN:VEVENT\n(.*?)END:VEVENT', text, re.DOTALL)
+
+class Test_ics_feed(unittest.TestCase):
+
+    def setUp (self):
+        self.dir = tempfile.mkdtemp ()
+        self.file_name = os.path.join (self.dir, 'week.feed')
+        self.template = load_ics_template ()
+
+    def tearDown (self):
+        shutil.rmtree (self.dir)
+
+    def write (self, root, delta=False):
+        feed = IcsFeed (self.file_name, self.template.identity, delta=delta)
+        out = MemorySink ()
+        format_feed (root, PrintCalendarVisitor (out, self.template, feed=feed), True)
+        feed.save ()
+        return out.getvalue (), feed
+
+    def test_event_key (self):
+        task = Task (name=u'x')
+        self.assertEquals (task.id, event_key (task))
+        task.link = u'omnifocus:///task/abc'
+        self.assertEquals ('abc', event_key (task))
+
+    def test_feed (self):
+        text, feed = self.write (build_tree ())
+        self.assertEquals ((0, 4), (feed.hits, feed.misses))
+        self.assertEquals (4, len (events (text)))
+        self.assertTrue ('UID:p1\n' in text)
+        self.assertTrue ('UID:t2\n' in text)
+        self.assertTrue ('DESCRIPTION:\nBEGIN:VALARM' in text)
+        self.assertTrue ('SEQUENCE:0\nLAST-MODIFIED:20130401T113015Z\nEND:VEVENT' in text)
+        self.assertEquals (4, text.count ('SEQUENCE:0\n'))
+
+        # Apart from the UIDs and revisions it's the plain calendar
+        root = build_tree ()
+        for node in [root.children[0]] + root.children[0].children:
+            node.id = str (event_key (node))
+        out = MemorySink ()
+        format_document (root, PrintCalendarVisitor (out, self.template), True)
+        self.assertEquals (out.getvalue (), re.sub ('SEQUENCE:.*\n|LAST-MODIFIED:.*\n', '', text))
+
+        # Nothing has changed, everything comes from the feed
+        again, feed = self.write (build_tree ())
+        self.assertEquals ((4, 0), (feed.hits, feed.misses))
+        self.assertEquals (text, again)
+
+        root = build_tree ()
+        root.children[0].children[1].name = u'renamed'
+        changed, feed = self.write (root)
+        self.assertEquals ((3, 1), (feed.hits, feed.misses))
+        self.assertEquals (1, changed.count ('SEQUENCE:1\n'))
+        self.assertTrue ('SUMMARY:renamed\nURL:omnifocus:///task/t1\nUID:t1\n' in changed)
+        self.assertEquals (events (text)[:2] + events (text)[3:], events (changed)[:2] + events (changed)[3:])
+
+    def changed_tree (self):
+        root = build_tree ()
+        project = root.children[0]
+        project.children[0].name = u'renamed'
+        del project.children[2]
+        return root
+
+    def test_delta (self):
+        self.write (build_tree ())
+        text, feed = self.write (self.changed_tree (), delta=True)
+        found = events (text)
+        self.assertEquals (2, len (found))
+        self.assertTrue ('SUMMARY:renamed\n' in found[0])
+        self.assertTrue (found[0].endswith ('SEQUENCE:1\n'))
+        self.assertTrue (re.match ('UID:t2\nSEQUENCE:1\nDTSTAMP:\\d{8}T\\d{6}Z\nSTATUS:CANCELLED\n', found[1]))
+        self.assertTrue (text.startswith ('BEGIN:VCALENDAR\n'))
+        self.assertTrue (text.endswith ('END:VCALENDAR\n'))
+
+        # The cancelled event is forgotten, the others are still there
+        text, feed = self.write (self.changed_tree (), delta=True)
+        self.assertEquals ((3, 0), (feed.hits, feed.misses))
+        self.assertEquals ([], events (text))
+
+    def test_template_changed (self):
+        self.write (build_tree ())
+        self.template.identity = 'another'
+        text, feed = self.write (build_tree ())
+        self.assertEquals ((0, 4), (feed.hits, feed.misses))
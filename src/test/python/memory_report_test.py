@@ -0,0 +1,75 @@
+'''
+Copyright 2013 Paul Sidnell
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import unittest
+import sys
+from StringIO import StringIO
+from treemodel import Folder, Project, Task, Context
+from memory_report import rss, high_water, deep_size, model_nodes, model_breakdown, write_breakdown
+
+def build_tree ():
+    root_project = Folder (name=u'')
+    root_context = Context (name=u'')
+    home = Context (name=u'home', parent=root_context)
+    project = Project (name=u'project', parent=root_project)
+    for t in range (3):
+        task = Task (name=u'task ' + str (t), parent=project, context=home)
+        home.children.append (task)
+        task.attribs['attrib_cache'] = {'name' : u'task ' + str (t)}
+    project.attribs['counted'] = True
+    return root_project, root_context
+
+class Test_memory_report(unittest.TestCase):
+
+    def test_process_sizes (self):
+        if sys.platform.startswith ('linux'):
+            self.assertTrue (rss () > 0)
+        self.assertTrue (high_water () > 0)
+
+    def test_deep_size (self):
+        text = u'x' * 100
+        value = {'a' : [text, text], 'b' : (text,)}
+        size = deep_size (value, set ())
+        self.assertTrue (size > sys.getsizeof (text) and size < 2 * sys.getsizeof (text) + 1000)
+        # Counted once
+        seen = set ()
+        deep_size (value, seen)
+        self.assertEquals (0, deep_size (value, seen))
+        self.assertEquals (0, deep_size ([text], seen) - sys.getsizeof ([text]))
+        # Nodes count as themselves, not as part of what refers to them
+        self.assertEquals (sys.getsizeof ([None]), deep_size ([Task (name=u'x')], set ()))
+
+    def test_model_nodes (self):
+        root_project, root_context = build_tree ()
+        nodes = model_nodes ([root_project, root_context])
+        self.assertEquals (7, len (nodes))
+        self.assertEquals (7, len (set ([id (node) for node in nodes])))
+
+    def test_model_breakdown (self):
+        root_project, root_context = build_tree ()
+        breakdown = model_breakdown (model_nodes ([root_project, root_context]))
+        self.assertEquals ([('Context', 2), ('Folder', 1), ('Project', 1), ('Task', 3)],
+                           [(name, count) for name, (count, size) in sorted (breakdown['types'].items ())])
+        self.assertEquals (3, breakdown['attribs']['attrib_cache'][0])
+        self.assertEquals (1, breakdown['attribs']['counted'][0])
+        self.assertTrue (breakdown['attribs']['attrib_cache'][1] > 0)
+        # Everything a node holds is put down to something
+        self.assertEquals (sum ([size for count, size in breakdown['types'].values ()]), sum (breakdown['members'].values ()))
+        out = StringIO ()
+        write_breakdown (out, breakdown)
+        lines = out.getvalue ().splitlines ()
+        self.assertTrue ('node type           count         KB' in lines)
+        self.assertTrue ([line for line in lines if line.startswith ('attrib_cache' + ' ' * 12 + '3')])
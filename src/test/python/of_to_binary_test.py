@@ -0,0 +1,114 @@
+'''
+Copyright 2013 Paul Sidnell
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import unittest
+import os
+import shutil
+import tempfile
+from treemodel import FOLDER, PROJECT, CONTEXT
+from output_sink import file_sink
+from of_to_json import write_json, read_json
+from of_to_binary import write_binary, read_binary, BinaryModel, RECORD, KINDS
+from test_helper import model_values
+
+DATA = os.path.join (os.path.dirname (os.path.abspath (__file__)), '..', 'data')
+
+class Test_of_to_binary(unittest.TestCase):
+
+    def setUp (self):
+        self.dir = tempfile.mkdtemp ()
+        self.file_name = os.path.join (self.dir, 'db.ofbin')
+
+    def tearDown (self):
+        shutil.rmtree (self.dir)
+
+    def test_round_trip (self):
+        for name in ['db-1.json', 'db-3.json', 'db-5.json']:
+            write_binary (self.file_name, *read_json (os.path.join (DATA, name)))
+            self.assertEquals (model_values (*read_json (os.path.join (DATA, name))), model_values (*read_binary (self.file_name)))
+
+    def test_unmarked (self):
+        root_project, root_context = read_json (os.path.join (DATA, 'db-5.json'))
+        root_project.children[0].children[0].marked = False
+        root_context.children[0].marked = False
+        write_binary (self.file_name, root_project, root_context)
+        # What's left is what json would have written
+        json_file_name = os.path.join (self.dir, 'db.json')
+        out = file_sink (json_file_name)
+        write_json (out, root_project, root_context)
+        out.close ()
+        self.assertEquals (model_values (*read_json (json_file_name)), model_values (*read_binary (self.file_name)))
+
+    def test_index (self):
+        root_project, root_context = read_json (os.path.join (DATA, 'db-5.json'))
+        write_binary (self.file_name, root_project, root_context)
+        model = BinaryModel (self.file_name)
+        try:
+            index = model.index ()
+            names = []
+            for offset, kind, parent, name in index:
+                size, record_kind, mask = RECORD.unpack_from (model.data, offset)
+                self.assertEquals (kind, record_kind)
+                self.assertTrue (KINDS[kind] in (FOLDER, PROJECT, CONTEXT))
+                self.assertTrue (parent < len (index))
+                names.append ((KINDS[kind], model.name (name)))
+        finally:
+            model.close ()
+        expected = []
+        def find (node, types):
+            for child in node.children:
+                if child.type in types:
+                    expected.append ((child.type, child.name))
+                    find (child, types)
+        find (root_project, (FOLDER, PROJECT))
+        find (root_context, (CONTEXT,))
+        self.assertEquals (expected, names)
+
+    def test_not_binary (self):
+        out = open (self.file_name, 'wb')
+        out.write ('[{"children" : []}, {"children" : []}]' + ' ' * 64)
+        out.close ()
+        self.assertRaises (AssertionError, read_binary, self.file_name)
+
+    def test_partial (self):
+        write_binary (self.file_name, *read_json (os.path.join (DATA, 'db-5.json')))
+        root_project, root_context = read_binary (self.file_name, wanted_fn=lambda node_type, name: name == u'Worms')
+        # Just the way to Worms and everything in it
+        self.assertEquals ([u'Test Folder'], [child.name for child in root_project.children])
+        self.assertEquals ([u'3-Sub Folder 2'], [child.name for child in root_project.children[0].children])
+        worms = root_project.children[0].children[0].children[0]
+        self.assertEquals ([u'Worms'], [child.name for child in root_project.children[0].children[0].children])
+        loaded = set ()
+        def find (node):
+            loaded.add (node)
+            for child in node.children:
+                find (child)
+        find (worms)
+        self.assertTrue (len (loaded) > 2)
+        # The contexts are all there but only refer to what was loaded
+        def contexts (context, names, refs):
+            names.append (context.name)
+            for child in context.children:
+                if child.type == CONTEXT:
+                    contexts (child, names, refs)
+                else:
+                    refs.append (child)
+            return names
+        refs = []
+        full_project, full_context = read_json (os.path.join (DATA, 'db-5.json'))
+        self.assertEquals (contexts (full_context, [], []), contexts (root_context, [], refs))
+        self.assertTrue (len (refs) > 0)
+        self.assertEquals ([], [ref for ref in refs if not ref in loaded])
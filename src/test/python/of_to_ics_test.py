@@ -15,9 +15,10 @@ limitations under the License.
 '''
 
 import unittest
-from of_to_ics import fix_dates, load_note_attribs, utc, format_date, format_alarm
+from of_to_ics import fix_dates, load_note_attribs, utc, format_date, format_alarm, UtcConverter
 from treemodel import Task, Note
-from datetime import datetime
+from omnifocus import OFNote
+from datetime import datetime, timedelta
 import dateutil.parser
 
 class TestNote (Note):
@@ -105,6 +106,35 @@ class Test_fmt_datematch(unittest.TestCase):
         self.assertEquals ("2010.10.27 22:17 UTC", the_date.strftime ('%Y.%m.%d %H:%M %Z'))
         self.assertEquals ("2010.10.27 22:17", utc(the_date).strftime ('%Y.%m.%d %H:%M'))
         
+    def test_utc_converter (self):
+        converter = UtcConverter ()
+        # Every half hour through both of 2013's clock changes and a day either side
+        for start in [datetime (2013, 3, 30), datetime (2013, 10, 26)]:
+            for i in range (4 * 48):
+                the_date = start + timedelta (minutes=30 * i, seconds=i % 7)
+                self.assertEquals (utc (the_date), converter (the_date))
+        self.assertEquals (None, converter.offsets[datetime (2013, 3, 31).date ()])
+        self.assertNotEquals (None, converter.offsets[datetime (2013, 3, 30).date ()])
+        the_date = dateutil.parser.parse('Wed, 27 Oct 2010 22:17:00 UTC')
+        self.assertEquals (utc (the_date), converter (the_date))
+        
+    def test_note_may_contain (self):
+        self.assertTrue (TestNote ("x\n %of cal allday").may_contain ('%of'))
+        self.assertFalse (TestNote ("x\n of cal allday").may_contain ('%of'))
+        xml = '<text><p><run><lit>%o</lit></run><run><lit>f cal allday</lit></run></p></text>'
+        task = Task ()
+        self.assertTrue (OFNote (task, xml).may_contain ('%of'))
+        self.assertFalse (OFNote (task, xml.replace ('%', '')).may_contain ('%of'))
+        self.assertTrue (OFNote (task, xml.replace ('%', '&#37;')).may_contain ('%of'))
+        note = OFNote (task, xml.replace ('%', ''))
+        load_note_attribs (Task (note=note))
+        self.assertEquals (None, note.lines)
+        note = OFNote (task, xml)
+        task = Task (note=note)
+        load_note_attribs (task)
+        self.assertEquals ([u'%of cal allday'], note.lines)
+        self.assertEquals (True, task.attribs['allday'])
+        
     def test_format_date (self):
         wed = dateutil.parser.parse('Wed, 27 Oct 2010 22:17:00 BST')
         thu = dateutil.parser.parse('Thu, 28 Oct 2010 22:17:00 BST')
@@ -132,6 +162,10 @@ class Test_fmt_datematch(unittest.TestCase):
         self.assertEquals ("20101027", format_date (task, task.date_to_start, False))
         self.assertEquals ("20101029", format_date (task, task.date_due, True))
         
+        task = Task ()
+        sun = datetime (2013, 3, 31, 12, 30)
+        self.assertEquals (format_date (task, sun, False), format_date (task, sun, False, UtcConverter ()))
+        
     def test_format_alarm (self):
         task = Task ()
         self.assertEquals ("BEGIN:VALARM\nACTION:DISPLAY\nDESCRIPTION:OmniFocus Reminder\nTRIGGER:-PT0M\nEND:VALARM\n", format_alarm (task))
@@ -0,0 +1,121 @@
+'''
+Copyright 2013 Paul Sidnell
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import unittest
+import json
+import os
+import codecs
+import tempfile
+from datetime import datetime
+from treemodel import CONTEXT
+from output_sink import MemorySink, file_sink
+from of_to_json import write_json, read_json, load_from_json, parse_time, JsonTokens, stream_trees
+from test_helper import model_values
+
+DB = os.path.join (os.path.dirname (os.path.abspath (__file__)), '..', 'data', 'db-1.json')
+
+def to_json (root_project, root_context, compact=False):
+    out = MemorySink ()
+    write_json (out, root_project, root_context, compact=compact)
+    return out.getvalue ()
+
+def descendant_ids (node, ids):
+    for child in node.children:
+        ids.append (child.id)
+        descendant_ids (child, ids)
+    return ids
+
+def refs (context_data, refs_found):
+    for child in context_data['children']:
+        if 'ref' in child:
+            refs_found.append (child['ref'])
+        else:
+            refs (child, refs_found)
+    return refs_found
+
+class Test_of_to_json(unittest.TestCase):
+
+    def test_write_json (self):
+        text = open (DB, 'rb').read ()
+        # The same bytes as dumping the whole document in one go
+        self.assertEquals (json.dumps (json.loads (text), sort_keys=True, indent=2) + '\n', text)
+        self.assertEquals (text, to_json (*read_json (DB)).encode ('utf-8'))
+
+    def test_unmarked (self):
+        root_project, root_context = read_json (DB)
+        data = json.loads (to_json (root_project, root_context))
+        all_refs = refs (data[1], [])
+        project = root_project.children[0]
+        project.marked = False
+        data = json.loads (to_json (root_project, root_context))
+        self.assertFalse (project.id in [child['id'] for child in data[0]['children']])
+        # No refs to tasks that weren't written
+        task_ids = descendant_ids (project, [])
+        self.assertTrue (len (set (all_refs) & set (task_ids)) > 0)
+        self.assertEquals ([ref for ref in all_refs if not ref in task_ids], refs (data[1], []))
+        context = [child for child in root_context.children if child.type == CONTEXT][0]
+        context.marked = False
+        data = json.loads (to_json (root_project, root_context))
+        self.assertFalse (context.id in [child.get ('id') for child in data[1]['children']])
+
+    def test_compact (self):
+        text = to_json (*read_json (DB), compact=True)
+        self.assertEquals (1, text.count ('\n'))
+        self.assertFalse ('": ' in text)
+        self.assertEquals (json.loads (open (DB, 'rb').read ()), json.loads (text))
+
+    def test_round_trip (self):
+        fd, file_name = tempfile.mkstemp (suffix='.json')
+        os.close (fd)
+        try:
+            out = file_sink (file_name)
+            write_json (out, *read_json (DB), compact=True)
+            out.close ()
+            self.assertEquals (open (DB, 'rb').read (), to_json (*read_json (file_name)).encode ('utf-8'))
+        finally:
+            os.remove (file_name)
+
+    def test_parse_time (self):
+        self.assertEquals (datetime (2013, 5, 20, 9, 5, 1), parse_time ('2013-05-20 09:05:01'))
+        self.assertEquals (datetime (2013, 5, 2, 9, 5, 1), parse_time ('2013-5-2 09:05:01'))
+        self.assertRaises (ValueError, parse_time, '2013-05-32 09:05:01')
+
+    def test_read_json (self):
+        # The same model as the recursive reader makes
+        instream = codecs.open (DB, 'r', 'utf-8')
+        json_data = json.loads (instream.read ())
+        instream.close ()
+        item_db = {}
+        expected = model_values (load_from_json (json_data[0], item_db), load_from_json (json_data[1], item_db))
+        self.assertEquals (expected, model_values (*read_json (DB, stream=False)))
+        self.assertEquals (expected, model_values (*read_json (DB, stream=True)))
+
+    def test_stream_small_blocks (self):
+        for compact in [False, True]:
+            text = to_json (*read_json (DB), compact=compact)
+            fd, file_name = tempfile.mkstemp (suffix='.json')
+            os.close (fd)
+            try:
+                out = codecs.open (file_name, 'w', 'utf-8')
+                out.write (text)
+                out.close ()
+                for block_size in [1, 7, 100]:
+                    instream = codecs.open (file_name, 'r', 'utf-8')
+                    root_project, root_context = stream_trees (JsonTokens (instream, block_size=block_size), {})
+                    instream.close ()
+                    self.assertEquals (open (DB, 'rb').read (), to_json (root_project, root_context).encode ('utf-8'))
+            finally:
+                os.remove (file_name)
@@ -15,8 +15,57 @@ limitations under the License.
 '''
 
 import unittest
+import os
+import shutil
+import tempfile
+from ofexport import fix_abbrieviated_expr, apply_filters, first_filter_subtrees, load_server_state, serve_request, http_request, run_outputs, TEMPLATES
+from of_to_json import read_json
+from of_to_binary import write_binary, read_binary
+from of_to_tp import PrintTaskpaperVisitor
+from fmt_template import FmtTemplate, format_document
+from treemodel import TreeView, FOLDER, PROJECT
+from output_sink import MemorySink
+from profiler import run_profiled
+import json
 
-from ofexport import fix_abbrieviated_expr
+DB = os.path.join (os.path.dirname (os.path.abspath (__file__)), '..', 'data', 'db-5.json')
+
+TEMPLATE = {
+            'indent'          : 0,
+            'depth'           : 1,
+            'indentString'    : '\t',
+            'dateFormat'      : '%Y-%m-%d',
+            'Nodes'           : {
+                                 'FolderStart'    : '$indent$name:',
+                                 'ProjectStart'   : '$indent$name:',
+                                 'ContextStart'   : '$indent$name:',
+                                 'TaskStart'      : '$indent- $name$flagged',
+                                 'TaskGroupStart' : '$indent- $name$flagged'
+                                 },
+            'NodeAttributes'  : {
+                                 'name'           : '$value',
+                                 'flagged'        : ' @flagged'
+                                 },
+            'NodeAttributeDefaults' : {'flagged' : ''}
+            }
+
+REPORTS = [
+           [('-a', 'flagged'), ('-a', 'prune')],
+           [('-E',), ('-t', 'flagged'), ('-a', 'flatten'), ('-a', 'sort')],
+           [('--tasks', '')],
+           [('-C',), ('-c', 'name=Sub')],
+           []
+           ]
+
+def full_opts (opts):
+    return [opt if len (opt) == 2 else (opt[0], '') for opt in opts]
+
+def report (opts, root_project, root_context):
+    opts = full_opts (opts)
+    subject = apply_filters (opts, root_project, root_context)
+    out = MemorySink ()
+    format_document (subject, PrintTaskpaperVisitor (out, FmtTemplate (TEMPLATE)), True)
+    return out.getvalue ()
 
 class Test_fmt_datematch(unittest.TestCase):
     
@@ -29,4 +78,90 @@ class Test_fmt_datematch(unittest.TestCase):
         self.assertEquals ('prune any', fix_abbrieviated_expr ('any', 'prune'))
         self.assertEquals ('prune all', fix_abbrieviated_expr ('all', 'prune'))
         self.assertEquals ('sort Folder text', fix_abbrieviated_expr ('Folder', 'sort'))
-        self.assertEquals ('sort Folder due', fix_abbrieviated_expr ('Folder', 'sort due'))
\ No newline at end of file
+        self.assertEquals ('sort Folder due', fix_abbrieviated_expr ('Folder', 'sort due'))
+
+    def test_reports_in_views (self):
+        root_project, root_context = read_json (DB)
+        views = [TreeView () for opts in REPORTS]
+        for opts, view in zip (REPORTS, views):
+            with view:
+                text = report (opts, root_project, root_context)
+            # The same as from a fresh load
+            self.assertEqual (report (opts, *read_json (DB)), text)
+        self.assertEqual (report ([], *read_json (DB)), report ([], root_project, root_context))
+
+    def test_first_filter_subtrees (self):
+        for opts in [[('-C',), ('-f', '=Ham')], [('-a', '=Ham')], [('-f', 'flagged')], [('-a', 'prune')], [('-E',), ('-f', '=Ham')], []]:
+            self.assertEquals (None, first_filter_subtrees (full_opts (opts)))
+        wanted = first_filter_subtrees (full_opts ([('-o', 'x.txt'), ('-P',), ('-f', '=Ham'), ('-C',)]))
+        self.assertTrue (wanted (FOLDER, u'Ham'))
+        self.assertFalse (wanted (PROJECT, u'Ham'))
+        self.assertFalse (wanted (FOLDER, u'Worms'))
+        self.assertFalse (wanted (FOLDER, None))
+
+    def test_partial_load (self):
+        directory = tempfile.mkdtemp ()
+        try:
+            file_name = os.path.join (directory, 'db.ofbin')
+            write_binary (file_name, *read_json (DB))
+            for opts in [[('-f', '=Ham')], [('-p', '!=F2'), ('-a', 'prune')], [('-f', '=Worms'), ('-C',)], [('-p', '=Compost'), ('-C',), ('-c', 'name=Sub')], [('-f', '=Nothing')]]:
+                wanted = first_filter_subtrees (full_opts (opts))
+                self.assertNotEquals (None, wanted)
+                # Everything the filters leave is loaded
+                self.assertEqual (report (opts, *read_json (DB)), report (opts, *read_binary (file_name, wanted_fn=wanted)))
+        finally:
+            shutil.rmtree (directory)
+
+    def test_serve_request (self):
+        directory = tempfile.mkdtemp ()
+        cwd = os.getcwd ()
+        try:
+            reports_file = os.path.join (directory, 'reports.json')
+            out = open (reports_file, 'w')
+            out.write ('{"reports" : {"ham" : "-f =Ham -o ham.txt"}}')
+            out.close ()
+            state = load_server_state (DB, None, reports_file)
+            # The report's filter was planned and the templates compiled when the state was loaded
+            self.assertTrue ('(type=Folder) and (name=Ham)' in state[3].plans)
+            self.assertTrue (os.environ['OFEXPORT_HOME'] + '/templates/ics.json' in TEMPLATES)
+            os.chdir (directory)
+            serve_request (['--report', 'ham'], state)
+            self.assertTrue ('\n    Folder: Ham\n' in open (os.path.join (directory, 'ham.txt')).read ())
+            self.assertRaises (AssertionError, serve_request, ['-i', DB, '-o', 'x.txt'], state)
+            self.assertRaises (AssertionError, serve_request, ['--report', 'nothing'], state)
+        finally:
+            os.chdir (cwd)
+            shutil.rmtree (directory)
+
+    def test_http_request (self):
+        directory = tempfile.mkdtemp ()
+        cwd = os.getcwd ()
+        try:
+            reports_file = os.path.join (directory, 'reports.json')
+            out = open (reports_file, 'w')
+            out.write ('{"reports" : {"ham" : "-f =Ham -o ham.txt"}}')
+            out.close ()
+            state = load_server_state (DB, None, reports_file)
+            os.chdir (directory)
+            # The response goes where the server says, not to the report's file
+            file_name = os.path.join (directory, 'export.md')
+            http_request (['--report', 'ham'], file_name, state)
+            self.assertTrue ('Ham' in open (file_name).read ())
+            self.assertFalse (os.path.exists (os.path.join (directory, 'ham.txt')))
+            self.assertRaises (AssertionError, http_request, ['-o', 'x.txt'], file_name, state)
+            self.assertRaises (AssertionError, http_request, ['--fragments', 'x.json'], file_name, state)
+        finally:
+            os.chdir (cwd)
+            shutil.rmtree (directory)
+
+    def test_profile (self):
+        directory = tempfile.mkdtemp ()
+        try:
+            profile_file = os.path.join (directory, 'profile.json')
+            opts = full_opts ([('-f', '=Ham'), ('-a', 'prune'), ('-o', os.path.join (directory, 'x.txt'))])
+            run_profiled (lambda: run_outputs (opts, None, DB, None, None, None), profile_file)
+            phases = json.load (open (profile_file))['phases']
+            self.assertEquals ([u'load', u'plan', u'filter -f =Ham', u'filter -a prune', u'render', u'summary'],
+                               [phase['name'] for phase in phases])
+        finally:
+            shutil.rmtree (directory)
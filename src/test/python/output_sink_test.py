@@ -0,0 +1,54 @@
+'''
+Copyright 2013 Paul Sidnell
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import unittest
+import os
+import tempfile
+import codecs
+from output_sink import OutputSink, MemorySink, file_sink
+
+class Test_output_sink(unittest.TestCase):
+    
+    def test_print (self):
+        out = MemorySink ()
+        print >>out, u'caf\u00e9'
+        print >>out
+        print >>out, 'plain', u'mixed'
+        self.assertEquals (u'caf\u00e9\n\nplain mixed\n', out.getvalue ())
+    
+    def test_flush_if_full (self):
+        out = MemorySink (max_chunks=4)
+        print >>out, 'a'
+        out.flush_if_full ()
+        self.assertEquals ('', out.target.getvalue ())
+        print >>out, 'b'
+        out.flush_if_full ()
+        self.assertEquals ('a\nb\n', out.target.getvalue ())
+        self.assertEquals (0, len (out.chunks))
+    
+    def test_file_sink (self):
+        fd, file_name = tempfile.mkstemp (suffix='.txt')
+        os.close (fd)
+        try:
+            out = file_sink (file_name)
+            for i in range (3):
+                print >>out, u'line \u2713', i
+            out.close ()
+            instream = codecs.open (file_name, 'r', 'utf-8')
+            self.assertEquals (u'line \u2713 0\nline \u2713 1\nline \u2713 2\n', instream.read ())
+            instream.close ()
+        finally:
+            os.remove (file_name)
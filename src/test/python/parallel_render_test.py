@@ -0,0 +1,82 @@
+'''
+Copyright 2013 Paul Sidnell
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import unittest
+from treemodel import Folder, Project, Task
+from fmt_template import FmtTemplate, format_document, Formatter
+from of_to_md import PrintMarkdownVisitor
+from output_sink import MemorySink
+from parallel_render import split_chunks
+
+TEMPLATE = {
+            'indent'          : 0,
+            'depth'           : 1,
+            'indentString'    : '  ',
+            'dateFormat'      : '%Y-%m-%d',
+            'preamble'        : 'start',
+            'postamble'       : 'end',
+            'Nodes'           : {
+                                 'FolderStart'    : '${hashes}${name} ($depth)',
+                                 'FolderEnd'      : '$indent/folder',
+                                 'ProjectStart'   : '${hashes}${name} ($depth)',
+                                 'TaskStart'      : '$indent- ${name} ($depth)',
+                                 'TaskGroupStart' : '$indent- ${name} ($depth)'
+                                 },
+            'NodeAttributes'  : {
+                                 'name'           : '$value'
+                                 },
+            'NodeAttributeDefaults' : {}
+            }
+
+def build_tree ():
+    root = Folder (name=u'root')
+    for f in range (7):
+        folder = Folder (name=u'folder \u2713 ' + str (f), parent=root)
+        for p in range (f % 3):
+            project = Project (name=u'project ' + str (p), parent=folder)
+            for t in range (4):
+                task = Task (name=u'task ' + str (t), parent=project)
+                Task (name=u'sub task', parent=task)
+    Project (name=u'loose project', parent=root)
+    Task (name=u'loose task', parent=root.children[-1])
+    return root
+
+def render (root, formatter_class, jobs):
+    out = MemorySink ()
+    format_document (root, formatter_class (out, FmtTemplate (TEMPLATE)), True, jobs=jobs)
+    return out.getvalue ()
+
+class Test_parallel_render(unittest.TestCase):
+
+    def test_split_chunks (self):
+        root = build_tree ()
+        for max_chunks in range (1, 12):
+            chunks = split_chunks (root.children, max_chunks)
+            self.assertTrue (len (chunks) <= max_chunks)
+            self.assertEquals (0, chunks[0][0])
+            self.assertEquals (len (root.children), chunks[-1][1])
+            for (start, end), (next_start, next_end) in zip (chunks, chunks[1:]):
+                self.assertTrue (start < end)
+                self.assertEquals (end, next_start)
+
+    def test_same_as_serial (self):
+        root = build_tree ()
+        root.children[2].marked = False
+        for formatter_class in [Formatter, PrintMarkdownVisitor]:
+            serial = render (root, formatter_class, 1)
+            self.assertTrue (serial.startswith ('start\n'))
+            for jobs in [2, 3]:
+                self.assertEquals (serial, render (root, formatter_class, jobs))
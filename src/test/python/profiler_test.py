@@ -0,0 +1,122 @@
+'''
+Copyright 2013 Paul Sidnell
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import unittest
+import os
+import json
+import pstats
+import shutil
+import tempfile
+from StringIO import StringIO
+import profiler
+import sys
+from treemodel import Folder, Task
+from profiler import phase, run_profiled, model_loaded, Profile, NO_PHASE
+
+class Test_profiler(unittest.TestCase):
+
+    def setUp (self):
+        self.dir = tempfile.mkdtemp ()
+
+    def tearDown (self):
+        shutil.rmtree (self.dir)
+
+    def test_no_profile (self):
+        self.assertTrue (phase ('load') is NO_PHASE)
+        with phase ('load'):
+            pass
+
+    def test_phases (self):
+        profile = Profile ()
+        with profile.phase ('load'):
+            with profile.phase ('query Task'):
+                pass
+            with profile.phase ('sort'):
+                pass
+        with profile.phase ('render'):
+            pass
+        self.assertEquals ([('load', 0), ('query Task', 1), ('sort', 1), ('render', 0)],
+                           [(p['name'], p['depth']) for p in profile.phases])
+        out = StringIO ()
+        profile.write_table (out)
+        lines = out.getvalue ().splitlines ()
+        self.assertEquals ('phase          wall ms    cpu ms', lines[0])
+        self.assertEquals (['load', '  query Task', '  sort', 'render', 'total'], [line[:12].rstrip () for line in lines[1:]])
+
+    def test_phase_raises (self):
+        profile = Profile ()
+        try:
+            with profile.phase ('filter'):
+                raise ValueError ()
+        except ValueError:
+            pass
+        self.assertEquals (0, profile.depth)
+        self.assertTrue ('wall' in profile.phases[0])
+
+    def test_run_profiled (self):
+        def run ():
+            with phase ('load'):
+                with phase ('wire_task_hierarchy'):
+                    pass
+            return 'done'
+        file_name = os.path.join (self.dir, 'profile.json')
+        self.assertEquals ('done', run_profiled (run, file_name))
+        self.assertEquals (None, profiler.ACTIVE)
+        data = json.load (open (file_name))
+        self.assertEquals ([u'load', u'wire_task_hierarchy'], [p['name'] for p in data['phases']])
+        self.assertEquals (u'total', data['total']['name'])
+        file_name = os.path.join (self.dir, 'profile.txt')
+        run_profiled (run, file_name)
+        self.assertTrue (open (file_name).read ().startswith ('phase'))
+
+    def test_pstats (self):
+        file_name = os.path.join (self.dir, 'profile.pstats')
+        err = StringIO ()
+        original = profiler.sys.stderr
+        profiler.sys.stderr = err
+        try:
+            run_profiled (lambda: sorted (range (100)), file_name)
+        finally:
+            profiler.sys.stderr = original
+        self.assertTrue (err.getvalue ().startswith ('phase'))
+        self.assertTrue (pstats.Stats (file_name).total_calls > 0)
+
+    def test_memory (self):
+        profile = Profile (memory=True)
+        with profile.phase ('load'):
+            data = ['x' * 1000 for i in range (1000)]
+        self.assertTrue (profile.phases[0]['high_water'] > 0)
+        self.assertTrue (profile.phases[0]['peak_rise'] >= 0)
+        if sys.platform.startswith ('linux'):
+            self.assertNotEquals (None, profile.phases[0]['retained'])
+        out = StringIO ()
+        profile.write_table (out)
+        self.assertTrue (out.getvalue ().startswith ('phase   wall ms    cpu ms  retained KB peak rise KB   highest KB\n'))
+        self.assertFalse ('node type' in out.getvalue ())
+
+    def test_model_loaded (self):
+        root = Folder (name=u'')
+        Task (name=u'task', parent=root)
+        model_loaded ([root])
+        file_name = os.path.join (self.dir, 'memory.json')
+        def run ():
+            model_loaded ([root])
+        run_profiled (run, file_name)
+        self.assertFalse ('model' in json.load (open (file_name)))
+        run_profiled (run, file_name, memory=True)
+        data = json.load (open (file_name))
+        self.assertEquals (1, data['model']['types']['Task'][0])
+        self.assertTrue ('retained' in data['total'])
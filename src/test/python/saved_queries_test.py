@@ -0,0 +1,104 @@
+'''
+Copyright 2013 Paul Sidnell
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import unittest
+import os
+import json
+import tempfile
+import shutil
+from datetime import datetime
+from treemodel import Task
+from saved_queries import PlanCache, load_reports, expand_reports, plan_cache_file
+from cmd_parser import compile_filter_plan
+from test_helper import catch_exception
+import cmd_parser
+
+class Test_saved_queries(unittest.TestCase):
+    
+    def setUp (self):
+        self.dir = tempfile.mkdtemp ()
+        self.saved_time = cmd_parser.the_time
+        
+    def tearDown (self):
+        shutil.rmtree (self.dir)
+        cmd_parser.the_time = self.saved_time
+    
+    def test_plan_cache_round_trip (self):
+        file_name = self.dir + '/plans.json'
+        cache = PlanCache (file_name, version='1.0')
+        plan = cache.get_plan ('(type=Task) and (flagged or due=today)')
+        self.assertEquals (1, cache.misses)
+        self.assertEquals (plan, cache.get_plan ('(type=Task) and (flagged or due=today)'))
+        self.assertEquals (1, cache.hits)
+        cache.save ()
+        
+        cache = PlanCache (file_name, version='1.0')
+        self.assertEquals (plan, cache.get_plan ('(type=Task) and (flagged or due=today)'))
+        self.assertEquals (1, cache.hits)
+        self.assertEquals (0, cache.misses)
+        
+        # Another version discards the plans
+        cache = PlanCache (file_name, version='2.0')
+        cache.get_plan ('(type=Task) and (flagged or due=today)')
+        self.assertEquals (1, cache.misses)
+        
+    def test_cached_plan_resolves_dates_at_execution (self):
+        file_name = self.dir + '/plans.json'
+        cache = PlanCache (file_name, version='1.0')
+        cache.get_plan ('due=today')
+        cache.save ()
+        
+        tue = datetime.strptime('Apr 9 2013 11:33PM', '%b %d %Y %I:%M%p')
+        wed = datetime.strptime('Apr 10 2013 11:33PM', '%b %d %Y %I:%M%p')
+        plan = PlanCache (file_name, version='1.0').get_plan ('due=today')
+        
+        cmd_parser.the_time = tue
+        filtr = compile_filter_plan (plan, True)
+        self.assertTrue (filtr.match_fn (Task (date_due=tue)))
+        self.assertFalse (filtr.match_fn (Task (date_due=wed)))
+        
+        cmd_parser.the_time = wed
+        filtr = compile_filter_plan (plan, True)
+        self.assertFalse (filtr.match_fn (Task (date_due=tue)))
+        self.assertTrue (filtr.match_fn (Task (date_due=wed)))
+        
+    def test_command_plans (self):
+        cache = PlanCache (self.dir + '/plans.json', version='1.0')
+        cache.get_plan ('sort Task due')
+        cache.save ()
+        cache = PlanCache (self.dir + '/plans.json', version='1.0')
+        sort = compile_filter_plan (cache.get_plan ('sort Task due'), True)
+        self.assertEquals (['Task'], sort.types)
+        self.assertEquals ('date_due', sort.nice_string)
+        
+    def test_reports (self):
+        file_name = self.dir + '/reports.json'
+        out = open (file_name, 'w')
+        json.dump ({'reports' : {
+                        'flagged' : '-a flagged -a "prune any" -o flagged.taskpaper',
+                        'today' : ['-C', '-t', 'due=today'],
+                        'nested' : '--report today'}}, out)
+        out.close ()
+        reports = load_reports (file_name)
+        self.assertEquals (['-a', 'flagged', '-a', 'prune any', '-o', 'flagged.taskpaper'], reports['flagged'])
+        
+        opts = expand_reports ([('-v', ''), ('--report', 'today'), ('-o', 'x.html')], reports)
+        self.assertEquals ([('-v', ''), ('-C', ''), ('-t', 'due=today'), ('-o', 'x.html')], opts)
+        
+        self.assertEquals ('no such report: weekly', catch_exception (lambda: expand_reports ([('--report', 'weekly')], reports)))
+        self.assertEquals ('reports cannot include other reports: nested', catch_exception (lambda: expand_reports ([('--report', 'nested')], reports)))
+        
+        self.assertEquals (self.dir + '/reports-plans.json', plan_cache_file (file_name))
@@ -0,0 +1,109 @@
+'''
+Copyright 2013 Paul Sidnell
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import unittest
+import os
+import shutil
+import tempfile
+from treemodel import Folder, Project, Task, Context
+from fmt_template import FmtTemplate, Formatter
+from split_output import split_subjects, shard_file_names, render_shard, write_if_changed, write_shards
+
+TEMPLATE = {
+            'indent'          : 0,
+            'depth'           : 1,
+            'indentString'    : '  ',
+            'dateFormat'      : '%Y-%m-%d',
+            'preamble'        : 'start',
+            'Nodes'           : {
+                                 'FolderStart'    : '$indent$name:',
+                                 'ProjectStart'   : '$indent$name:',
+                                 'ContextStart'   : '$indent$name:',
+                                 'TaskStart'      : '$indent- $name ($depth)'
+                                 },
+            'NodeAttributes'  : {
+                                 'name'           : '$value'
+                                 },
+            'NodeAttributeDefaults' : {}
+            }
+
+def build_tree ():
+    root_project = Folder (name=u'')
+    root_context = Context (name=u'')
+    home = Context (name=u'home', parent=root_context)
+    Context (name=u'work', parent=root_context).marked = False
+    for f in range (3):
+        folder = Folder (name=u'f/' + str (f), parent=root_project)
+        for p in range (2):
+            project = Project (name=u'project ' + str (p), parent=folder)
+            for t in range (2):
+                task = Task (name=u'task \u2713 ' + str (t), parent=project, context=home)
+                home.children.append (task)
+    return root_project, root_context
+
+def make_formatter (out):
+    return Formatter (out, FmtTemplate (TEMPLATE))
+
+class Test_split_output(unittest.TestCase):
+
+    def setUp (self):
+        self.dir = tempfile.mkdtemp ()
+
+    def tearDown (self):
+        shutil.rmtree (self.dir)
+
+    def test_split_subjects (self):
+        root_project, root_context = build_tree ()
+        root_project.children[1].children[0].marked = False
+        self.assertEquals ([u'f/0', u'f/1', u'f/2'], [s.name for s in split_subjects (root_project, root_context, 'folder')])
+        self.assertEquals (5, len (split_subjects (root_project, root_context, 'project')))
+        self.assertEquals ([u'home'], [s.name for s in split_subjects (root_project, root_context, 'context')])
+
+    def test_shard_file_names (self):
+        root_project, root_context = build_tree ()
+        subjects = split_subjects (root_project, root_context, 'project')
+        self.assertEquals ([u'out/project 0.md', u'out/project 1.md', u'out/project 0 2.md', u'out/project 1 2.md', u'out/project 0 3.md', u'out/project 1 3.md'],
+                           shard_file_names (u'out/{name}.md', subjects))
+        self.assertEquals ([u'f-0.md', u'f-1.md', u'f-2.md'], shard_file_names (u'{name}.md', split_subjects (root_project, root_context, 'folder')))
+
+    def test_render_shard (self):
+        root_project, root_context = build_tree ()
+        folder = root_project.children[0]
+        text = render_shard (folder, make_formatter)
+        self.assertEquals ('start\nf/0:\n  project 0:\n    - task \xe2\x9c\x93 0 (3)\n    - task \xe2\x9c\x93 1 (3)\n  project 1:\n    - task \xe2\x9c\x93 0 (3)\n    - task \xe2\x9c\x93 1 (3)\n', text)
+        # The subject stays where it was
+        self.assertTrue (folder.parent is root_project)
+
+    def test_write_if_changed (self):
+        file_name = os.path.join (self.dir, 'sub', 'x.txt')
+        self.assertTrue (write_if_changed (file_name, 'abc'))
+        os.utime (file_name, (0, 0))
+        self.assertFalse (write_if_changed (file_name, 'abc'))
+        self.assertEquals (0, os.path.getmtime (file_name))
+        self.assertTrue (write_if_changed (file_name, 'abcd'))
+        self.assertEquals ('abcd', open (file_name).read ())
+
+    def test_write_shards (self):
+        root_project, root_context = build_tree ()
+        subjects = split_subjects (root_project, root_context, 'folder')
+        pattern = os.path.join (self.dir, '{name}.txt')
+        results = write_shards (subjects, pattern, make_formatter, 2)
+        self.assertEquals ([True, True, True], [changed for file_name, changed in results])
+        for subject, (file_name, changed) in zip (subjects, results):
+            self.assertEquals (render_shard (subject, make_formatter), open (file_name, 'rb').read ())
+        root_project.children[2].children[0].name = u'renamed'
+        results = write_shards (subjects, pattern, make_formatter, 2)
+        self.assertEquals ([False, False, True], [changed for file_name, changed in results])
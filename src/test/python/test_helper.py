@@ -20,4 +20,26 @@ def catch_exception (fn):
     except Exception as e:
         return e.message
     assert False, "Exception expected, none raised"
-        
\ No newline at end of file
+
+def node_values (node, found):
+    # Everything in every node, with the nodes it points to by id
+    if not node.id in found:
+        values = {}
+        for key, value in node.__dict__.items ():
+            if key in ('parent', 'context'):
+                value = value.id if value != None else None
+            elif key == 'children':
+                value = [child.id for child in value]
+            elif key == 'note' and value != None:
+                value = value.get_note_lines ()
+            values[key] = (type (value), value)
+        found[node.id] = values
+        for child in node.children:
+            node_values (child, found)
+    return found
+
+def model_values (root_project, root_context):
+    found = {}
+    node_values (root_project, found)
+    node_values (root_context, found)
+    return found
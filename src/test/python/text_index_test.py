@@ -0,0 +1,117 @@
+'''
+Copyright 2013 Paul Sidnell
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import unittest
+import os
+import tempfile
+from datetime import datetime
+from treemodel import Folder, Project, Task, Context, Note
+from cmd_parser import make_plan, compile_plan
+from text_index import TextIndex, tokenise, literal_words, build_index
+from directives import get_directives
+
+class CountingNote (Note):
+    # Like OFNote, the raw data is at hand but decoding it costs
+    def __init__ (self, text):
+        self.noteXMLData = text
+        self.text = text
+        self.reads = 0
+    def get_note (self):
+        self.reads += 1
+        return self.text
+
+def build_tree ():
+    root = Folder (name=u'root')
+    project = Project (name=u'Garden', parent=root)
+    t1 = Task (name=u'feed the worms', parent=project, note=CountingNote (u'use the kitchen scraps'))
+    t2 = Task (name=u'buy bookworms', parent=project, note=CountingNote (u'second hand shop'))
+    t3 = Task (name=u'dig', parent=project, note=CountingNote (u'the kitchen garden'))
+    return root, [t1, t2, t3]
+
+def matches (expr_str, tasks, index):
+    expr = compile_plan (make_plan (expr_str)[1], datetime.now (), index=index)
+    return [task.name for task in tasks if expr (task)]
+
+class Test_text_index(unittest.TestCase):
+    
+    def test_tokenise (self):
+        self.assertEquals (set ([u'feed', u'the', u'worms', u'2']), tokenise (u'feed the worms (2)'))
+        self.assertEquals (set (), tokenise (None))
+    
+    def test_literal_words (self):
+        self.assertEquals ([u'kitchen', u'scraps'], literal_words (u'kitchen scraps'))
+        self.assertEquals ([u'buy'], literal_words (u'^buy'))
+        self.assertEquals (None, literal_words (u'wo.ms'))
+        self.assertEquals (None, literal_words (u'a|b'))
+        self.assertEquals (None, literal_words (u' - '))
+    
+    def test_candidates (self):
+        root, tasks = build_tree ()
+        index = TextIndex ().build ([root])
+        ids = lambda nodes: set ([node.id for node in nodes])
+        self.assertEquals (ids (tasks[0:2]), index.candidates ('name', u'worms'))
+        self.assertEquals (ids (tasks[0:1]), index.candidates ('name', u'the worms'))
+        self.assertEquals (ids ([tasks[0], tasks[2]]), index.candidates ('note', u'kitchen'))
+        self.assertEquals (set (), index.candidates ('note', u'kitchen shop'))
+        self.assertEquals (None, index.candidates ('name', u'wor.s'))
+        self.assertEquals (None, index.candidates ('status', u'active'))
+    
+    def test_matches_regex (self):
+        root, tasks = build_tree ()
+        index = TextIndex ().build ([root])
+        for task in tasks:
+            task.note.reads = 0
+        for expr_str in ['name=worms', 'name=^buy', 'name="the worms"', 'note=kitchen', 'note!=kitchen', '(note=kitchen) and (name=dig)', 'name=wor.s']:
+            self.assertEquals (matches (expr_str, tasks, None), matches (expr_str, tasks, index), expr_str)
+        root, tasks = build_tree ()
+        index = TextIndex ().build ([root])
+        for task in tasks:
+            task.note.reads = 0
+        self.assertEquals ([u'dig'], matches ('note=garden', tasks, index))
+        # Only the candidate's note was read
+        self.assertEquals ([0, 0, 1], [task.note.reads for task in tasks])
+    
+    def test_unindexed_nodes (self):
+        root, tasks = build_tree ()
+        index = TextIndex ().build ([root])
+        extra = Task (name=u'more worms')
+        self.assertEquals ([u'feed the worms', u'buy bookworms', u'more worms'], matches ('name=worms', tasks + [extra], index))
+    
+    def test_store (self):
+        fd, file_name = tempfile.mkstemp (suffix='.sqlite')
+        os.close (fd)
+        try:
+            root, tasks = build_tree ()
+            index = build_index ([root], file_name)
+            for task in tasks:
+                task.note.reads = 0
+            # Unchanged notes aren't read again
+            index = build_index ([root], file_name)
+            self.assertEquals ([0, 0, 0], [task.note.reads for task in tasks])
+            self.assertEquals (set ([tasks[1].id]), index.candidates ('note', u'shop'))
+            tasks[2].note = CountingNote (u'shop\n%of cal allday')
+            index = build_index ([root], file_name)
+            self.assertEquals (set ([tasks[1].id, tasks[2].id]), index.candidates ('note', u'shop'))
+            # The directives come from the file with the words
+            for task in tasks:
+                del task.directives
+            tasks[2].note.reads = 0
+            build_index ([root], file_name)
+            self.assertEquals (0, tasks[2].note.reads)
+            self.assertEquals ({u'cal' : [[u'allday', True]]}, get_directives (tasks[2]))
+            self.assertEquals ({}, get_directives (tasks[0]))
+        finally:
+            os.remove (file_name)
@@ -14,7 +14,8 @@ See the License for the specific language governing permissions and
 limitations under the License.
 '''
 
-from treemodel import Task, Project, Folder, Context, Visitor, traverse, traverse_list, sort
+from treemodel import Task, Project, Folder, Context, Visitor, TreeView, traverse, traverse_list, sort
+from typeof import instance_values
 import unittest
 
 class DemoVisitor(Visitor):
@@ -271,4 +272,46 @@ class Test_treemodel(unittest.TestCase):
         self.assertEqual(n1, parent.children[0])
         self.assertEqual(n2, parent.children[1])
         
-        
\ No newline at end of file
+        
+
+    def test_tree_view (self):
+        root = Folder (name=u'root')
+        p1 = Project (name=u'p1', parent=root)
+        p2 = Project (name=u'p2', parent=root)
+        t1 = Task (name=u't1', parent=p1)
+        
+        view = TreeView ()
+        with view:
+            t1.marked = False
+            p1.children.remove (t1)
+            p2.add_child (t1)
+            root.children.reverse ()
+            t1.attribs['x'] = 1
+            t1.name = u'renamed'
+            t2 = Task (name=u't2', parent=p1)
+            self.assertEqual ([p2, p1], root.children)
+            self.assertEqual ([t2], p1.children)
+            self.assertEqual ([t1], p2.children)
+            self.assertEqual (p2, t1.parent)
+            self.assertFalse (t1.marked)
+            self.assertEqual (u'renamed', instance_values (t1)['name'])
+            self.assertEqual (u't2', t2.__dict__['name'])
+        
+        # The model's as it was
+        self.assertEqual ([p1, p2], root.children)
+        self.assertEqual ([t1], p1.children)
+        self.assertEqual ([], p2.children)
+        self.assertEqual (p1, t1.parent)
+        self.assertTrue (t1.marked)
+        self.assertEqual ({}, t1.attribs)
+        self.assertEqual (u't1', t1.name)
+        
+        # And the view carries on where it left off
+        with view:
+            self.assertEqual ([t1], p2.children)
+            self.assertEqual (1, t1.attribs['x'])
+        
+        # A second view starts from the model
+        with TreeView ():
+            self.assertEqual ([p1, p2], root.children)
+            self.assertTrue (t1.marked)
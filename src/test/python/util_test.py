@@ -15,9 +15,39 @@ limitations under the License.
 '''
 
 import unittest
-from util import strip_tabs_newlines
+from util import strip_tabs_newlines, LRUCache, Memo
 
 class Test_util(unittest.TestCase):
     
     def test_strip_tabs_newlines (self):
-        self.assertEquals ('aa bb cc dd ee', strip_tabs_newlines (' aa\nbb cc\ndd\tee'))
\ No newline at end of file
+        self.assertEquals ('aa bb cc dd ee', strip_tabs_newlines (' aa\nbb cc\ndd\tee'))
+        
+    def test_lru_cache (self):
+        cache = LRUCache (max_size=2)
+        self.assertEquals (None, cache.get ('a'))
+        cache.put ('a', 1)
+        cache.put ('b', 2)
+        self.assertEquals (1, cache.get ('a'))
+        cache.put ('c', 3) # evicts b, a was used more recently
+        self.assertFalse ('b' in cache)
+        self.assertTrue ('a' in cache)
+        self.assertEquals (2, len (cache))
+        self.assertEquals (3, cache.lookup ('c', lambda: 99))
+        self.assertEquals (4, cache.lookup ('d', lambda: 4))
+        self.assertEquals (2, cache.hits)
+        self.assertEquals (2, cache.misses)
+        self.assertEquals ('2 hits, 2 misses (50%)', cache.stats ())
+        
+    def test_memo (self):
+        calls = []
+        def double (x):
+            calls.append (x)
+            return x * 2
+        memo = Memo (double, max_size=2)
+        self.assertEquals (2, memo (1))
+        self.assertEquals (2, memo (1))
+        self.assertEquals (4, memo (2))
+        self.assertEquals (6, memo (3)) # full, starts again
+        self.assertEquals (2, memo (1))
+        self.assertEquals ([1, 2, 3, 1], calls)
+        self.assertEquals ('1 hits, 4 misses (20%)', memo.stats ())
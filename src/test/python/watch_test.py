@@ -0,0 +1,104 @@
+'''
+Copyright 2013 Paul Sidnell
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+from StringIO import StringIO
+from watch import data_fingerprint, PollingWatcher, InotifyWatcher, wait_for_change, watch
+
+class ScriptedWatcher(object):
+    # Answers wait () from a script, running any action that goes with the answer
+    def __init__ (self, script):
+        self.script = list (script)
+        self.closed = False
+    def wait (self, timeout):
+        changed, action = self.script.pop (0)
+        if action != None:
+            action ()
+        return changed
+    def close (self):
+        self.closed = True
+
+class Test_watch(unittest.TestCase):
+
+    def setUp (self):
+        self.dir = tempfile.mkdtemp ()
+        self.file_name = os.path.join (self.dir, 'db.json')
+        self.write ('a')
+
+    def tearDown (self):
+        shutil.rmtree (self.dir)
+
+    def write (self, text, file_name=None):
+        out = open (file_name if file_name != None else self.file_name, 'w')
+        out.write (text)
+        out.close ()
+
+    def test_data_fingerprint (self):
+        missing = os.path.join (self.dir, 'db.json-wal')
+        fingerprint = data_fingerprint ([self.file_name, missing])
+        os.utime (self.file_name, (0, 0))
+        self.assertEquals (fingerprint, data_fingerprint ([self.file_name, missing]))
+        self.write ('b')
+        self.assertNotEquals (fingerprint, data_fingerprint ([self.file_name, missing]))
+
+    def test_polling_watcher (self):
+        watcher = PollingWatcher ([self.file_name], interval=0.01)
+        self.assertFalse (watcher.wait (0.05))
+        self.write ('abc')
+        self.assertTrue (watcher.wait (0.05))
+        self.assertFalse (watcher.wait (0.05))
+
+    def test_inotify_watcher (self):
+        if not sys.platform.startswith ('linux'):
+            return
+        watcher = InotifyWatcher ([self.file_name])
+        try:
+            self.assertFalse (watcher.wait (0.05))
+            self.write ('other', os.path.join (self.dir, 'other.txt'))
+            self.assertFalse (watcher.wait (0.05))
+            self.write ('b')
+            self.assertTrue (watcher.wait (1.0))
+        finally:
+            watcher.close ()
+
+    def test_wait_for_change (self):
+        # Nothing, then a burst of three changes and quiet
+        watcher = ScriptedWatcher ([(False, None), (True, None), (True, None), (True, None), (False, None)])
+        wait_for_change (watcher, debounce=0)
+        self.assertEquals ([], watcher.script)
+
+    def test_watch (self):
+        cycles = []
+        def run_cycle ():
+            cycles.append (open (self.file_name).read ())
+            return [('load', 0.5)]
+        script = [(True, lambda: self.write ('b')), (False, None),
+                  # Touched, but the same
+                  (True, lambda: os.utime (self.file_name, (0, 0))), (False, None),
+                  (True, lambda: self.write ('c')), (False, None)]
+        watcher = ScriptedWatcher (script)
+        report = StringIO ()
+        watch ([self.file_name], run_cycle, watcher=watcher, debounce=0, max_cycles=4, report=report)
+        self.assertEquals (['a', 'b', 'c'], cycles)
+        self.assertTrue (watcher.closed)
+        lines = report.getvalue ().splitlines ()
+        self.assertEquals (4, len (lines))
+        self.assertTrue (lines[0].startswith ('cycle 1: done (load 0.50s) in '))
+        self.assertTrue (lines[2].startswith ('cycle 3: unchanged, skipped'))